@@ -1,16 +1,19 @@
 from pexpect import spawn
 from subprocess import call
-import os, sys
+import os, sys, time, shutil, tempfile
 import glob
 from collections import  OrderedDict
 import numpy
 import warnings
 from itertools import product
+from functools import reduce
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 try:
     import xml.etree.cElementTree as ET
 except ImportError:
     import xml.etree.ElementTree as ET
 from xml.dom import minidom
+from pylagrit import utilities as util
 
 # Universal-safe function for ensuring string integrity
 def _decode_binary(b):
@@ -47,6 +50,8 @@ class PyLaGriT(spawn):
         self.verbose = verbose
         self.mo = {}
         self.batch = batch
+        self._ncmd = 0
+        self._interp_cache = OrderedDict()
         self._check_rc()
 
         if lagrit_exe is not None:
@@ -90,6 +95,12 @@ class PyLaGriT(spawn):
         else:
             super(PyLaGriT, self).expect(expectstr,timeout=timeout)
     def sendline(self, cmd, verbose=True, expectstr='Enter a command'):
+        # Locally evaluated psets are defined before any command can use
+        # them, including session level commands such as copy and merge
+        for m in list(self.mo.values()):
+            if getattr(m,'_local_pset',None): m._push_psets()
+        # Counts commands so cached mesh arrays can detect changes
+        self._ncmd += 1
         if self.batch:
             self.fh.write(cmd+'\n')
         else:
@@ -571,7 +582,9 @@ class PyLaGriT(spawn):
                 print("ERROR: MO object or name of mesh object as a string expected for cmo_in")
                 return
         if resetpts_itp: cmo_in.resetpts_itp()
-        if reorder:
+        if reorder in ('hilbert','morton'):
+            cmo_in.reorder_elements(method=reorder)
+        elif reorder:
             cmo_in.sendline('createpts/median')
             self.sendline('/'.join(['sort',cmo_in.name,'index/ascending/ikey/itetclr zmed ymed xmed']))
             self.sendline('/'.join(['reorder',cmo_in.name,'ikey']))
@@ -646,7 +659,7 @@ class PyLaGriT(spawn):
         for key,value in kwargs.items():
             self.sendline('define / {0} / {1}'.format(key,value))
 
-    def convert(self, pattern, new_ft):
+    def convert(self, pattern, new_ft, processes=None, outdir=None, errors='raise'):
         '''
         Convert File(s)
 
@@ -655,8 +668,16 @@ class PyLaGriT(spawn):
         instantiated. The name of each file will be the same as the original
         file with the extension changed to new_ft.
 
-        Supports conversion from avs, and gmv files.
-        Supports conversion to avs, exo, and gmv files.
+        Files are converted concurrently by a pool of worker processes. Each
+        conversion runs in a scratch directory of its own with a LaGriT
+        session of its own, so conversions do not interfere with each other
+        or with this session. A failed conversion does not stop the others.
+        Once all files are done, failures raise a RuntimeError, or with
+        errors='return' a warning, and are listed in the returned report.
+
+        Supports conversion from avs (.avs and .inp), and gmv files.
+        Supports conversion to any format accepted by dump, e.g. avs, exo,
+        gmv, lagrit, fehm and pflotran (uge).
 
         :param pattern: Path, name or unix style file pattern of files to be
                         converted.
@@ -665,6 +686,17 @@ class PyLaGriT(spawn):
         :param new_ft: New format to convert files.
         :type  new_ft: str
 
+        :param processes: Number of worker processes, defaults to the number of cores.
+        :type  processes: int
+
+        :param outdir: Directory of the new files, defaults to the current directory.
+        :type  outdir: str
+
+        :param errors: 'raise' to raise a RuntimeError when any conversion failed, 'return' to warn and return the report
+        :type  errors: str
+
+        :returns: list of OrderedDict with the input file, output files, wall time in seconds and error message (None on success) of each conversion
+
         Example:
             >>> #To use pylagrit, import the module.
             >>> import pylagrit
@@ -680,49 +712,68 @@ class PyLaGriT(spawn):
             >>> #Convert test.gmv to exoduce and contour files.
             >>> lg.convert('test.gmv', 'exo')
             >>> lg.convert('test.gmv', 'avs')
+            >>>
+            >>> #Convert an archive using every core, keeping going on failures
+            >>> report = lg.convert('archive/*.inp', 'exo', outdir='exo', errors='return')
         '''
-
-        #Make sure I support the new filetype.
-        if new_ft not in ['avs', 'gmv', 'exo']:
-            raise ValueError('Conversion to %s not supported.'%new_ft)
+        if errors not in ('raise','return'):
+            raise ValueError("errors must be 'raise' or 'return'")
 
         #Make sure there are file patterns of this type.
-        fnames = glob.glob(pattern)
+        fnames = sorted(glob.glob(pattern))
         if len(fnames) ==  0:
             raise OSError('No files found matching that name or pattern.')
 
+        #Check that I support the old filetypes.
         for rpath in fnames:
-            #Set everything up for lagrit.
-            path = os.path.abspath(rpath)
-            fname = path[path.rfind('/')+1:path.rfind('.')]
-            old_ft = path[path.rfind('.')+1:]
-
-            #Check that I support the old filetype.
-            if old_ft not in ['avs', 'gmv']:
+            old_ft = os.path.splitext(rpath)[1][1:]
+            if old_ft not in ['avs', 'inp', 'gmv']:
                 raise ValueError('Conversion from %s not supported.'%old_ft)
 
-            try:
-                os.symlink(path, 'old_format')
-            except OSError as err:
-                raise err('Unable to create a symbolic link.')
+        if outdir is None: outdir = os.getcwd()
+        outdir = os.path.abspath(outdir)
+        if not os.path.isdir(outdir): os.makedirs(outdir)
 
-            #Run the commands in lagrit.
-            self.sendline('read/%s/old_format/temp_cmo'%old_ft)
-            self.sendline('dump/%s/%s.%s/temp_cmo'%(new_ft, fname, new_ft))
+        t0 = time.time()
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            jobs = [pool.submit(_convert_file,self.lagrit_exe,os.path.abspath(rpath),new_ft,outdir) for rpath in fnames]
+            results = [j.result() for j in jobs]
 
-            #Clean up created data.
-            self.sendline('cmo/release/temp_cmo')
-            os.unlink('old_format')
-
-    def merge(self, mesh_objs, elem_type="tet",name=None):
+        failed = [r for r in results if r['error']]
+        if self.verbose:
+            for r in results:
+                status = 'FAILED: '+r['error'].splitlines()[0] if r['error'] else ', '.join([os.path.basename(f) for f in r['outputs']])
+                print('%8.2fs %s -> %s'%(r['time'],os.path.basename(r['file']),status))
+            print('Converted %d of %d files in %.2fs'%(len(results)-len(failed),len(results),time.time()-t0))
+        if failed:
+            msg = '%d of %d conversions failed: '%(len(failed),len(results))
+            msg += '; '.join(['%s: %s'%(os.path.basename(r['file']),r['error'].splitlines()[0]) for r in failed[:3]])
+            if len(failed) > 3: msg += '; ...'
+            if errors == 'raise': raise RuntimeError(msg)
+            warnings.warn(msg,category=LaGriT_Warning)
+        return results
+
+    def merge(self, mesh_objs, elem_type=None,name=None,method='tree',dedupe=None):
         '''
         Merge Mesh Objects
 
         Merges two or more mesh objects together and returns the combined mesh
-        object.
+        object. With method 'tree' the meshes are merged pairwise in a
+        balanced tree of addmesh/merge commands, so each node is copied
+        log2(k) times instead of up to k times when merging k meshes. With
+        method 'arrays' the mesh arrays are concatenated in numpy and loaded
+        in one transfer.
 
         :param mesh_objs: An argument list of mesh objects.
         :type  mesh_objs: MO list
+        :param elem_type: Deprecated and ignored, the merged mesh takes the element types of mesh_objs
+        :type  elem_type: str
+        :param name: Name of merged mesh object, generated if None
+        :type  name: str
+        :param method: 'tree' or 'arrays'
+        :type  method: str
+        :param dedupe: Tolerance within which coincident nodes are merged, nodes are kept if None. Both methods find them with utilities.find_duplicates, the arrays method before loading and the tree method with MO.dedupe after the last merge. In batch mode filter and rmpoint/compress are used.
+        :type  dedupe: float
 
         Returns: MO.
 
@@ -741,26 +792,48 @@ class PyLaGriT(spawn):
             >>> for i in range(3):
             >>>     ms.append(ms[-1].copy())
             >>>     ms[-1].trans(ms[-1].mins,ms[-1].mins+numpy.array([0.,0.,1.]))
-            >>> # Merge list of mesh objects and clean up
-            >>> mo_merge = lg.merge(ms)
+            >>> # Merge list of mesh objects, removing the duplicate nodes at the interfaces
+            >>> mo_merge = lg.merge(ms,dedupe=1.e-6)
             >>> for mo in ms: mo.delete()
-            >>> mo_merge.rmpoint_compress(filter_bool=True,resetpts_itp=True)
             >>> mo_merge.paraview(filename='mo_merge.inp')
         '''
+        if len(mesh_objs) < 2:
+            raise ValueError('Must provide at least two objects to merge.')
+        if method not in ('tree','arrays'):
+            raise ValueError("method must be 'tree' or 'arrays'")
+        if elem_type is not None:
+            warnings.warn('merge ignores elem_type, the merged mesh takes the element types of the merged meshes',DeprecationWarning)
         if name is None:
             name = make_name('mo',self.mo.keys())
+        if method == 'arrays' and not self.batch:
+            mesh = util.merge_arrays([mo.arrays() for mo in mesh_objs])
+            if dedupe is not None: mesh = util.dedupe_arrays(mesh,dedupe)[0]
+            return self.from_arrays(mesh,name=name)
         self.mo[name] = MO(name,self)
-        if len(mesh_objs) > 1:
-            #mo_merge = self.create(elem_type=elem_type)
-            for mo in mesh_objs:
-                cmd = '/'.join(['addmesh','merge',name,name,mo.name])
-                self.sendline(cmd)
-                #mo_merge = self.addmesh_merge(mo_merge,mo)
-            #return mo_merge
-            #return reduce(self.addmesh_merge, mesh_objs)
-        else:
-            raise ValueError('Must provide at least two objects to merge.')
-        return self.mo[name]
+        names = [mo.name for mo in mesh_objs]
+        temps = []
+        while len(names) > 1:
+            merged = []
+            for a,b in zip(names[0::2],names[1::2]):
+                out = name if len(names) == 2 else make_name('mo',list(self.mo.keys())+temps)
+                self.sendline('/'.join(['addmesh','merge',out,a,b]))
+                if out != name: temps.append(out)
+                merged.append(out)
+            if len(names) % 2: merged.append(names[-1])
+            # Intermediate meshes of the previous level are no longer needed
+            for n in names:
+                if n in temps:
+                    self.sendline('cmo/release/'+n)
+                    temps.remove(n)
+            names = merged
+        m = self.mo[name]
+        if dedupe is not None:
+            if self.batch:
+                m.sendline('/'.join(['filter','1,0,0',str(dedupe)]))
+                m.rmpoint_compress()
+            else:
+                m.dedupe(dedupe)
+        return m
     def create(self, elem_type='tet', name=None, npoints=0, nelements=0):
         '''
         Create a Mesh Object
@@ -1154,6 +1227,204 @@ class PyLaGriT(spawn):
         elif connect:
             m.connect()
         return m
+    def from_arrays(self,mesh,name=None,filename=None,keep=False):
+        '''
+        Create a mesh object from numpy arrays with a single AVS transfer.
+
+        :arg mesh: mesh arrays
+        :type mesh: MeshArrays
+        :arg name: Name of new mesh object, generated if None
+        :type name: str
+        :arg filename: Name of temporary AVS file, generated if None
+        :type filename: str
+        :arg keep: Keep the AVS file instead of removing it
+        :type keep: bool
+        :returns: MO
+        '''
+        if name is None: name = make_name('mo',self.mo.keys())
+        if filename is None: filename = '_'+name+'_from_arrays.inp'
+        util.write_avs(filename,mesh)
+        m = self.read(filename,name=name)
+        if not keep and not self.batch: os.remove(filename)
+        return m
+    def stack_from_arrays(self,x,y,surfaces,nlayers=None,matids=None,elem_type='quad',
+                          buffer_opt=None,truncate_opt=None,pinchout_opt=None,fill=True,name=None):
+        '''
+        Build a layered hex or prism mesh from surface elevations on a common
+        structured (x,y) grid. The layers are computed with numpy following
+        the rules of stack/layers and stack/fill and the mesh is loaded into
+        LaGriT in one transfer, avoiding a surface file per layer.
+
+        :arg x: x grid locations
+        :type x: array(float)
+        :arg y: y grid locations
+        :type y: array(float)
+        :arg surfaces: elevations of each surface from bottom to top, len(y) x len(x) or flat with x varying fastest
+        :type surfaces: list(array(float))
+        :arg nlayers: number of refinement layers added below each surface after the first
+        :type nlayers: list(int)
+        :arg matids: material id of each surface, units take the id of their lower surface
+        :type matids: list(int)
+        :arg elem_type: 'quad' for hex or 'tri' for prism elements
+        :type elem_type: str
+        :arg buffer_opt: thickness of buffer layers around interior surfaces
+        :type buffer_opt: float
+        :arg truncate_opt: index of the surface truncating the surfaces below it
+        :type truncate_opt: int
+        :arg pinchout_opt: minimum layer thickness, thinner layers are pinched out
+        :type pinchout_opt: float
+        :arg fill: Fill the stack with volume elements as stack/fill does, otherwise return the stacked surfaces
+        :type fill: bool
+        :arg name: Name of new mesh object, generated if None
+        :type name: str
+        :returns: MO
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> import numpy
+            >>> lg = PyLaGriT()
+            >>> x = numpy.linspace(0.,100.,11)
+            >>> y = numpy.linspace(0.,50.,6)
+            >>> X,Y = numpy.meshgrid(x,y)
+            >>> bot = numpy.zeros_like(X)
+            >>> mid = 20.+0.1*X
+            >>> top = 50.+0.05*Y
+            >>> stack = lg.stack_from_arrays(x,y,[bot,mid,top],nlayers=[3,2],matids=[1,2,3],pinchout_opt=0.)
+            >>> stack.dump('stack.inp')
+        '''
+        mesh = util.stack_surfaces(x,y,surfaces,nlayers=nlayers,matids=matids,elem_type=elem_type,
+                                   buffer=buffer_opt,pinch=pinchout_opt,trunc=truncate_opt,fill=fill)
+        m = self.from_arrays(mesh,name=name)
+        nnperlayer = len(x)*len(y)
+        counts = [('nlayers',mesh.nnodes//nnperlayer),('nnperlayer',nnperlayer),
+                  ('neperlayer',util.grid_elements(len(x),len(y),elem_type).shape[0])]
+        for att,val in counts:
+            m.addatt(att,vtype='INT',rank='scalar',length='scalar',interpolate='constant',value=val)
+        return m
+
+    def stack_tiles(self,filenames,NXY,minXY,DXY,tiles=(2,2),nlayers=None,matids=None,
+                    file_type='ascii',flip='none',skip_lines=0,data_type='float',
+                    buffer_opt=None,truncate_opt=None,pinchout_opt=None,flip_opt=False,
+                    fill=True,processes=None,name=None,tmpdir=None):
+        '''
+        Build a stacked mesh from large elevation rasters tile by tile.
+
+        The rasters are cut into tiles sharing their boundary rows and
+        columns. Each tile is meshed with read_sheetij, stack_layers and
+        stack_fill in a LaGriT session of its own, concurrently in a process
+        pool, so the memory of each session is bounded by the tile size.
+        The workers read their window of the rasters themselves, binary
+        rasters memory mapped and ascii rasters streamed, and at most twice
+        as many tiles as workers are submitted at a time. The tiles are
+        glued as they complete: nodes are numbered by their layer and raster row and column,
+        so the nodes on shared tile boundaries are merged exactly, without a
+        distance tolerance that would also merge nodes of pinched out layers.
+        Elements are ordered by layer as stack_fill orders them and the
+        merged mesh is loaded in one transfer.
+
+        :arg filenames: elevation files of the surfaces from bottom to top, in the format of read_sheetij
+        :type filenames: list(str)
+        :arg NXY: [nx, ny] - [columns in x-direction, rows in y-direction]
+        :type NXY: list
+        :arg minXY: [minX, minY] - location of lower left corner
+        :type minXY: list
+        :arg DXY: [Dx, Dy] - cell size in x and y directions
+        :type DXY: list
+        :arg tiles: number of tiles in x and y directions
+        :type tiles: tuple(int)
+        :arg nlayers: number of layers added for each surface after the first, as in stack_layers
+        :type nlayers: list(int)
+        :arg matids: material id of each surface, as in stack_layers
+        :type matids: list(int)
+        :arg file_type: May be either ascii or binary
+        :type file_type: str
+        :arg flip: May be 'x', 'y' to reflect across those axes, or 'none' to keep static
+        :type flip: str
+        :arg skip_lines: skip n number of header lines
+        :type skip_lines: int
+        :arg data_type: read in elevation data as either float or double
+        :type data_type: str
+        :arg buffer_opt: buffer option of stack_layers
+        :type buffer_opt: str
+        :arg truncate_opt: truncate option of stack_layers
+        :type truncate_opt: str
+        :arg pinchout_opt: pinchout option of stack_layers
+        :type pinchout_opt: str
+        :arg flip_opt: flip option of stack_layers
+        :type flip_opt: bool
+        :arg fill: Fill the stack with volume elements with stack_fill, otherwise return the stacked surfaces
+        :type fill: bool
+        :arg processes: number of worker processes, defaults to the number of cores
+        :type processes: int
+        :arg name: Name of new mesh object, generated if None
+        :type name: str
+        :arg tmpdir: directory of the scratch directories of the sessions
+        :type tmpdir: str
+        :returns: MO
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> lg = PyLaGriT()
+            >>> files = ['bottom.dat','middle.dat','top.dat']
+            >>> m = lg.stack_tiles(files,[4001,3001],[0.,0.],[30.,30.],tiles=(8,6),nlayers=[4,2],matids=[1,2,3],flip='y')
+            >>> m.dump_exo('dem.exo')
+        '''
+        nx,ny = [int(v) for v in NXY]
+        filenames = [os.path.abspath(f) for f in filenames]
+        sheet = dict(file_type=file_type,flip=flip,skip_lines=skip_lines,data_type=data_type)
+        opts = dict(nlayers=nlayers,matids=matids,flip_opt=flip_opt)
+        for k,v in [('buffer_opt',buffer_opt),('truncate_opt',truncate_opt),('pinchout_opt',pinchout_opt)]:
+            if v is not None: opts[k] = str(v)
+        nn = nx*ny
+        xyz,node_attrs,elems = None,OrderedDict(),[]
+        scratch = tempfile.mkdtemp(prefix='_stack_tiles_',dir=tmpdir)
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                jobs = {}
+                todo = product(util.tile_ranges(ny,tiles[1]),util.tile_ranges(nx,tiles[0]))
+                inflight = 2*(processes or os.cpu_count() or 1)
+                while True:
+                    for (r0,r1),(c0,c1) in todo:
+                        origin = [minXY[0]+c0*DXY[0],minXY[1]+r0*DXY[1]]
+                        window = ((r0,r1+1),(c0,c1+1))
+                        workdir = os.path.join(scratch,'tile_%d_%d'%(r0,c0))
+                        jobs[pool.submit(_stack_tile,self.lagrit_exe,filenames,NXY,window,sheet,origin,DXY,
+                                         opts,fill,workdir)] = (r0,c0,r1-r0+1,c1-c0+1)
+                        if len(jobs) >= inflight: break
+                    if not jobs: break
+                    job = next(iter(wait(jobs,return_when=FIRST_COMPLETED)[0]))
+                    tile = job.result()
+                    r0,c0,tny,tnx = jobs.pop(job)
+                    # Global node number from the layer and the raster row and column
+                    local = numpy.arange(tile.nnodes)
+                    col = numpy.rint((tile.xyz[:,0]-minXY[0])/DXY[0]).astype(numpy.int64)
+                    row = numpy.rint((tile.xyz[:,1]-minXY[1])/DXY[1]).astype(numpy.int64)
+                    gid = (local//(tnx*tny))*nn+row*nx+col
+                    if xyz is None:
+                        nlay = tile.nnodes//(tnx*tny)
+                        xyz = numpy.zeros((nlay*nn,3))
+                        for k,v in tile.node_attrs.items(): node_attrs[k] = numpy.zeros((nlay*nn,)+v.shape[1:],dtype=v.dtype)
+                    xyz[gid] = tile.xyz
+                    for k,v in tile.node_attrs.items(): node_attrs[k][gid] = v
+                    itet = numpy.where(tile.itet >= 0,gid[numpy.maximum(tile.itet,0)],-1)
+                    elems.append((itet,tile.itettyp,tile.itetclr,tile.elem_attrs))
+                    del tile
+        finally:
+            shutil.rmtree(scratch,ignore_errors=True)
+        width = max([e[0].shape[1] for e in elems])
+        itet = numpy.concatenate([numpy.pad(e[0],((0,0),(0,width-e[0].shape[1])),constant_values=-1) for e in elems])
+        # Order elements by layer and raster position as stack_fill does
+        order = numpy.argsort(numpy.where(itet >= 0,itet,numpy.iinfo(itet.dtype).max).min(axis=1),kind='mergesort')
+        elem_attrs = OrderedDict([(k,numpy.concatenate([e[3][k] for e in elems])[order]) for k in elems[0][3]])
+        mesh = util.MeshArrays(xyz,itet[order],numpy.concatenate([e[1] for e in elems])[order],
+                               numpy.concatenate([e[2] for e in elems])[order],node_attrs,elem_attrs)
+        m = self.from_arrays(mesh,name=name)
+        m.resetpts_itp()
+        if fill:
+            counts = [('nlayers',mesh.nnodes//nn),('nnperlayer',nn),('neperlayer',mesh.nelems//max(mesh.nnodes//nn-1,1))]
+            for att,val in counts:
+                m.addatt(att,vtype='INT',rank='scalar',length='scalar',interpolate='constant',value=val)
+        return m
 
 class MO(object):
     ''' Mesh object class'''
@@ -1165,9 +1436,14 @@ class MO(object):
         self.regions = {}
         self.mregions = {}
         self.surfaces = {}
+        # If True, geometric and attribute psets are evaluated in numpy
+        # and defined in LaGriT in bulk before the next mesh command
+        self.local_psets = False
+        self._local_pset = OrderedDict()
     def __repr__(self):
         return self.name
     def sendline(self,cmd, verbose=True, expectstr='Enter a command'):
+        if self._local_pset: self._push_psets()
         self._parent.sendline('cmo select '+self.name,verbose=verbose)
         self._parent.sendline(cmd,verbose=verbose,expectstr=expectstr)
     @property
@@ -1508,6 +1784,222 @@ class MO(object):
 
         return atts
 
+    def arrays(self,filename=None,keep=False):
+        '''
+        Returns the mesh as numpy arrays.
+
+        The mesh is dumped to an AVS file and read back once. The result
+        is cached until another LaGriT command is sent by the session, so
+        repeated calls are free while the mesh is unchanged. The dump itself
+        leaves the cached arrays of the other mesh objects valid. The cached
+        object is shared between calls and should not be modified.
+
+        :arg filename: Name of temporary AVS file, generated if None
+        :type filename: str
+        :arg keep: Keep the AVS file instead of removing it
+        :type keep: bool
+        :returns: MeshArrays
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> l = PyLaGriT()
+            >>> m = l.create()
+            >>> m.createpts_xyz((3,3,3),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> a = m.arrays()
+            >>> print(a.nnodes, a.nelems, a.xyz.mean(axis=0))
+        '''
+        if self._parent.batch:
+            raise RuntimeError('Mesh arrays are unavailable during batch mode')
+        cache = getattr(self,'_arrays',None)
+        if cache is not None and cache[0] == self._parent._ncmd and filename is None:
+            return cache[1]
+        if filename is None: filename = '_'+self.name+'_arrays.inp'
+        self._sendline_readonly('/'.join(['dump','avs',filename,self.name]))
+        mesh = util.read_avs(filename)
+        if not keep: os.remove(filename)
+        self._arrays = (self._parent._ncmd,mesh)
+        return mesh
+
+    def spatial_index(self):
+        '''
+        Uniform grid spatial index of the node coordinates.
+
+        The index is built from arrays() and cached along with them.
+
+        :returns: utilities.GridIndex
+        '''
+        mesh = self.arrays()
+        cache = getattr(self,'_index',None)
+        if cache is None or cache[0] is not mesh:
+            self._index = (mesh,util.GridIndex(mesh.xyz))
+        return self._index[1]
+
+    def element_index(self):
+        '''
+        Spatial index of the elements for point location.
+
+        The index is built from arrays() and cached along with them.
+
+        :returns: utilities.ElementIndex
+        '''
+        mesh = self.arrays()
+        cache = getattr(self,'_elem_index',None)
+        if cache is None or cache[0] is not mesh:
+            self._elem_index = (mesh,util.ElementIndex(mesh))
+        return self._elem_index[1]
+
+    def nearest_nodes(self,points):
+        '''
+        Nearest node of each point, from the cached spatial index.
+
+        :arg points: query coordinates
+        :type points: array(float), npoints x 3
+        :returns: (array(int) zero-based node indices, array(float) distances)
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> import numpy
+            >>> l = PyLaGriT()
+            >>> m = l.create()
+            >>> m.createpts_xyz((11,11,11),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> ids,dist = m.nearest_nodes(numpy.random.rand(1000,3))
+        '''
+        return self.spatial_index().nearest(points)
+
+    def locate_elements(self,points,tol=1.e-8):
+        '''
+        Element containing each point, from the cached element index.
+
+        Barycentric coordinates are those of the point in the tet (triangle
+        for 2D meshes) of the element decomposition containing it, so a
+        value is interpolated as the weighted sum of the returned nodes.
+
+        :arg points: query coordinates
+        :type points: array(float), npoints x 3
+        :arg tol: tolerance on barycentric coordinates for points on element faces
+        :type tol: float
+        :returns: (array(int) zero-based element indices, -1 for points outside the mesh;
+                   array(int) zero-based nodes, npoints x 4 (3 for 2D meshes);
+                   array(float) barycentric coordinates of the point with respect to those nodes)
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> import numpy
+            >>> l = PyLaGriT()
+            >>> m = l.create()
+            >>> m.createpts_xyz((11,11,11),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> elem,nodes,bary = m.locate_elements(numpy.random.rand(1000,3))
+            >>> zic = (bary*m.arrays().xyz[nodes,2]).sum(axis=1)
+        '''
+        return self.element_index().locate(points,tol=tol)
+
+    def _local_stride(self,stride):
+        # Local evaluation only supports numeric ifirst,ilast,istride
+        if not self.local_psets or self._parent.batch: return None
+        try: return [int(v) for v in stride]
+        except (TypeError,ValueError): return None
+
+    def _pset_local(self,nodes,name):
+        self.pset[name] = PSet(name, self)
+        self.pset[name]._nodes = nodes
+        self._local_pset[name] = self.pset[name]
+        self._local_nnodes = self._arrays[1].nnodes
+        return self.pset[name]
+
+    def _push_psets(self):
+        '''
+        Define pending locally evaluated psets in LaGriT.
+
+        Membership of all pending psets is read in one cmo/readatt of
+        temporary node attributes, from which the psets are selected.
+        '''
+        psets = list(self._local_pset.values())
+        self._local_pset.clear()
+        nnodes = self._local_nnodes
+        attnames = ['_psmark'+str(i+1) for i in range(len(psets))]
+        marks = numpy.zeros((nnodes,len(psets)),dtype=int)
+        for i,ps in enumerate(psets): marks[ps._nodes,i] = 1
+        filename = '_'+self.name+'_psets.txt'
+        numpy.savetxt(filename,marks,fmt='%d')
+        # Temporary attributes and pset definitions leave the mesh arrays unchanged
+        cmds = ['/'.join(['cmo/readatt',self.name,','.join(attnames),'1,0,0',filename])]
+        cmds += ['/'.join(['pset',ps.name,'attribute',att,'1,0,0','1','eq']) for ps,att in zip(psets,attnames)]
+        cmds += ['/'.join(['cmo/DELATT',self.name,att]) for att in attnames]
+        self._sendline_readonly(cmds)
+        os.remove(filename)
+
+    def _sendline_readonly(self,cmds):
+        '''
+        Send commands that do not change the mesh arrays, keeping the
+        arrays() caches of the session's mesh objects valid.
+        '''
+        if isinstance(cmds,str): cmds = [cmds]
+        ncmd = self._parent._ncmd
+        current = [m for m in list(self._parent.mo.values())+[self]
+                   if getattr(m,'_arrays',None) is not None and m._arrays[0] == ncmd]
+        for cmd in cmds: self.sendline(cmd,verbose=False)
+        for m in current: m._arrays = (self._parent._ncmd,m._arrays[1])
+
+    def set_arrays(self,node_attrs=None,elem_attrs=None):
+        '''
+        Set node and element attributes from numpy arrays.
+
+        Node attributes are read with a single cmo/readatt and element
+        attributes are copied from a temporary mesh of one point element per
+        element, so each kind costs one file transfer. Missing attributes are
+        created, as VINT for integer arrays. The arrays() cache is updated
+        instead of being invalidated.
+
+        :arg node_attrs: node attribute values keyed by name
+        :type node_attrs: dict
+        :arg elem_attrs: element attribute values keyed by name
+        :type elem_attrs: dict
+        '''
+        mesh = self.arrays()
+        atts = []
+        for vals,n in ((node_attrs,mesh.nnodes),(elem_attrs,mesh.nelems)):
+            vals = OrderedDict([(k,numpy.asarray(v).ravel()) for k,v in (vals or {}).items()])
+            for k,v in vals.items():
+                if len(v) != n: raise ValueError('Attribute '+k+' has '+str(len(v))+' values, expected '+str(n))
+            atts.append(vals)
+        node_attrs,elem_attrs = atts
+        cmds,files = [],[]
+        if len(node_attrs):
+            for k,v in node_attrs.items():
+                if numpy.issubdtype(v.dtype,numpy.integer) and k not in mesh.node_attrs and k not in ('imt','xic','yic','zic'):
+                    cmds.append('/'.join(['cmo/addatt',self.name,k,'VINT','scalar','nnodes']))
+            filename = '_'+self.name+'_setatt.txt'
+            numpy.savetxt(filename,numpy.column_stack(list(node_attrs.values())),fmt='%.17g')
+            cmds.append('/'.join(['cmo/readatt',self.name,','.join(node_attrs.keys()),'1,0,0',filename]))
+            files.append(filename)
+        if len(elem_attrs):
+            tmp = make_name('mo',self._parent.mo.keys())
+            filename = '_'+self.name+'_setatt.inp'
+            pts = util.MeshArrays(mesh.centroids,numpy.arange(mesh.nelems),'pt',elem_attrs.get('itetclr'),
+                                  elem_attrs=[(k,v) for k,v in elem_attrs.items() if k != 'itetclr'])
+            util.write_avs(filename,pts)
+            cmds.append('/'.join(['read',filename,tmp]))
+            cmds += ['/'.join(['cmo/copyatt',self.name,tmp,k,k]) for k in elem_attrs]
+            cmds.append('/'.join(['cmo/release',tmp]))
+            files.append(filename)
+        self._sendline_readonly(cmds)
+        for f in files: os.remove(f)
+        # Only the attributes that were set have changed
+        xyz,itetclr = mesh.xyz,mesh.itetclr
+        nodes,elems = OrderedDict(mesh.node_attrs),OrderedDict(mesh.elem_attrs)
+        for k,v in node_attrs.items():
+            if k in ('xic','yic','zic'):
+                if xyz is mesh.xyz: xyz = xyz.copy()
+                xyz[:,['xic','yic','zic'].index(k)] = v
+            else:
+                nodes['imt1' if k == 'imt' else k] = v
+        for k,v in elem_attrs.items():
+            if k == 'itetclr': itetclr = v
+            else: elems[k] = v
+        new = util.MeshArrays(xyz,mesh.itet,mesh.itettyp,itetclr,nodes,elems)
+        if xyz is mesh.xyz and hasattr(mesh,'_geometry_hash'): new._geometry_hash = mesh._geometry_hash
+        self._arrays = (self._parent._ncmd,new)
+
     def pset_geom(
             self, mins, maxs,
             ctr=(0,0,0), geom='xyz', stride=(1,0,0), name=None
@@ -1544,11 +2036,32 @@ class MO(object):
         :type  name: str
 
         Returns: PSet object
+
+        If local_psets is True, the nodes are selected in numpy with a
+        spatial index of the node coordinates and the pset is defined in
+        LaGriT before the next command on this mesh, in bulk with other
+        pending psets.
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> l = PyLaGriT()
+            >>> m = l.create()
+            >>> m.createpts_xyz((51,51,51),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> m.local_psets = True
+            >>> ps = [m.pset_geom_xyz((x,0.,0.),(x+0.01,1.,1.)) for x in numpy.linspace(0.,0.99,100)]
+            >>> m.setatt('imt',2,stride=['pset','get',ps[10].name])
         '''
 
         if name is None:
             name = make_name('p',self.pset.keys())
 
+        stride_local = self._local_stride(stride)
+        if stride_local is not None:
+            mesh = self.arrays()
+            mask = util.stride_mask(mesh.nnodes,stride_local,mesh.node_attrs.get('itp1'))
+            nodes = util.select_geom(mesh.xyz,mins,maxs,ctr,geom,index=self.spatial_index())
+            return self._pset_local(nodes[mask[nodes]],name)
+
         mins = [str(v) for v in mins]
         maxs = [str(v) for v in maxs]
         stride = [str(v) for v in stride]
@@ -1669,10 +2182,28 @@ class MO(object):
         :type  name: str
 
         Returns: PSet object
+
+        If local_psets is True and the attribute is a node attribute
+        written by dump/avs, the comparison is evaluated in numpy.
         '''
         if name is None:
             name = make_name('p',self.pset.keys())
 
+        stride_local = self._local_stride(stride)
+        if stride_local is not None:
+            mesh = self.arrays()
+            att = attribute+'1' if attribute in ['imt','itp','icr','isn'] else attribute
+            if att in ['xic','yic','zic']: vals = mesh.xyz[:,['xic','yic','zic'].index(att)]
+            else: vals = mesh.node_attrs.get(att)
+            if vals is not None and comparison in ['eq','ne','lt','le','gt','ge']:
+                if numpy.issubdtype(vals.dtype,numpy.integer): value = int(round(float(value)))
+                else: value = float(value)
+                hit = getattr(numpy,{'eq':'equal','ne':'not_equal','lt':'less','le':'less_equal',
+                                     'gt':'greater','ge':'greater_equal'}[comparison])(vals,value)
+                if hit.ndim > 1: hit = numpy.any(hit,axis=1)
+                hit &= util.stride_mask(mesh.nnodes,stride_local,mesh.node_attrs.get('itp1'))
+                return self._pset_local(numpy.where(hit)[0],name)
+
         stride = [str(v) for v in stride]
 
         cmd = '/'.join(['pset', name, 'attribute', attribute, ','.join(stride),
@@ -1849,6 +2380,21 @@ class MO(object):
         if name is None:
             name = make_name('p',self.pset.keys())
 
+        #Combine pending local psets without a LaGriT round trip.
+        psets = [pset_list] if isinstance(pset_list,PSet) else list(pset_list)
+        if len(psets) and all([p.name in self._local_pset for p in psets]):
+            nodes = [p._nodes for p in psets]
+            if boolean == 'union':
+                nodes = numpy.unique(numpy.concatenate(nodes))
+            elif boolean == 'inter':
+                nodes = reduce(numpy.intersect1d,nodes)
+            elif boolean == 'not':
+                if len(nodes) == 1:
+                    mesh = self.arrays()
+                    nodes = [numpy.where(util.stride_mask(mesh.nnodes,(1,0,0),mesh.node_attrs.get('itp1')))[0]]+nodes
+                nodes = numpy.setdiff1d(nodes[0],numpy.concatenate(nodes[1:]))
+            return self._pset_local(nodes,name)
+
         #Create the new PSET in lagrit and the pylagrit object.
         cmd = ['pset',name,boolean]
         if isinstance(pset_list,PSet): cmd.append(pset_list.name)
@@ -1995,11 +2541,142 @@ class MO(object):
         if filter_bool: self.sendline('filter/1,0,0')
         self.sendline('rmpoint/compress')
         if resetpts_itp: self.resetpts_itp()
-    def reorder_nodes(self, order='ascending',cycle='zic yic xic'):
+    def reorder_nodes(self, order='ascending',cycle='zic yic xic',method='sort'):
+        '''
+        Reorder the nodes of the mesh object.
+
+        Method 'sort' sorts the nodes on the attributes in cycle with LaGriT
+        sort. The other methods compute the new order in numpy from the node
+        coordinates or the edge graph and apply it with LaGriT reorder:
+        'rcm' (reverse Cuthill-McKee), 'hilbert' and 'morton' (space filling
+        curves) and 'nd' (geometric nested dissection). For these methods the
+        bandwidth and profile of the node adjacency matrix, which determine
+        the fill of the FEHM and PFLOTRAN matrices, are reported before and
+        after reordering.
+
+        :arg order: 'ascending' or 'descending' sort order
+        :type order: str
+        :arg cycle: attributes to sort on
+        :type cycle: str
+        :arg method: 'sort', 'rcm', 'hilbert', 'morton' or 'nd'
+        :type method: str
+        :returns: OrderedDict of bandwidth and profile before and after, None for method 'sort'
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> l = PyLaGriT()
+            >>> m = l.create()
+            >>> m.createpts_xyz((21,21,21),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> stats = m.reorder_nodes(method='rcm')
+            >>> m.dump_fehm('rcm')
+        '''
+        if method == 'sort':
+            self.sendline('resetpts itp')
+            self.sendline('/'.join(['sort',self.name,'index',order,'ikey',cycle]))
+            self.sendline('reorder / '+self.name+' / ikey')
+            self.sendline('cmo / DELATT / '+self.name+' / ikey')
+            return
+        mesh = self.arrays()
+        graph = util.node_graph(mesh)
+        perm = util.node_order(mesh,method,graph=graph)
+        if order == 'descending': perm = perm[::-1]
+        stats = OrderedDict()
+        for k,v in util.bandwidth_profile(*graph).items(): stats[k] = [v]
+        for k,v in util.bandwidth_profile(*graph,order=perm).items(): stats[k].append(v)
+        stats = OrderedDict([(k,tuple(v)) for k,v in stats.items()])
+        if self._parent.verbose:
+            for k,v in stats.items(): print('%s: %d -> %d'%(k,v[0],v[1]))
+        self.set_arrays(node_attrs={'ikey':perm+1})
+        self.sendline('reorder / '+self.name+' / ikey')
+        self.sendline('cmo / DELATT / '+self.name+' / ikey')
         self.sendline('resetpts itp')
-        self.sendline('/'.join(['sort',self.name,'index',order,'ikey',cycle]))
+        return stats
+    def reorder_elements(self,method='hilbert',by_material=True):
+        '''
+        Reorder the elements of the mesh object along a space filling curve
+        through the element centroids, grouped by material.
+
+        The keys are computed in numpy with utilities.element_order and the
+        order is applied with LaGriT reorder. Neighbouring elements end up
+        close in memory and in the files written by dump_exo and dump, which
+        helps the cache locality and partitioning of downstream codes.
+
+        :arg method: 'hilbert', 'morton' or 'median' (sort on z, y, x of the centroids)
+        :type method: str
+        :arg by_material: group the elements by itetclr first
+        :type by_material: bool
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> l = PyLaGriT()
+            >>> m = l.create()
+            >>> m.createpts_xyz((21,21,21),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> m.reorder_elements('hilbert')
+            >>> m.dump_exo('hilbert.exo')
+        '''
+        perm = util.element_order(self.arrays(),method=method,by_material=by_material)
+        self.set_arrays(elem_attrs={'ikey':perm+1})
         self.sendline('reorder / '+self.name+' / ikey')
         self.sendline('cmo / DELATT / '+self.name+' / ikey')
+    def partition(self,nparts,method='kway',nghost=1,formats=None,basename=None,processes=None,attname='ielemprt'):
+        '''
+        Partition the elements of the mesh object and optionally write each
+        partition with its ghost elements to separate files.
+
+        Method 'kway' uses LaGriT's METIS interface (metis/partition with
+        metis_partmeshdual), which also adds the node partition inodeprt.
+        Method 'geometric' bisects the element centroids recursively in
+        numpy. Both store the one-based partition of each element in the
+        element attribute attname.
+
+        Partition files are built with utilities.partition_arrays and hold
+        the owned elements, nghost layers of ghost elements (element
+        attribute ighost) and the global numbers of nodes and elements
+        (inode_global, ielem_global). They are named basename_0001.inp,
+        basename_0001.exo, ... and are written concurrently by a process
+        pool, each worker using a LaGriT session of its own for formats other
+        than AVS.
+
+        :arg nparts: number of partitions
+        :type nparts: int
+        :arg method: 'kway' or 'geometric'
+        :type method: str
+        :arg nghost: number of ghost element layers in the partition files
+        :type nghost: int
+        :arg formats: formats of the partition files, e.g. ['avs','exo','uge'], no files are written if None
+        :type formats: list(str)
+        :arg basename: root of the partition file names, defaults to the mesh object name
+        :type basename: str
+        :arg processes: number of worker processes, defaults to the number of cores
+        :type processes: int
+        :arg attname: name of the element partition attribute
+        :type attname: str
+        :returns: array(int) one-based partition of each element
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> l = PyLaGriT()
+            >>> m = l.create()
+            >>> m.createpts_xyz((21,21,21),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> parts = m.partition(8,formats=['avs','exo'])
+        '''
+        if method == 'kway':
+            self.sendline('/'.join(['metis/partition/metis_partmeshdual/dual',str(nparts),'inodeprt',attname]))
+            parts = self.arrays().elem_attrs[attname]
+        elif method == 'geometric':
+            parts = util.partition_geometric(self.arrays().centroids,nparts)+1
+            self.set_arrays(elem_attrs={attname:parts})
+        else:
+            raise ValueError("method must be 'kway' or 'geometric'")
+        if formats is None: return parts
+        if isinstance(formats,str): formats = [formats]
+        if basename is None: basename = self.name
+        mesh = self.arrays()
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            jobs = [pool.submit(_dump_arrays,self._parent.lagrit_exe,util.partition_arrays(mesh,parts,p,nghost),
+                                '%s_%04d'%(basename,p),formats) for p in range(1,nparts+1)]
+            for j in jobs: j.result()
+        return parts
     def trans(self, xold, xnew, stride=(1,0,0)):
         ''' Translate mesh according to old coordinates "xold" to new coordinates "xnew"
 
@@ -2238,6 +2915,94 @@ class MO(object):
         if len(opts) > 0: cmd.append(' '.join(opts))
         self.sendline('/'.join(cmd))
 
+    def nearest_node_map(self, cmosrc, src=None, sink=None):
+        '''
+        Sparse nearest-node map assigning the nodes of the fine mesh object
+        cmosrc to the Voronoi cells of the nodes of the current mesh object,
+        the assignment used by upscale().
+
+        Maps are cached on the session, keyed by the geometry hashes of both
+        meshes, and reused as long as neither geometry changes.
+
+        :param cmosrc: PyLaGriT mesh object source
+        :type cmosrc: PyLaGriT Mesh Object
+        :param src: arrays of cmosrc, fetched with arrays() if None
+        :type src: MeshArrays
+        :param sink: arrays of the current mesh object, fetched with arrays() if None
+        :type sink: MeshArrays
+        :returns: utilities.SparseMap
+        '''
+        if src is None: src = cmosrc.arrays()
+        if sink is None: sink = self.arrays()
+        key = ('upscale','node',util.geometry_hash(src),util.geometry_hash(sink))
+        cache = self._parent._interp_cache
+        if key not in cache:
+            cache[key] = util.nearest_node_map(src.xyz,sink.xyz,index=self.spatial_index())
+            while len(cache) > 16: cache.popitem(last=False)
+        return cache[key]
+
+    def upscale_cached(self, method, attsink, cmosrc, attsrc=None, boundary_choice=None, weights=None, fill=None):
+        '''
+        Upscale node attributes of the fine mesh object cmosrc with a cached
+        nearest-node map.
+
+        The Voronoi assignment of upscale() is computed once by
+        nearest_node_map() and applied to any number of attributes with
+        vectorized sparse reductions, and all results are set with one
+        transfer. Repeated property realisations on the same meshes reuse the
+        map. Like upscale(), each source node enters the sink it is closest
+        to with its own weight; source volumes are not intersected with the
+        sink cells.
+
+        :param method: sum, min, max, ariave, harave or geoave, or a list with one method per attribute
+        :type method: str or list(str)
+        :param attsink: attribute sink or list of attribute sinks
+        :type attsink: str or list(str)
+        :param cmosrc: PyLaGriT mesh object source
+        :type cmosrc: PyLaGriT Mesh Object
+        :param attsrc: attribute src or list of attribute srcs, defaults to attsink
+        :type attsrc: str or list(str)
+        :param boundary_choice: method of choice when source nodes are found on the boundary of multiple Voronoi volumes of sink nodes: single, divide, or multiple
+        :type boundary_choice: str
+        :param weights: source node attribute, such as voronoi_volume, or array weighting the averages
+        :type weights: str or array(float)
+        :param fill: value of sink nodes without any source node, by default such sinks raise a ValueError
+        :type fill: float
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> lg = PyLaGriT()
+            >>> fine = lg.create()
+            >>> fine.createpts_xyz((41,41,41),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> fine.addatt_voronoi_volume()
+            >>> fine.add_node_attribute('perm',value=1.e-12)
+            >>> coarse = lg.create()
+            >>> coarse.createpts_xyz((5,5,5),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> coarse.upscale_cached(['geoave','harave'],['kgeo','khar'],fine,['perm','perm'],weights='voronoi_volume')
+        '''
+        attsinks = [attsink] if isinstance(attsink,str) else list(attsink)
+        if attsrc is None: attsrcs = attsinks
+        else: attsrcs = [attsrc] if isinstance(attsrc,str) else list(attsrc)
+        methods = [method]*len(attsinks) if isinstance(method,str) else list(method)
+        if not len(attsrcs) == len(attsinks) == len(methods):
+            raise ValueError('method, attsink and attsrc must have the same length')
+        src = cmosrc.arrays()
+        sink = self.arrays()
+        smap = self.nearest_node_map(cmosrc,src=src,sink=sink)
+        nempty = int(numpy.sum(~smap.found))
+        if nempty and fill is None:
+            raise ValueError('%d sink nodes of %s have no source node of %s, pass fill to set them'%(nempty,self.name,cmosrc.name))
+        if isinstance(weights,str): weights = src.attribute(weights)[0]
+        vals = OrderedDict()
+        for m,ak,asrc in zip(methods,attsinks,attsrcs):
+            values,loc = src.attribute(asrc)
+            if loc != 'node': raise ValueError('Upscaling requires a node attribute, got '+asrc)
+            out = util.upscale_values(smap,values,m,boundary_choice=boundary_choice,weights=weights,fill=numpy.nan if fill is None else fill)
+            try: isint = numpy.issubdtype(sink.attribute(ak)[0].dtype,numpy.integer)
+            except KeyError: isint = False
+            vals[ak] = numpy.rint(out).astype(int) if isint else out
+        self.set_arrays(node_attrs=vals)
+
     def upscale_ariave(self, attsink, cmosrc, attsrc=None, stride=(1,0,0), boundary_choice=None, keepatt=False,
                 set_id=False):
         '''
@@ -2383,6 +3148,53 @@ class MO(object):
             cmd = '/'.join(['dump',filename,self.name])
         for arg in args: cmd = '/'.join([cmd,str(arg)])
         self.sendline(cmd)
+    def dump_many(self,targets,processes=None,tmpdir=None):
+        '''
+        Dump the mesh object to several formats concurrently.
+
+        The mesh is written once to a binary LaGriT file in tmpdir (/dev/shm
+        when available) and each format is written by a helper LaGriT
+        session of its own reading that snapshot, so the wall time is close
+        to the one of the slowest format. Each helper runs in a scratch
+        directory and its outputs are moved to their destination. In batch
+        mode the formats are dumped one after another.
+
+        :arg targets: file name keyed by format, the root name for fehm and pflotran (uge)
+        :type targets: dict
+        :arg processes: number of helper sessions run at once, defaults to the number of cores
+        :type processes: int
+        :arg tmpdir: directory of the snapshot and scratch directories
+        :type tmpdir: str
+        :returns: OrderedDict of the files written for each format
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> l = PyLaGriT()
+            >>> m = l.create()
+            >>> m.createpts_xyz((21,21,21),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> files = m.dump_many({'exo':'mesh.exo','fehm':'mesh','pflotran':'mesh','avs2':'mesh.inp','gmv':'mesh.gmv'})
+        '''
+        if self._parent.batch:
+            return OrderedDict([(f,[_dump_mo(self,dest,f,ext='')]) for f,dest in targets.items()])
+        if tmpdir is None and os.path.isdir('/dev/shm'): tmpdir = '/dev/shm'
+        scratch = tempfile.mkdtemp(prefix='_'+self.name+'_dump_',dir=tmpdir)
+        try:
+            # LaGriT file names cannot hold '/', the snapshot is written through a link
+            snapshot = os.path.join(scratch,'snapshot.lg')
+            link = '_'+self.name+'_snapshot.lg'
+            os.symlink(snapshot,link)
+            try:
+                self.dump(link,'lagrit','binary')
+            finally:
+                if os.path.islink(link): os.remove(link)
+                elif os.path.exists(link): shutil.move(link,snapshot)
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                jobs = [(f,pool.submit(_session_dump,self._parent.lagrit_exe,snapshot,
+                                       os.path.join(scratch,f),self.name,[(f,os.path.abspath(dest))],binary=True))
+                        for f,dest in targets.items()]
+                return OrderedDict([(f,j.result()) for f,j in jobs])
+        finally:
+            shutil.rmtree(scratch,ignore_errors=True)
     def dump_avs2(self,filename,points=True,elements=True,node_attr=True,element_attr=True):
         '''
         Dump avs file
@@ -2556,44 +3368,115 @@ class MO(object):
     def delete(self):
         self.sendline('cmo/delete/'+self.name)
         del self._parent.mo[self.name]
-    def create_boundary_facesets(self,stacked_layers=False,base_name=None,reorder=False,external=True):
+    def dedupe(self,tol,filename=None):
+        '''
+        Merge nodes closer than tol in numpy and replace the mesh object by
+        the compacted mesh in one transfer.
+
+        Duplicates are found with utilities.find_duplicates, the first node
+        of each group is kept, the connectivity is remapped and elements
+        collapsed by the merge are removed. The mesh is reloaded under the
+        same name; node and element attributes are carried by the AVS file
+        and mesh-level scalar attributes, such as nlayers of stacked meshes,
+        are added back, while psets and eltsets of the mesh object are
+        discarded.
+
+        :arg tol: distance tolerance
+        :type tol: float
+        :arg filename: Name of temporary AVS file, generated if None
+        :type filename: str
+        :returns: array(int), new zero-based index of each original node
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> lg = PyLaGriT()
+            >>> ms = [lg.create() for i in range(2)]
+            >>> ms[0].createpts_xyz((5,5,5),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> ms[1].createpts_xyz((5,5,5),(0.,0.,1.),(1.,1.,2.),rz_switch=[1,1,1],connect=True)
+            >>> m = lg.merge(ms)
+            >>> node_map = m.dedupe(1.e-6)
+        '''
+        mesh = self.arrays()
+        new,node_map = util.dedupe_arrays(mesh,tol)
+        if new.nnodes == mesh.nnodes and new.nelems == mesh.nelems: return node_map
+        if filename is None: filename = '_'+self.name+'_dedupe.inp'
+        scalars = [(k,v) for k,v in self.information().get('attributes',{}).items() if v['length'] == 'scalar']
+        util.write_avs(filename,new)
+        self.sendline('cmo/delete/'+self.name)
+        self._parent.sendline('/'.join(['read',filename,self.name]))
+        os.remove(filename)
+        present = self.information().get('attributes',{})
+        for k,v in scalars:
+            if k in present: continue
+            value = int(v['value']) if v['type'] == 'INT' else v['value']
+            self.addatt(k,vtype=v['type'],rank=v['rank'],length='scalar',interpolate=v['inter'],
+                        persistence=v['persi'],ioflag=v['io'],value=value)
+        self.pset = {}
+        self.eltset = {}
+        self._local_pset.clear()
+        return node_map
+    def create_boundary_facesets(self,stacked_layers=False,base_name=None,reorder=False,external=True,labels=None):
         '''
         Creates facesets for each boundary and writes associated avs faceset file
+
+        The surface mesh is extracted once and pulled into numpy, faces are
+        classified by their normals as done by settets/normal, and all
+        faceset files are written in a single pass.
+
         :arg base_name: base name of faceset files
         :type base_name: str
         :arg stacked_layers: if mesh is created by stack_layers, user layertyp attr to determine top and bottom
         :type stacked_layers: bool
-        :arg reorder_on_meds: reorder nodes on cell medians, usually needed for exodus file
-        :type reorder_on_meds: bool
+        :arg reorder: reorder elements on cell medians, usually needed for exodus file, or along a 'hilbert' or 'morton' curve as in reorder_elements
+        :type reorder: bool or str
+        :arg labels: Faceset names mapped to a side id (1 bottom, 2 top, 3 right, 4 back, 5 left, 6 front) or to a function f(centroids,normals,surf) returning a boolean array selecting faces, where surf is the surface mesh arrays. Defaults to the six box sides.
+        :type labels: OrderedDict
         :returns: Dictionary of facesets
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> from collections import OrderedDict
+            >>> l = PyLaGriT()
+            >>> m = l.create()
+            >>> m.createpts_xyz((11,11,11),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> labels = OrderedDict([('bottom',1),('top',2),
+            >>>                       ('inflow',lambda c,n,s: (n[:,0] < -0.9) & (c[:,2] > 0.5))])
+            >>> fs = m.create_boundary_facesets(base_name='faceset_bounds',labels=labels)
+            >>> m.dump_exo('cube.exo',facesets=fs.values())
         '''
         if base_name is None: base_name = 'faceset_'+self.name
+        if labels is None:
+            labels = OrderedDict([('bottom',1),('top',2),('right',3),('back',4),('left',5),('front',6)])
         mo_surf = self.extract_surfmesh(reorder=reorder,external=external)
-        mo_surf.addatt('id_side',vtype='vint',rank='scalar',length='nelements')
-        mo_surf.settets_normal()
-        mo_surf.copyatt('itetclr','id_side')
-        mo_surf.delatt('id_side')
-        fs = OrderedDict()
-        if stacked_layers:
-            pbot = mo_surf.pset_attribute('layertyp',-1)
-            ebot = pbot.eltset( membership='exclusive' )
-        else:
-            ebot = mo_surf.eltset_attribute('itetclr',1)
-        fs['bottom'] = ebot.create_faceset(base_name+'_bottom.avs')
+        surf = mo_surf.arrays()
+        mo_surf.delete()
+        normals = util.surface_normals(surf)
+        sides = util.normal_sides(normals)
         if stacked_layers:
-            ptop = mo_surf.pset_attribute('layertyp',-2)
-            etop = ptop.eltset( membership='exclusive' )
-        else:
-            etop = mo_surf.eltset_attribute('itetclr',2)
-        fs['top'] =  etop.create_faceset(base_name+'_top.avs')
-        er = mo_surf.eltset_attribute('itetclr',3)
-        fs['right'] = er.create_faceset(base_name+'_right.avs')
-        eback = mo_surf.eltset_attribute('itetclr',4)
-        fs['back'] = eback.create_faceset(base_name+'_back.avs')
-        el = mo_surf.eltset_attribute('itetclr',5)
-        fs['left'] = el.create_faceset(base_name+'_left.avs')
-        ef = mo_surf.eltset_attribute('itetclr',6)
-        fs['front'] = ef.create_faceset(base_name+'_front.avs')
+            # Faces with all nodes on the bottom or top stacked surface
+            lt = surf.node_attrs['layertyp'][surf.itet]
+            valid = surf.itet >= 0
+            sides = numpy.where(sides == 1,0,sides)
+            sides = numpy.where(sides == 2,0,sides)
+            sides[numpy.all((lt == -1) | ~valid,axis=1)] = 1
+            sides[numpy.all((lt == -2) | ~valid,axis=1)] = 2
+        idelem = surf.elem_attrs['idelem1']
+        idface = surf.elem_attrs['idface1']
+        centroids = None
+        fs = OrderedDict()
+        for label,select in labels.items():
+            if callable(select):
+                if centroids is None:
+                    centroids = surf.centroids
+                    # Degenerate faces keep a zero normal
+                    norm = numpy.linalg.norm(normals,axis=1)
+                    unit = normals/numpy.where(norm > 0.,norm,1.)[:,None]
+                mask = numpy.asarray(select(centroids,unit,surf),dtype=bool)
+            else:
+                mask = sides == int(select)
+            filename = base_name+'_'+label+'.avs'
+            util.write_faceset(filename,idelem[mask],idface[mask])
+            fs[label] = FaceSet(filename,self)
         return fs
     def createpts(self, crd, npts, mins, maxs, vc_switch=(1,1,1), rz_switch=(1,1,1), rz_value=(1,1,1), connect=False):
         '''
@@ -2784,13 +3667,21 @@ class MO(object):
 
     def createpts_median(self):
         self.sendline('createpts/median')
-    def subset(self, mins, maxs, geom='xyz'):
+    def subset(self, mins, maxs, geom='xyz', ctr=(0,0,0), method='copy', name=None):
         '''
         Return Mesh Object Subset
 
         Creates a new mesh object that contains only a geometric subset defined
         by mins and maxs.
 
+        Method 'copy' (default) copies the whole mesh object and removes the
+        complement with rmpoint. With method 'arrays' the nodes inside the
+        geometry are selected in numpy, the kept nodes and elements are
+        gathered with utilities.subset_arrays and only the subset is loaded
+        into LaGriT. This avoids copying large meshes, but coordinates and
+        attributes pass through an AVS file (%20.12E) and mesh-level scalar
+        attributes are not kept. Batch mode always uses 'copy'.
+
         :arg  mins: Coordinate of one of the shape's defining points.
                      xyz (Cartesian):   (x1, y1, z1);
                      rtz (Cylindrical): (radius1, theta1, z1);
@@ -2807,6 +3698,15 @@ class MO(object):
                      'rtz' (cylindrical), 'rtp' (spherical)
         :type  geom: str
 
+        :kwarg ctr: Center of the geometric shape
+        :type  ctr: tuple(float, float, float)
+
+        :kwarg method: 'arrays' or 'copy'
+        :type  method: str
+
+        :kwarg name: Name of new mesh object, generated if None
+        :type  name: str
+
         Returns: MO object
 
         Example:
@@ -2826,13 +3726,46 @@ class MO(object):
         '''
 
         lg = self._parent
-        new_mo = lg.copy(self)
-        sub_pts = new_mo.pset_geom(mins, maxs, geom=geom)
+        if method == 'arrays' and not lg.batch:
+            mesh = self.arrays()
+            mask = util.stride_mask(mesh.nnodes, (1,0,0), mesh.node_attrs.get('itp1'))
+            nodes = util.select_geom(mesh.xyz, mins, maxs, ctr=ctr, geom=geom,
+                                     index=self.spatial_index())
+            return self.subset_nodes(nodes[mask[nodes]], name=name)
+        elif method not in ('arrays','copy'):
+            raise ValueError("method must be 'arrays' or 'copy'")
+        new_mo = lg.copy(self, name=name)
+        sub_pts = new_mo.pset_geom(mins, maxs, ctr=ctr, geom=geom)
         rm_pts = new_mo.pset_not(sub_pts)
 
         new_mo.rmpoint_pset(rm_pts)
         return new_mo
 
+    def subset_nodes(self, nodes, exclusive=True, name=None):
+        '''
+        Return Mesh Object Subset of Nodes
+
+        Creates a new mesh object from the selected nodes and the elements
+        they support, as rmpoint of the complement would leave them, without
+        copying the whole mesh object. Only the subset is transferred, as an
+        AVS file (%20.12E), so mesh-level scalar attributes are not kept.
+
+        :arg  nodes: Zero-based node indices or boolean mask of nodes to keep
+        :type nodes: array(int) or array(bool)
+
+        :kwarg exclusive: rmpoint exclusive (True) keeps elements with any
+                          selected node, inclusive (False) only elements whose
+                          nodes are all selected
+        :type  exclusive: bool
+
+        :kwarg name: Name of new mesh object, generated if None
+        :type  name: str
+
+        Returns: MO object
+        '''
+        sub = util.subset_arrays(self.arrays(), nodes, exclusive=exclusive)[0]
+        return self._parent.from_arrays(sub, name=name)
+
     def subset_xyz(self, mins, maxs):
         '''
         Return Tetrehedral MO Subset
@@ -3177,6 +4110,91 @@ class MO(object):
                 cmd += [option2]
         cmd = '/'.join(cmd)
         self.sendline(cmd)
+    def connect_decomposed(self, nblocks=(2,2,2), overlap=None, processes=None, sample=10000, name=None, tmpdir=None):
+        '''
+        Connect the nodes into a Delaunay tetrahedral grid by domain
+        decomposition.
+
+        The bounding box of the points is divided into a grid of blocks.
+        The points of each block and of an overlap around it are connected
+        in a LaGriT session of its own, concurrently in a process pool, and
+        only the tetrahedra whose circumcenter falls inside the block are
+        kept. The tetrahedra of all blocks are merged into a new mesh object
+        with the nodes of this one. Duplicate points are left unconnected.
+
+        The result is Delaunay wherever the overlap holds the circumspheres
+        of the kept tetrahedra. A verification pass checks the empty
+        circumsphere criterion for every tetrahedron whose circumsphere
+        leaves its block's points and for a random sample of the others,
+        counts faces shared by more than two tetrahedra and counts boundary
+        faces inside the convex hull, which mark holes. A warning is issued
+        if the check fails, in which case the overlap should be increased.
+        Flat tetrahedra on the convex hull have circumspheres reaching far
+        along the hull and are the most likely to need a larger overlap.
+        Points on a regular lattice have many co-spherical configurations and
+        should be perturbed slightly first, so blocks agree on the
+        triangulation.
+
+        :arg nblocks: number of blocks along x, y and z
+        :type nblocks: tuple(int)
+        :arg overlap: width of the overlap around each block, defaults to four times the mean point spacing
+        :type overlap: float
+        :arg processes: number of worker processes, defaults to the number of cores
+        :type processes: int
+        :arg sample: number of sampled tetrahedra checked in the verification pass
+        :type sample: int
+        :arg name: name of the new mesh object, generated if None
+        :type name: str
+        :arg tmpdir: directory of the scratch directories of the sessions
+        :type tmpdir: str
+        :returns: (MO, OrderedDict) the connected mesh object and the verification report of utilities.delaunay_check
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> import numpy
+            >>> l = PyLaGriT()
+            >>> m = l.read('points.inp')
+            >>> mt,report = m.connect_decomposed((4,4,2))
+            >>> print(report['violations'], report['overlapping_faces'], report['hole_faces'])
+        '''
+        mesh = self.arrays()
+        xyz = mesh.xyz
+        lo,hi = xyz.min(axis=0),xyz.max(axis=0)
+        ext = numpy.where(hi > lo,hi-lo,1.)
+        nb = numpy.array(nblocks,dtype=int)
+        size = ext/nb
+        if overlap is None:
+            overlap = 4.*(numpy.prod(ext)/max(len(xyz),1))**(1./3.)
+        rep = util.find_duplicates(xyz,1.e-12*ext.max())
+        index = util.GridIndex(xyz)
+        scratch = tempfile.mkdtemp(prefix='_'+self.name+'_connect_',dir=tmpdir)
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                jobs = []
+                for b,(i,j,k) in enumerate(product(*[range(n) for n in nb])):
+                    blo = lo+numpy.array([i,j,k])*size
+                    bhi = blo+size
+                    # Blocks on the outside of the grid extend to infinity
+                    elo = numpy.where(numpy.array([i,j,k]) == 0,-numpy.inf,blo-overlap)
+                    ehi = numpy.where(numpy.array([i,j,k]) == nb-1,numpy.inf,bhi+overlap)
+                    ids = index.box(numpy.maximum(elo,lo),numpy.minimum(ehi,hi))
+                    ids = ids[rep[ids] == ids]
+                    if ids.size < 4: continue
+                    jobs.append(pool.submit(_connect_block,self._parent.lagrit_exe,xyz[ids],ids,b,
+                                            (lo,size,nb,elo,ehi),os.path.join(scratch,'block%d'%b)))
+                res = [j.result() for j in jobs]
+        finally:
+            shutil.rmtree(scratch,ignore_errors=True)
+        tets = numpy.concatenate([r[0] for r in res]) if len(res) else numpy.zeros((0,4),dtype=int)
+        uncertain = numpy.concatenate([r[1] for r in res]) if len(res) else numpy.zeros(0,dtype=bool)
+        report = util.delaunay_check(xyz,tets,check=uncertain,sample=sample,index=index)
+        report['uncertain'] = int(uncertain.sum())
+        if report['violations'] or report['overlapping_faces'] or report['hole_faces']:
+            warnings.warn('Decomposed connect is not Delaunay for %d of %d checked tetrahedra, '\
+                          'has %d overlapping faces and %d hole faces, increase the overlap'%(report['violations'],
+                          report['checked'],report['overlapping_faces'],report['hole_faces']),category=LaGriT_Warning)
+        out = util.MeshArrays(xyz,tets,'tet',numpy.ones(tets.shape[0],dtype=int),node_attrs=mesh.node_attrs)
+        return self._parent.from_arrays(out,name=name),report
     def connect_delaunay(self, option2=None, stride=None, big_tet_coords=[]):
         '''
         Connect the nodes into a Delaunay tetrahedral or triangle grid without adding nodes.
@@ -3331,6 +4349,106 @@ class MO(object):
     def interpolate_default(self,attsink,cmosrc,attsrc,stride=[1,0,0],tie_option='tiemax',
                     flag_option='plus1',keep_option='delatt',interp_function=None):
         self.interpolate('default',**minus_self(locals()))
+    def interpolation_map(self,method,cmosrc,location='node',src=None,sink=None):
+        '''
+        Sparse map of interpolation weights from mesh object cmosrc to the
+        nodes or element centroids of the current mesh object.
+
+        Maps are cached on the session, keyed by the method and the geometry
+        hashes of both meshes, so they are computed once for any number of
+        attributes and time steps as long as neither geometry changes.
+
+        :arg method: 'voronoi', 'map' or 'continuous'
+        :type method: str
+        :arg cmosrc: source mesh object
+        :type cmosrc: MO
+        :arg location: 'node' or 'elem' sink locations
+        :type location: str
+        :arg src: arrays of cmosrc, fetched with arrays() if None
+        :type src: MeshArrays
+        :arg sink: arrays of the current mesh object, fetched with arrays() if None
+        :type sink: MeshArrays
+        :returns: utilities.SparseMap
+        '''
+        if src is None: src = cmosrc.arrays()
+        if sink is None: sink = self.arrays()
+        key = (method,location,util.geometry_hash(src),util.geometry_hash(sink))
+        cache = self._parent._interp_cache
+        if key in cache: return cache[key]
+        points = sink.xyz if location == 'node' else sink.centroids
+        if method == 'voronoi':
+            smap = util.interpolation_map(src,points,method,node_index=cmosrc.spatial_index())
+        else:
+            smap = util.interpolation_map(src,points,method,elem_index=cmosrc.element_index())
+        cache[key] = smap
+        while len(cache) > 16: cache.popitem(last=False)
+        return smap
+    def interpolate_cached(self,method,attsink,cmosrc,attsrc=None,tie_option='tiemax',flag_option='plus1'):
+        '''
+        Interpolate attributes from mesh object cmosrc with cached weights.
+
+        The source-to-sink map of interpolation_map() is applied to each
+        attribute with a sparse matrix-vector product and all results are
+        set with one transfer, replacing repeated interpolate/voronoi, map
+        and continuous calls between the same meshes. Hex, prism and pyramid
+        source elements are interpolated linearly on their tet decomposition.
+
+        :arg method: 'voronoi' (nearest source node), 'map' (source element containing the sink) or 'continuous' (linear in the source element)
+        :type method: str
+        :arg attsink: sink attribute name or list of names
+        :type attsink: str or list(str)
+        :arg cmosrc: source mesh object
+        :type cmosrc: MO
+        :arg attsrc: source attribute name or list of names, same as attsink if None
+        :type attsrc: str or list(str)
+        :arg tie_option: 'tiemax' or 'tiemin', value kept by map for sinks on faces shared by source elements
+        :type tie_option: str
+        :arg flag_option: value of sinks outside the source mesh, 'plus1' (maximum source value plus one), 'nearest' or a number
+        :type flag_option: str or float
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> lg = PyLaGriT()
+            >>> src = lg.create()
+            >>> src.createpts_xyz((11,11,11),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> src.add_node_attribute('perm')
+            >>> src.add_node_attribute('poro')
+            >>> sink = lg.create()
+            >>> sink.createpts_xyz((7,7,7),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> sink.interpolate_cached('continuous',['perm','poro'],src)
+        '''
+        attsinks = [attsink] if isinstance(attsink,str) else list(attsink)
+        if attsrc is None: attsrcs = attsinks
+        else: attsrcs = [attsrc] if isinstance(attsrc,str) else list(attsrc)
+        if len(attsrcs) != len(attsinks): raise ValueError('attsink and attsrc must have the same length')
+        if method not in ('voronoi','map','continuous'): raise ValueError("method must be 'voronoi', 'map' or 'continuous'")
+        src = cmosrc.arrays()
+        sink = self.arrays()
+        node_vals,elem_vals = OrderedDict(),OrderedDict()
+        for ak,asrc in zip(attsinks,attsrcs):
+            values,src_loc = src.attribute(asrc)
+            if (method == 'map') != (src_loc == 'elem'):
+                raise ValueError('Interpolation method '+method+' does not support '+src_loc+' attribute '+asrc)
+            try: sink_loc = sink.attribute(ak)[1]
+            except KeyError: sink_loc = 'node'
+            smap = self.interpolation_map(method,cmosrc,sink_loc,src=src,sink=sink)
+            reduce = 'sum' if method != 'map' else ('min' if tie_option == 'tiemin' else 'max')
+            out = smap.apply(values,reduce=reduce)
+            missing = ~smap.found
+            if numpy.any(missing):
+                if flag_option == 'plus1':
+                    out[missing] = numpy.max(values)+1
+                elif flag_option == 'nearest':
+                    points = sink.xyz if sink_loc == 'node' else sink.centroids
+                    index = cmosrc.spatial_index() if src_loc == 'node' else util.GridIndex(src.centroids)
+                    out[missing] = values[index.nearest(points[missing])[0]]
+                else:
+                    out[missing] = float(flag_option)
+            if method != 'continuous' and numpy.issubdtype(numpy.asarray(values).dtype,numpy.integer):
+                out = numpy.rint(out).astype(int)
+            if sink_loc == 'node': node_vals[ak] = out
+            else: elem_vals[ak] = out
+        self.set_arrays(node_vals,elem_vals)
     def copy(self,name=None):
         '''
         Copy mesh object
@@ -3771,6 +4889,29 @@ class MO(object):
         self.quality(boolean,str(value),quality_type='angle',save_att=save_att)
     def quality_pcc(self):
         self.quality(quality_type='pcc')
+    def quality_arrays(self,bins=10):
+        '''
+        Element quality computed in numpy from the mesh arrays
+
+        Unlike the quality methods, no LaGriT report is printed or parsed;
+        the coordinates and connectivity are pulled once with arrays() and
+        all metrics are computed in batches per element type. See
+        utilities.element_quality for the definitions of the metrics.
+
+        :arg bins: Number of histogram bins, or bin edges
+        :type bins: int or array(float)
+        :returns: OrderedDict of per-element arrays 'volume', 'aspect_ratio', 'edge_min', 'edge_max', 'dihedral_min', 'dihedral_max', 'skewness' and their 'histograms'
+
+        Example:
+            >>> from pylagrit import PyLaGriT
+            >>> l = PyLaGriT()
+            >>> m = l.create()
+            >>> m.createpts_xyz((5,5,5),(0.,0.,0.),(1.,1.,1.),rz_switch=[1,1,1],connect=True)
+            >>> q = m.quality_arrays()
+            >>> print(q['aspect_ratio'].min(), q['volume'].sum())
+            >>> counts, edges = q['histograms']['dihedral_min']
+        '''
+        return util.element_quality(self.arrays(),bins=bins)
     def rmmat(self,material_number,option='',exclusive=False):
         '''
         This routine is used to remove points that are of a specified material value
@@ -3827,9 +4968,16 @@ class PSet(object):
     def __init__(self, name, parent):
         self.name = name
         self._parent = parent
+        # Zero-based node indices of psets evaluated locally
+        self._nodes = None
     def __repr__(self):
         return str(self.name)
     def delete(self):
+        if self.name in self._parent._local_pset:
+            # Never defined in LaGriT
+            del self._parent._local_pset[self.name]
+            del self._parent.pset[self.name]
+            return
         cmd = 'pset/'+self.name+'/delete'
         self._parent.sendline(cmd)
         del self._parent.pset[self.name]
@@ -4060,8 +5208,46 @@ class EltSet(object):
         cmd = 'eltset/'+self.name+'/delete'
         self._parent.sendline(cmd)
         del self._parent.eltset[self.name]
+    def elements(self):
+        '''
+        Returns the zero-based indices of the elements in the eltset.
+
+        The set is written with eltset/write, so the cost is proportional
+        to the size of the set rather than the size of the mesh.
+
+        :returns: array(int)
+        '''
+        root = '_'+self.name+'_elements'
+        self._parent._sendline_readonly('/'.join(['eltset',self.name,'write',root,'ascii']))
+        filename = root+'.cellset'
+        with open(filename,'r') as fh:
+            lines = fh.read().splitlines()[2:]
+        os.remove(filename)
+        return numpy.array(' '.join(lines).split(),dtype=int)-1
     def create_faceset(self,filename=None):
+        '''
+        Write the faces of the eltset to a faceset file for dump/exo
+
+        The eltset must belong to a surface mesh with idelem1 and idface1
+        element attributes, as created by extract_surfmesh. These are read
+        from the mesh arrays, which are pulled once and cached, and only
+        the faces of the set are written. In batch mode the faceset is
+        written by LaGriT from a copy of the mesh.
+
+        :arg filename: Name of faceset file
+        :type filename: str
+        :returns: FaceSet
+        '''
         if filename is None: filename = 'faceset_'+self.name+'.avs'
+        if self._parent._parent.batch: return self._create_faceset_copy(filename)
+        mesh = self._parent.arrays()
+        if 'idelem1' not in mesh.elem_attrs or 'idface1' not in mesh.elem_attrs:
+            raise ValueError("Mesh "+self._parent.name+" has no idelem1 and idface1 attributes, create the eltset on a mesh from extract_surfmesh")
+        elems = self.elements()
+        util.write_faceset(filename,mesh.elem_attrs['idelem1'][elems],mesh.elem_attrs['idface1'][elems])
+        self.faceset = FaceSet(filename,self)
+        return self.faceset
+    def _create_faceset_copy(self,filename):
         motmpnm = make_name( 'mo_tmp',self._parent._parent.mo.keys() )
         self._parent._parent.sendline('/'.join(['cmo/copy',motmpnm,self._parent.name]))
         self._parent._parent.sendline('/'.join(['cmo/DELATT',motmpnm,'itetclr0']))
@@ -4181,6 +5367,234 @@ class FaceSet(object):
     def __repr__(self):
         return str(self.filename)
 
+def _mesh_arrays(m,lg=None):
+    if isinstance(m,util.MeshArrays): return m
+    if isinstance(m,MO): return m.arrays()
+    ext = os.path.splitext(m)[1].lower()
+    if ext in ['.avs','.inp']: return util.read_avs(m)
+    if lg is None:
+        raise ValueError("A PyLaGriT session 'lg' is required to read "+m)
+    mo = lg.read(m)
+    if isinstance(mo,list):
+        raise ValueError(m+' contains more than one mesh object')
+    mesh = mo.arrays()
+    mo.delete()
+    return mesh
+
+_dump_ext = {'avs':'.inp','avs2':'.inp','exo':'.exo','gmv':'.gmv','lagrit':'.lg','tecplot':'.plt','pflotran':'','fehm':''}
+
+def _dump_mo(m,root,format,ext=None):
+    '''
+    Dump m to root with the extension of format, returns the file name.
+    UGE files are written with dump/pflotran under root.uge.
+    '''
+    if format in ('uge','pflotran'):
+        m.dump_pflotran(root)
+        return root+'.uge'
+    if ext is None: ext = _dump_ext.get(format,'.'+format)
+    filename = root+ext
+    if format == 'exo': m.dump_exo(filename)
+    else: m.dump(filename,format)
+    return filename
+
+# Suffixes of the files LaGriT writes for a root name, by dump format
+_dump_suffixes = {'fehm':['.fehmn','_material.zone','_outside.zone','_outside_vor.area','_outside_med.area',
+                          '_interface.zone','_multi_mat.zone','.stor'],
+                  'stor':['.stor'],'uge':['.uge'],'pflotran':['.uge']}
+
+def _dump_files(root,format,ext=None):
+    '''
+    Names of the files _dump_mo(m,root,format,ext) may write. Only these
+    are outputs, other files of the same prefix in the directory, such as
+    the outx3dgen and logx3dgen logs, are not.
+    '''
+    if format in ('uge','pflotran'): return [root+'.uge']
+    if ext is None: ext = _dump_ext.get(format,'.'+format)
+    if format in _dump_suffixes and ext == '':
+        # MO.dump strips the extension of fehm and stor roots
+        root = root.split('.')[0]
+        return [root+sfx for sfx in _dump_suffixes[format]]
+    return [root+ext]
+
+def _session_dump(lagrit_exe,infile,workdir,name,jobs,binary=False):
+    '''
+    Read infile with a LaGriT session running in workdir and dump it for
+    each (format, destination) of jobs, so that it can run in a worker
+    process without sharing log files. The destination is a file name, or
+    the root name for fehm and pflotran. Outputs are moved next to their
+    destination and their names are returned. binary is passed on to read
+    for binary LaGriT snapshots.
+    '''
+    if not os.path.isdir(workdir): os.makedirs(workdir)
+    link = 'input'+os.path.splitext(infile)[1]
+    os.symlink(os.path.abspath(infile),os.path.join(workdir,link))
+    lg = PyLaGriT(lagrit_exe=lagrit_exe,verbose=False,cwd=workdir)
+    try:
+        m = lg.read(link,name=name,binary=binary)
+        for format,dest in jobs: _dump_mo(m,os.path.basename(dest),format,ext='')
+    finally:
+        lg.close()
+    files = []
+    for format,dest in jobs:
+        for f in _dump_files(os.path.basename(dest),format,ext=''):
+            if os.path.exists(os.path.join(workdir,f)):
+                files.append(os.path.join(os.path.dirname(os.path.abspath(dest)),f))
+                shutil.move(os.path.join(workdir,f),files[-1])
+    return files
+
+def _dump_arrays(lagrit_exe,mesh,root,formats):
+    '''
+    Write mesh arrays in each format, AVS directly and other formats from a
+    LaGriT session of its own, so that it can run in a worker process.
+    '''
+    files = []
+    if 'avs' in formats:
+        files.append(root+'.inp')
+        util.write_avs(files[-1],mesh)
+    jobs = [(f,root if f in ('uge','pflotran','fehm') else root+_dump_ext.get(f,'.'+f)) for f in formats if f != 'avs']
+    if len(jobs):
+        scratch = tempfile.mkdtemp(prefix='_'+os.path.basename(root)+'_')
+        try:
+            avs = os.path.join(scratch,'part.inp')
+            util.write_avs(avs,mesh)
+            files += _session_dump(lagrit_exe,avs,os.path.join(scratch,'session'),'part',jobs)
+        finally:
+            shutil.rmtree(scratch,ignore_errors=True)
+    return files
+
+def _connect_block(lagrit_exe,xyz,ids,block,grid,workdir):
+    '''
+    Connect the points of one block with overlap in a LaGriT session of its
+    own and keep the tetrahedra whose circumcenter lies in the block, or
+    whose centroid does if the circumcenter is outside the grid. The
+    circumcenters are computed from the vertices in global order, so all
+    blocks assign a shared tetrahedron to the same owner. Returns the
+    tetrahedra in global node numbers and a mask of those whose
+    circumsphere is not contained in the block points.
+    '''
+    lo,size,nblocks,elo,ehi = grid
+    os.makedirs(workdir)
+    util.write_avs(os.path.join(workdir,'pts.inp'),util.MeshArrays(xyz))
+    lg = PyLaGriT(lagrit_exe=lagrit_exe,verbose=False,cwd=workdir)
+    try:
+        pts = lg.read('pts.inp',name='pts')
+        blk = pts.copypts('tet',name='blk')
+        blk.setatt('imt',1)
+        blk.setatt('itp',0)
+        blk.connect()
+        blk.dump('blk.inp','avs')
+    finally:
+        lg.close()
+    mesh = util.read_avs(os.path.join(workdir,'blk.inp'))
+    if mesh.nnodes != ids.size:
+        raise RuntimeError('connect changed the number of nodes of block '+str(block))
+    tets = ids[mesh.itet[mesh.itettyp == 'tet',:4]]
+    X = xyz[numpy.searchsorted(ids,numpy.sort(tets,axis=1))]
+    c,r = util.circumspheres(X)
+    # Hull tetrahedra with a circumcenter outside the grid go with their centroid
+    p = numpy.where(numpy.all((c >= lo) & (c <= lo+size*nblocks),axis=1)[:,None],c,X.mean(axis=1))
+    own = util.block_owner(p,lo,size,nblocks) == block
+    tets,c,r = tets[own],c[own],r[own]
+    # Beyond the outer faces of the grid there are no points to miss
+    uncertain = numpy.zeros(tets.shape[0],dtype=bool)
+    for i in range(3):
+        with numpy.errstate(invalid='ignore'):
+            uncertain |= ~(c[:,i]-r >= elo[i]) | ~(c[:,i]+r <= ehi[i])
+    return tets,uncertain
+
+def _stack_tile(lagrit_exe,filenames,NXY,window,sheet,minXY,DXY,opts,fill,workdir):
+    '''
+    Build the stacked mesh of one tile with read/sheetij, stack/layers and
+    stack/fill in a LaGriT session of its own, so that it can run in a
+    worker process. The window of each raster is read with
+    utilities.read_sheet and the options in sheet. Returns the mesh arrays
+    of the tile.
+    '''
+    os.makedirs(workdir)
+    surfaces = [util.read_sheet(f,NXY,window=window,**sheet) for f in filenames]
+    ny,nx = surfaces[0].shape
+    files = []
+    lg = PyLaGriT(lagrit_exe=lagrit_exe,verbose=False,cwd=workdir)
+    try:
+        for k,z in enumerate(surfaces):
+            numpy.savetxt(os.path.join(workdir,'surf%d.dat'%k),numpy.asarray(z).ravel(),fmt='%.12g')
+            sheet = lg.read_sheetij('s%d'%k,'surf%d.dat'%k,[nx,ny],minXY,DXY)
+            files.append('surf%d.inp'%k)
+            sheet.dump(files[-1])
+            sheet.delete()
+        stack = lg.create()
+        stack.stack_layers(files,**opts)
+        out = stack.stack_fill(name='tile') if fill else stack
+        out.dump('tile.inp','avs')
+    finally:
+        lg.close()
+    return util.read_avs(os.path.join(workdir,'tile.inp'))
+
+def _convert_file(lagrit_exe,path,new_ft,outdir):
+    '''
+    Convert one file in a scratch directory of its own with a LaGriT
+    session of its own, so that conversions can run in worker processes.
+    Returns an OrderedDict with the outputs, wall time and error, if any.
+    '''
+    t0 = time.time()
+    fname,old_ft = os.path.splitext(os.path.basename(path))
+    old_ft = 'avs' if old_ft == '.inp' else old_ft[1:]
+    res = OrderedDict([('file',path),('outputs',[]),('time',0.),('error',None)])
+    scratch = tempfile.mkdtemp(prefix='_convert_'+fname+'_',dir=outdir)
+    try:
+        os.symlink(path,os.path.join(scratch,'old_format'))
+        lg = PyLaGriT(lagrit_exe=lagrit_exe,verbose=False,cwd=scratch)
+        try:
+            lg.sendline('read/%s/old_format/temp_cmo'%old_ft)
+            m = MO('temp_cmo',lg)
+            lg.mo[m.name] = m
+            ext = '' if new_ft in ('fehm','stor') else '.'+new_ft
+            _dump_mo(m,fname,new_ft,ext=ext)
+        finally:
+            lg.close()
+        for f in _dump_files(fname,new_ft,ext=ext):
+            if os.path.exists(os.path.join(scratch,f)):
+                os.rename(os.path.join(scratch,f),os.path.join(outdir,f))
+                res['outputs'].append(os.path.join(outdir,f))
+    except Exception as err:
+        res['error'] = str(err)
+    finally:
+        shutil.rmtree(scratch,ignore_errors=True)
+    res['time'] = time.time()-t0
+    return res
+
+def compare(a,b,rtol=1.e-5,atol=1.e-8,lg=None):
+    '''
+    Numerically compare two meshes.
+
+    Node coordinates, connectivity and attributes are compared within the
+    given tolerances, independent of node and element ordering. Meshes can
+    be MO objects, MeshArrays objects or file names. AVS files are read
+    directly, other formats (e.g. LaGriT .lg files) are read with the
+    session lg.
+
+    :arg a: first mesh
+    :type a: MO, MeshArrays or str
+    :arg b: second mesh
+    :type b: MO, MeshArrays or str
+    :arg rtol: Relative tolerance
+    :type rtol: float
+    :arg atol: Absolute tolerance
+    :type atol: float
+    :arg lg: Session used to read non-AVS files
+    :type lg: PyLaGriT
+    :returns: OrderedDict with keys 'equal', 'nnodes', 'nelems', 'coordinates', 'connectivity', 'node_attributes', 'elem_attributes', 'only_in_a', 'only_in_b'
+
+    Example:
+        >>> import pylagrit
+        >>> l = pylagrit.PyLaGriT()
+        >>> m = l.read('mesh.avs')
+        >>> m.dump('mesh.lg')
+        >>> report = pylagrit.compare('mesh.avs','mesh.lg',lg=l)
+        >>> print(report['equal'], report['coordinates']['max_abs'])
+    '''
+    return util.compare_meshes(_mesh_arrays(a,lg),_mesh_arrays(b,lg),rtol=rtol,atol=atol)
+
 def make_name( base, names ):
     i = 1
     name = base+str(i)
@@ -1,5 +1,7 @@
 import os
+import hashlib
 import numpy as np
+from collections import OrderedDict
 from datetime import datetime
 
 
@@ -213,3 +215,2244 @@ def spherical_volumes(node_locations):
     volumes = np.diff(spheres)
     assert np.all(volumes > 0), "ERROR: Negative volumes are not good."
     return volumes
+
+
+# Number of nodes of each AVS UCD element type
+avs_nen = OrderedDict([('pt',1),('line',2),('tri',3),('quad',4),('tet',4),('pyr',5),('prism',6),('hex',8)])
+
+class MeshArrays(object):
+    '''
+    Numpy representation of a mesh object.
+
+    Node and element indices are zero-based. Rows of the connectivity array
+    of hybrid meshes are padded with -1.
+
+    :arg xyz: node coordinates
+    :type xyz: array(float), nnodes x 3
+    :arg itet: element connectivity
+    :type itet: array(int), nelems x max nodes per element
+    :arg itettyp: AVS element type name of each element
+    :type itettyp: array(str)
+    :arg itetclr: element material
+    :type itetclr: array(int)
+    :arg node_attrs: node attributes keyed by name
+    :type node_attrs: OrderedDict
+    :arg elem_attrs: element attributes keyed by name
+    :type elem_attrs: OrderedDict
+    '''
+    def __init__(self,xyz,itet=None,itettyp=None,itetclr=None,node_attrs=None,elem_attrs=None):
+        self.xyz = np.asarray(xyz,dtype=float).reshape(-1,3)
+        if itet is None:
+            itet = np.zeros((0,1),dtype=int)
+        self.itet = np.asarray(itet,dtype=int)
+        if self.itet.ndim == 1:
+            self.itet = self.itet.reshape(-1,1)
+        if itettyp is None:
+            nen = self.itet.shape[1]
+            etype = [k for k,v in avs_nen.items() if v == nen][-1]
+            itettyp = np.full(self.itet.shape[0],etype)
+        elif isinstance(itettyp,str):
+            itettyp = np.full(self.itet.shape[0],itettyp)
+        self.itettyp = np.asarray(itettyp)
+        if itetclr is None:
+            itetclr = np.ones(self.itet.shape[0],dtype=int)
+        self.itetclr = np.asarray(itetclr,dtype=int)
+        self.node_attrs = OrderedDict() if node_attrs is None else OrderedDict(node_attrs)
+        self.elem_attrs = OrderedDict() if elem_attrs is None else OrderedDict(elem_attrs)
+    def __repr__(self):
+        return 'MeshArrays(nnodes=%d, nelems=%d)'%(self.nnodes,self.nelems)
+    @property
+    def nnodes(self):
+        '''
+        Number of nodes
+        '''
+        return self.xyz.shape[0]
+    @property
+    def nelems(self):
+        '''
+        Number of elements
+        '''
+        return self.itet.shape[0]
+    @property
+    def elem_types(self):
+        '''
+        Element types present in the mesh
+        '''
+        return list(np.unique(self.itettyp))
+    @property
+    def imt(self):
+        '''
+        Node materials, ones if the mesh has no imt1 attribute
+        '''
+        return self.node_attrs.get('imt1',np.ones(self.nnodes,dtype=int))
+    def attribute(self,name):
+        '''
+        Values of a node or element attribute, including the coordinates
+        xic, yic, zic and the element materials itetclr.
+        :arg name: attribute name
+        :type name: str
+        Returns: (array, 'node' or 'elem')
+        '''
+        if name in ('xic','yic','zic'):
+            return self.xyz[:,['xic','yic','zic'].index(name)],'node'
+        if name in ('imt','imt1'):
+            return self.imt,'node'
+        if name == 'itetclr':
+            return self.itetclr,'elem'
+        if name in self.node_attrs:
+            return self.node_attrs[name],'node'
+        if name in self.elem_attrs:
+            return self.elem_attrs[name],'elem'
+        raise KeyError('No attribute '+name)
+    @property
+    def centroids(self):
+        '''
+        Element centroids, the mean of the valid nodes of each element
+        '''
+        valid = self.itet >= 0
+        X = np.where(valid[:,:,None],self.xyz[np.maximum(self.itet,0)],0.)
+        return X.sum(axis=1)/np.maximum(valid.sum(axis=1),1)[:,None]
+
+def _avs_attribute_block(lines,pos,nrows):
+    '''
+    Parse an AVS UCD attribute block starting at line pos.
+    Returns the attributes and the line index following the block.
+    '''
+    hdr = lines[pos].split()
+    sizes = [int(v) for v in hdr[1:1+int(hdr[0])]]
+    pos += 1
+    names,types = [],[]
+    for i in range(len(sizes)):
+        nm,tp = (lines[pos+i].split(',')+[''])[:2]
+        names.append(nm.strip())
+        types.append(tp.strip().lower())
+    pos += len(sizes)
+    if nrows is None:
+        nrows = len([l for l in lines[pos:] if l.strip()])
+    data = np.array(' '.join(lines[pos:pos+nrows]).split(),dtype=float)
+    data = data.reshape(nrows,-1) if nrows else data.reshape(0,sum(sizes))
+    # Files written with avs2 flag 2 have no id column
+    if data.shape[1] == sum(sizes)+1:
+        data = data[:,1:]
+    atts = OrderedDict()
+    ic = 0
+    for nm,tp,sz in zip(names,types,sizes):
+        v = data[:,ic:ic+sz]
+        if sz == 1:
+            v = v[:,0]
+        atts[nm] = v.astype(int) if tp.startswith('int') else v.copy()
+        ic += sz
+    return atts,pos+nrows
+
+def read_avs(filename):
+    '''
+    Read an AVS UCD file written by LaGriT into a MeshArrays object.
+    Files written with dump/avs2 options that omit points or elements
+    are supported as long as at most one attribute block is present
+    without its geometry.
+    :arg filename: name of AVS file
+    :type filename: str
+    Returns: MeshArrays
+    '''
+    with open(filename,'r') as fh:
+        lines = [l for l in fh.read().splitlines() if l.strip() and not l.lstrip().startswith('#')]
+    nn,ne,nnd,ned = [int(v) for v in lines[0].split()[:4]]
+    pos = 1
+    if nn:
+        xyz = np.array(' '.join(lines[pos:pos+nn]).split(),dtype=float).reshape(nn,-1)[:,-3:]
+    else:
+        xyz = np.zeros((0,3))
+    pos += nn
+    itet = np.zeros((0,1),dtype=int)
+    itettyp = np.zeros(0,dtype='<U5')
+    itetclr = np.zeros(0,dtype=int)
+    if ne:
+        block = lines[pos:pos+ne]
+        first = block[0].split()
+        tokens = ' '.join(block).split()
+        nen = avs_nen[first[2]]
+        if len(tokens) == ne*(3+nen) and np.all(np.array(tokens[2::3+nen]) == first[2]):
+            arr = np.array(tokens).reshape(ne,3+nen)
+            itetclr = arr[:,1].astype(int)
+            itettyp = arr[:,2].astype('<U5')
+            itet = arr[:,3:].astype(int)-1
+        else:
+            maxnen = max([avs_nen[l.split()[2]] for l in block])
+            itet = np.full((ne,maxnen),-1,dtype=int)
+            itettyp = np.empty(ne,dtype='<U5')
+            itetclr = np.empty(ne,dtype=int)
+            for i,l in enumerate(block):
+                v = l.split()
+                itetclr[i] = int(v[1])
+                itettyp[i] = v[2]
+                itet[i,:len(v)-3] = [int(n)-1 for n in v[3:]]
+    pos += ne
+    node_attrs = OrderedDict()
+    elem_attrs = OrderedDict()
+    if nnd:
+        if not nn and ned:
+            raise ValueError('Cannot determine number of node attribute rows in '+filename)
+        node_attrs,pos = _avs_attribute_block(lines,pos,nn if nn else None)
+    if ned:
+        elem_attrs,pos = _avs_attribute_block(lines,pos,ne if ne else None)
+    return MeshArrays(xyz,itet,itettyp,itetclr,node_attrs,elem_attrs)
+
+def _write_avs_attributes(fh,atts):
+    '''
+    Write an AVS attribute block, the sizes line, a name and type line
+    per attribute and a row of values per node or element
+    '''
+    sizes = [1 if v.ndim == 1 else v.shape[1] for v in atts.values()]
+    fh.write('%05d'%len(sizes)+''.join(['  %d'%s for s in sizes])+'\n')
+    cols,fmt = [],['%010d']
+    for nm,v in atts.items():
+        isint = np.issubdtype(np.asarray(v).dtype,np.integer)
+        fh.write('%s, %s\n'%(nm,'integer' if isint else 'real'))
+        v = np.asarray(v).reshape(len(v),-1)
+        cols.append(v)
+        fmt += ['%10d' if isint else '%20.12E']*v.shape[1]
+    n = cols[0].shape[0]
+    data = np.column_stack([np.arange(1,n+1)]+[c.astype(float) for c in cols])
+    np.savetxt(fh,data,fmt=' '.join(fmt))
+
+def write_avs(filename,mesh):
+    '''
+    Write a MeshArrays object to an AVS UCD file readable by LaGriT.
+    :arg filename: name of AVS file
+    :type filename: str
+    :arg mesh: mesh arrays
+    :type mesh: MeshArrays
+    '''
+    node_attrs = OrderedDict([(k,v) for k,v in mesh.node_attrs.items() if len(v) == mesh.nnodes])
+    elem_attrs = OrderedDict([(k,v) for k,v in mesh.elem_attrs.items() if len(v) == mesh.nelems])
+    with open(filename,'w') as fh:
+        fh.write('%10d %10d %10d %10d %10d\n'%(mesh.nnodes,mesh.nelems,len(node_attrs),len(elem_attrs),0))
+        data = np.column_stack([np.arange(1,mesh.nnodes+1),mesh.xyz])
+        np.savetxt(fh,data,fmt='%010d %20.12E %20.12E %20.12E')
+        types = mesh.itettyp
+        if mesh.nelems and np.all(types == types[0]):
+            nen = avs_nen[types[0]]
+            data = np.column_stack([np.arange(1,mesh.nelems+1),mesh.itetclr,mesh.itet[:,:nen]+1])
+            np.savetxt(fh,data,fmt='%010d %5d '+types[0]+' %d'+' %d'*(nen-1))
+        else:
+            for i in range(mesh.nelems):
+                nen = avs_nen[types[i]]
+                fh.write('%010d %5d %s '%(i+1,mesh.itetclr[i],types[i]))
+                fh.write(' '.join(['%d'%(n+1) for n in mesh.itet[i,:nen]])+'\n')
+        if len(node_attrs):
+            _write_avs_attributes(fh,node_attrs)
+        if len(elem_attrs):
+            _write_avs_attributes(fh,elem_attrs)
+
+def _canonical_elements(mesh,node_map=None):
+    '''
+    Connectivity with nodes sorted within each element so that elements can
+    be compared independent of node and element ordering. The element type
+    code is appended as the last column.
+    '''
+    itet = mesh.itet if node_map is None else np.where(mesh.itet >= 0,node_map[np.maximum(mesh.itet,0)],-1)
+    names = np.array(list(avs_nen.keys()))
+    srt = np.argsort(names)
+    codes = srt[np.searchsorted(names,mesh.itettyp,sorter=srt)].reshape(-1,1)
+    return np.hstack([np.sort(itet,axis=1),codes])
+
+def _sort_rows(rows):
+    '''
+    Order rows of an integer array by a 64-bit row hash, breaking hash
+    collisions with a full lexicographic sort.
+    '''
+    if rows.shape[0] == 0:
+        return np.zeros(0,dtype=int)
+    h = np.zeros(rows.shape[0],dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for j in range(rows.shape[1]):
+            h = h*np.uint64(1000003) ^ (rows[:,j].astype(np.int64).view(np.uint64)+np.uint64(0x9e3779b97f4a7c15))
+    order = np.argsort(h,kind='stable')
+    hs = h[order]
+    if np.any(hs[1:] == hs[:-1]):
+        # Equal hashes may be collisions; order them deterministically
+        order = np.lexsort(rows.T[::-1])
+    return order
+
+def _match_nodes(xa,xb,tol):
+    '''
+    Node permutation p such that xb[p] matches xa, or None if the node
+    coordinates cannot be matched within tol.
+
+    The nodes of xb are hashed into cells of size tol as in find_duplicates
+    and each node of xa is matched to the closest node of xb in its own and
+    the 26 neighbour cells, so nodes on either side of a cell boundary are
+    still found.
+    '''
+    if xa.shape != xb.shape:
+        return None
+    n = xa.shape[0]
+    if n == 0 or np.all(np.abs(xa-xb) <= tol):
+        return np.arange(n)
+    q = tol if tol > 0 else 1.
+    origin = np.minimum(xa.min(axis=0),xb.min(axis=0))
+    ca = np.floor((xa-origin)/q).astype(np.int64)
+    cb = np.floor((xb-origin)/q).astype(np.int64)
+    keys = _hash_cells(cb)
+    order = np.argsort(keys,kind='stable')
+    skeys = keys[order]
+    rng = np.arange(-1,2)
+    offsets = np.array(np.meshgrid(rng,rng,rng,indexing='ij')).reshape(3,-1).T
+    best = np.full(n,-1,dtype=int)
+    bestd = np.full(n,np.inf)
+    for o in offsets:
+        nkeys = _hash_cells(ca+o)
+        starts = np.searchsorted(skeys,nkeys,side='left')
+        ends = np.searchsorted(skeys,nkeys,side='right')
+        i = np.repeat(np.arange(n),ends-starts)
+        j = order[_concat_ranges(starts,ends)]
+        d = np.max(np.abs(xa[i]-xb[j]),axis=1)
+        close = d <= tol
+        i,j,d = i[close],j[close],d[close]
+        # Closest candidate per node of xa, ties keep the earlier one
+        srt = np.lexsort((d,i))
+        i,j,d = i[srt],j[srt],d[srt]
+        first = np.ones(len(i),dtype=bool)
+        first[1:] = i[1:] != i[:-1]
+        i,j,d = i[first],j[first],d[first]
+        better = d < bestd[i]
+        best[i[better]] = j[better]
+        bestd[i[better]] = d[better]
+    if np.any(best < 0):
+        return None
+    # Every node of xb must be used exactly once
+    if np.any(np.bincount(best,minlength=n) != 1):
+        return None
+    return best
+
+def _diff_stats(va,vb,rtol,atol):
+    '''
+    Equality, largest absolute and relative differences and number of
+    values outside the tolerances of two attribute arrays
+    '''
+    va = np.asarray(va,dtype=float)
+    vb = np.asarray(vb,dtype=float)
+    if va.shape != vb.shape:
+        return OrderedDict([('equal',False),('max_abs',np.inf),('max_rel',np.inf),('nmismatch',max(len(va),len(vb)))])
+    d = np.abs(va-vb)
+    scale = np.maximum(np.abs(va),np.abs(vb))
+    with np.errstate(divide='ignore',invalid='ignore'):
+        rel = np.where(scale > 0,d/scale,0.)
+    bad = d > atol+rtol*np.abs(vb)
+    if bad.ndim > 1:
+        bad = np.any(bad,axis=1)
+    return OrderedDict([('equal',not np.any(bad)),
+                        ('max_abs',float(d.max()) if d.size else 0.),
+                        ('max_rel',float(rel.max()) if rel.size else 0.),
+                        ('nmismatch',int(np.sum(bad)))])
+
+def compare_meshes(a,b,rtol=1.e-5,atol=1.e-8):
+    '''
+    Numerically compare two meshes independent of node and element ordering.
+
+    Nodes are matched through a hash grid of cell size tol and elements by
+    sorting hashes of their sorted node lists, so meshes that only differ
+    by a permutation of nodes or elements compare equal. Attributes are
+    compared after applying the same permutations. When nodes or elements
+    cannot be matched, the coordinates or connectivity and the attributes
+    depending on them are reported with matched False and no statistics.
+
+    :arg a: first mesh
+    :type a: MeshArrays
+    :arg b: second mesh
+    :type b: MeshArrays
+    :arg rtol: relative tolerance
+    :type rtol: float
+    :arg atol: absolute tolerance
+    :type atol: float
+    Returns: OrderedDict report
+    '''
+    report = OrderedDict()
+    report['nnodes'] = (a.nnodes,b.nnodes)
+    report['nelems'] = (a.nelems,b.nelems)
+    extent = np.ptp(np.vstack([a.xyz,b.xyz]),axis=0).max() if a.nnodes+b.nnodes else 0.
+    tol = atol+rtol*extent
+    perm = _match_nodes(a.xyz,b.xyz,tol)
+    if perm is None:
+        crd = OrderedDict([('equal',False),('matched',False)])
+    else:
+        crd = _diff_stats(a.xyz,b.xyz[perm],rtol,atol)
+        crd['matched'] = True
+        crd['permuted'] = bool(np.any(perm != np.arange(len(perm))))
+    report['coordinates'] = crd
+
+    # Element matching in terms of the node numbering of a
+    eperm = None
+    conn = OrderedDict([('matched',False),('nmismatch',max(a.nelems,b.nelems))])
+    if perm is not None and a.itet.shape[0] == b.itet.shape[0]:
+        inv = np.empty_like(perm)
+        inv[perm] = np.arange(len(perm))
+        ca = _canonical_elements(a)
+        cb = _canonical_elements(b,inv)
+        if ca.shape[1] != cb.shape[1]:
+            w = max(ca.shape[1],cb.shape[1])
+            pad = lambda c: np.hstack([np.full((c.shape[0],w-c.shape[1]),-1,dtype=int),c])
+            ca,cb = pad(ca),pad(cb)
+        if np.array_equal(ca,cb):
+            eperm = np.arange(a.nelems)
+        else:
+            oa = _sort_rows(ca)
+            ob = _sort_rows(cb)
+            nbad = int(np.sum(np.any(ca[oa] != cb[ob],axis=1)))
+            if nbad == 0:
+                eperm = np.empty_like(ob)
+                eperm[oa] = ob
+            conn['nmismatch'] = nbad
+        if eperm is not None:
+            conn['nmismatch'] = 0
+        conn['matched'] = eperm is not None
+        conn['permuted'] = bool(eperm is not None and np.any(eperm != np.arange(len(eperm))))
+    report['connectivity'] = conn
+
+    def _atts(da,db,p):
+        '''
+        Compare the attributes of da and db with the rows of db taken in
+        the order p, values of unmatched nodes or elements cannot be paired up
+        '''
+        res = OrderedDict()
+        for nm in da:
+            if nm not in db:
+                continue
+            if p is None:
+                res[nm] = OrderedDict([('equal',False),('matched',False)])
+            else:
+                res[nm] = _diff_stats(da[nm],np.asarray(db[nm])[p],rtol,atol)
+        return res
+    ea = OrderedDict([('itetclr',a.itetclr)]+list(a.elem_attrs.items()))
+    eb = OrderedDict([('itetclr',b.itetclr)]+list(b.elem_attrs.items()))
+    report['node_attributes'] = _atts(a.node_attrs,b.node_attrs,perm)
+    report['elem_attributes'] = _atts(ea,eb,eperm)
+    report['only_in_a'] = [k for k in list(a.node_attrs)+list(a.elem_attrs) if k not in b.node_attrs and k not in b.elem_attrs]
+    report['only_in_b'] = [k for k in list(b.node_attrs)+list(b.elem_attrs) if k not in a.node_attrs and k not in a.elem_attrs]
+    report['equal'] = bool(crd['matched'] and crd['equal'] and conn['matched'] and
+                           all([v['equal'] for v in report['node_attributes'].values()]) and
+                           all([v['equal'] for v in report['elem_attributes'].values()]) and
+                           not report['only_in_a'] and not report['only_in_b'])
+    return report
+
+# Local faces (outward) and edges of each element type, zero-based node
+# numbers in LaGriT/AVS ordering
+elem_faces = {
+    'tri':[(1,2),(2,0),(0,1)],
+    'quad':[(0,1),(1,2),(2,3),(3,0)],
+    'tet':[(1,2,3),(0,3,2),(0,1,3),(0,2,1)],
+    'pyr':[(0,3,2,1),(0,1,4),(1,2,4),(2,3,4),(3,0,4)],
+    'prism':[(0,2,1),(3,4,5),(0,1,4,3),(1,2,5,4),(0,3,5,2)],
+    'hex':[(0,3,2,1),(4,5,6,7),(0,1,5,4),(1,2,6,5),(2,3,7,6),(0,4,7,3)],
+}
+elem_edges = {
+    'line':[(0,1)],
+    'tri':[(0,1),(0,2),(1,2)],
+    'quad':[(0,1),(0,3),(1,2),(2,3)],
+    'tet':[(0,1),(0,2),(0,3),(1,2),(1,3),(2,3)],
+    'pyr':[(0,1),(0,3),(0,4),(1,2),(1,4),(2,3),(2,4),(3,4)],
+    'prism':[(0,1),(0,2),(0,3),(1,2),(1,4),(2,5),(3,4),(3,5),(4,5)],
+    'hex':[(0,1),(0,3),(0,4),(1,2),(1,5),(2,3),(2,6),(3,7),(4,5),(4,7),(5,6),(6,7)],
+}
+
+def _edge_face_pairs(etype):
+    '''
+    Pairs of local faces sharing each edge of a 3D element type.
+    '''
+    owners = {}
+    for f,face in enumerate(elem_faces[etype]):
+        for k in range(len(face)):
+            e = tuple(sorted((face[k],face[(k+1)%len(face)])))
+            owners.setdefault(e,[]).append(f)
+    return [tuple(owners[e]) for e in elem_edges[etype]]
+
+def _face_vectors(X,face):
+    '''
+    Centroid and area vector of a (possibly non-planar) face of each element.
+    '''
+    P = X[:,face,:]
+    c = P.mean(axis=1)
+    if len(face) == 3:
+        a = 0.5*np.cross(P[:,1]-P[:,0],P[:,2]-P[:,0])
+    else:
+        a = 0.5*np.cross(P[:,2]-P[:,0],P[:,3]-P[:,1])
+    return c,a
+
+def _angles(u,v):
+    '''
+    Angles in degrees between the vectors u and v along the last axis
+    '''
+    nu = np.linalg.norm(u,axis=-1)
+    nv = np.linalg.norm(v,axis=-1)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        cs = np.sum(u*v,axis=-1)/(nu*nv)
+    return np.degrees(np.arccos(np.clip(cs,-1.,1.)))
+
+def element_quality(mesh,bins=10):
+    '''
+    Vectorized element quality metrics.
+
+    Metrics are computed per element type in batches over the coordinate
+    and connectivity arrays. Metrics undefined for an element type
+    (e.g. for point and line elements) are NaN.
+
+    volume: signed volume of 3D elements, area of 2D elements
+    aspect_ratio: 3*inradius/circumradius for tets, 2*inradius/circumradius
+    for triangles (1 for equilateral elements) and edge_min/edge_max for
+    other element types
+    edge_min, edge_max: shortest and longest edge
+    dihedral_min, dihedral_max: dihedral angles in degrees for 3D
+    elements, interior angles for 2D elements
+    skewness: equiangle skewness of the element faces (0 is ideal, 1 is
+    degenerate)
+
+    :arg mesh: mesh arrays
+    :type mesh: MeshArrays
+    :arg bins: number of histogram bins or bin edges passed to numpy.histogram
+    :type bins: int or array(float)
+    Returns: OrderedDict of per-element arrays with histograms of each
+    metric as (counts, bin_edges) tuples under the key 'histograms'
+    '''
+    names = ['volume','aspect_ratio','edge_min','edge_max','dihedral_min','dihedral_max','skewness']
+    q = OrderedDict([(nm,np.full(mesh.nelems,np.nan)) for nm in names])
+    for etype in np.unique(mesh.itettyp):
+        if etype not in elem_faces:
+            continue
+        idx = np.where(mesh.itettyp == etype)[0]
+        X = mesh.xyz[mesh.itet[idx,:avs_nen[etype]]]
+        E = np.array(elem_edges[etype])
+        L = np.linalg.norm(X[:,E[:,1]]-X[:,E[:,0]],axis=2)
+        q['edge_min'][idx] = L.min(axis=1)
+        q['edge_max'][idx] = L.max(axis=1)
+        q['aspect_ratio'][idx] = q['edge_min'][idx]/q['edge_max'][idx]
+
+        # Equiangle skewness from the interior angles of every face
+        faces = elem_faces[etype] if etype not in ['tri','quad'] else [tuple(range(avs_nen[etype]))]
+        skew = np.zeros(len(idx))
+        for face in faces:
+            P = X[:,face,:]
+            ang = _angles(np.roll(P,-1,axis=1)-P,np.roll(P,1,axis=1)-P)
+            te = 60. if len(face) == 3 else 90.
+            s = np.maximum((ang.max(axis=1)-te)/(180.-te),(te-ang.min(axis=1))/te)
+            skew = np.maximum(skew,s)
+        q['skewness'][idx] = skew
+
+        if etype in ['tri','quad']:
+            q['dihedral_min'][idx] = ang.min(axis=1)
+            q['dihedral_max'][idx] = ang.max(axis=1)
+            if etype == 'tri':
+                a = 0.5*np.linalg.norm(np.cross(X[:,1]-X[:,0],X[:,2]-X[:,0]),axis=1)
+                with np.errstate(divide='ignore',invalid='ignore'):
+                    r = a/(0.5*L.sum(axis=1))
+                    R = L.prod(axis=1)/(4.*a)
+                    q['aspect_ratio'][idx] = 2.*r/R
+            else:
+                a = 0.5*np.linalg.norm(np.cross(X[:,2]-X[:,0],X[:,3]-X[:,1]),axis=1)
+            q['volume'][idx] = a
+            continue
+
+        # Signed volume from outward face area vectors (divergence theorem)
+        ctr = X.mean(axis=1)
+        fc = [_face_vectors(X,face) for face in elem_faces[etype]]
+        q['volume'][idx] = sum([np.sum((c-ctr)*a,axis=1) for c,a in fc])/3.
+        # Dihedral angle is the supplement of the angle between outward normals
+        dih = np.column_stack([180.-_angles(fc[f1][1],fc[f2][1]) for f1,f2 in _edge_face_pairs(etype)])
+        q['dihedral_min'][idx] = dih.min(axis=1)
+        q['dihedral_max'][idx] = dih.max(axis=1)
+        if etype == 'tet':
+            a,b,c = X[:,1]-X[:,0],X[:,2]-X[:,0],X[:,3]-X[:,0]
+            det = np.sum(a*np.cross(b,c),axis=1)
+            num = (np.sum(a*a,axis=1)[:,None]*np.cross(b,c)+np.sum(b*b,axis=1)[:,None]*np.cross(c,a)+
+                   np.sum(c*c,axis=1)[:,None]*np.cross(a,b))
+            area = sum([np.linalg.norm(fa,axis=1) for _,fa in fc])
+            with np.errstate(divide='ignore',invalid='ignore'):
+                R = np.linalg.norm(num,axis=1)/(2.*np.abs(det))
+                r = 3.*np.abs(det/6.)/area
+                q['aspect_ratio'][idx] = 3.*r/R
+    q['histograms'] = OrderedDict()
+    for nm in names:
+        v = q[nm][np.isfinite(q[nm])]
+        q['histograms'][nm] = np.histogram(v,bins=bins)
+    return q
+
+def _concat_ranges(starts,ends):
+    '''
+    Concatenation of the integer ranges [starts[i],ends[i]).
+    '''
+    lens = np.maximum(ends-starts,0)
+    total = int(lens.sum())
+    if total == 0:
+        return np.zeros(0,dtype=np.int64)
+    offsets = np.repeat(starts-np.cumsum(lens)+lens,lens)
+    return offsets+np.arange(total)
+
+class GridIndex(object):
+    '''
+    Uniform grid spatial index of a point cloud.
+
+    Points are binned into cubic cells and sorted by cell key so that the
+    points of a cell, and of a column of cells, are contiguous. Queries
+    gather the candidate ranges with a binary search and filter the
+    candidates exactly.
+
+    :arg xyz: point coordinates
+    :type xyz: array(float), npoints x 3
+    :arg cell: cell size, chosen for about ppc points per cell if None
+    :type cell: float
+    :arg ppc: target number of points per cell
+    :type ppc: int
+
+    Example:
+    from pylagrit import utilities as util
+    import numpy as np
+    xyz = np.random.rand(100000,3)
+    index = util.GridIndex(xyz)
+    inside = index.box((0.2,0.2,0.2),(0.4,0.4,0.4))
+    near = index.ball((0.5,0.5,0.5),0.1)
+    '''
+    def __init__(self,xyz,cell=None,ppc=4):
+        self.xyz = np.asarray(xyz,dtype=float).reshape(-1,3)
+        n = self.xyz.shape[0]
+        self.lo = self.xyz.min(axis=0) if n else np.zeros(3)
+        ext = self.xyz.max(axis=0)-self.lo if n else np.zeros(3)
+        if cell is None:
+            active = ext > 0
+            if n == 0 or not np.any(active):
+                cell = 1.
+            else:
+                cell = (np.prod(ext[active])*ppc/float(n))**(1./np.sum(active))
+        cell = float(cell) if cell > 0 else 1.
+        # Thin dimensions can produce far more cells than points
+        while np.prod(np.floor(ext/cell)+1.) > max(8.*n,1.):
+            cell *= 2.
+        self.cell = cell
+        self.dims = (np.floor(ext/cell)+1).astype(np.int64)
+        keys = self._key(self._cells(self.xyz))
+        self.order = np.argsort(keys,kind='stable')
+        self.keys = keys[self.order]
+    def __len__(self):
+        return self.xyz.shape[0]
+    def _cells(self,x):
+        '''
+        Grid cell of each point, clipped to the grid
+        '''
+        return np.clip(np.floor((x-self.lo)/self.cell).astype(np.int64),0,self.dims-1)
+    def _key(self,c):
+        '''
+        Flat key of integer cell coordinates
+        '''
+        return (c[...,0]*self.dims[1]+c[...,1])*self.dims[2]+c[...,2]
+    def candidates(self,lo,hi):
+        '''
+        Indices of points in the cells overlapping the box lo-hi.
+        :arg lo: box minimum
+        :type lo: array(float)
+        :arg hi: box maximum
+        :type hi: array(float)
+        Returns: array of point indices (unsorted, may include points outside the box)
+        '''
+        lo = np.asarray(lo,dtype=float)
+        hi = np.asarray(hi,dtype=float)
+        if len(self) == 0 or np.any(hi < self.lo-self.cell) or np.any(lo > self.lo+self.dims*self.cell):
+            return np.zeros(0,dtype=np.int64)
+        clo = self._cells(lo)
+        chi = self._cells(hi)
+        ncol = (chi[0]-clo[0]+1)*(chi[1]-clo[1]+1)
+        if ncol > len(self.keys)//8:
+            return np.arange(len(self))
+        # Cells are contiguous along z, gather one range per (x,y) column
+        i,j = np.meshgrid(np.arange(clo[0],chi[0]+1),np.arange(clo[1],chi[1]+1),indexing='ij')
+        base = (i.ravel()*self.dims[1]+j.ravel())*self.dims[2]
+        starts = np.searchsorted(self.keys,base+clo[2],side='left')
+        ends = np.searchsorted(self.keys,base+chi[2],side='right')
+        return self.order[_concat_ranges(starts,ends)]
+    def box(self,lo,hi,eps=0.):
+        '''
+        Sorted indices of points inside the box lo-hi (inclusive).
+        :arg lo: box minimum
+        :type lo: array(float)
+        :arg hi: box maximum
+        :type hi: array(float)
+        :arg eps: tolerance added to the box extents
+        :type eps: float
+        Returns: array of point indices
+        '''
+        lo = np.asarray(lo,dtype=float)-eps
+        hi = np.asarray(hi,dtype=float)+eps
+        ids = self.candidates(lo,hi)
+        x = self.xyz[ids]
+        return np.sort(ids[np.all((x >= lo) & (x <= hi),axis=1)])
+    def ball(self,center,radius):
+        '''
+        Sorted indices of points within distance radius of center.
+        :arg center: ball center
+        :type center: array(float)
+        :arg radius: ball radius
+        :type radius: float
+        Returns: array of point indices
+        '''
+        center = np.asarray(center,dtype=float)
+        ids = self.candidates(center-radius,center+radius)
+        d2 = np.sum((self.xyz[ids]-center)**2,axis=1)
+        return np.sort(ids[d2 <= radius*radius])
+    def nearest(self,points,chunk=200000):
+        '''
+        Nearest indexed point of each query point.
+
+        Shells of cells around each query are searched until the nearest
+        candidate found is closer than the boundary of the searched block.
+        :arg points: query coordinates
+        :type points: array(float), npoints x 3
+        :arg chunk: number of queries processed at once
+        :type chunk: int
+        Returns: (array(int) of point indices, array(float) of distances)
+        '''
+        pts = np.asarray(points,dtype=float).reshape(-1,3)
+        best = np.full(pts.shape[0],-1,dtype=np.int64)
+        d2best = np.full(pts.shape[0],np.inf)
+        if len(self) == 0:
+            return best,np.sqrt(d2best)
+        for i0 in range(0,pts.shape[0],chunk):
+            sl = slice(i0,i0+chunk)
+            best[sl],d2best[sl] = self._nearest(pts[sl])
+        return best,np.sqrt(d2best)
+    def nearest_all(self,points,rtol=1.e-8,chunk=200000):
+        '''
+        All indexed points tied for nearest to each query point, such as
+        points on the Voronoi boundary between several indexed points.
+        :arg points: query coordinates
+        :type points: array(float), npoints x 3
+        :arg rtol: relative distance tolerance for ties
+        :type rtol: float
+        :arg chunk: number of queries processed at once
+        :type chunk: int
+        Returns: (array(int) query indices, array(int) point indices) of each pair, sorted by query
+        '''
+        pts = np.asarray(points,dtype=float).reshape(-1,3)
+        qs,ids = [np.zeros(0,dtype=np.int64)],[np.zeros(0,dtype=np.int64)]
+        if len(self) == 0:
+            return qs[0],ids[0]
+        for i0 in range(0,pts.shape[0],chunk):
+            best,d2best,(q,i,d2) = self._nearest(pts[i0:i0+chunk],rtol=rtol)
+            keep = d2 <= d2best[q]*(1.+rtol)**2
+            o = np.lexsort((i[keep],q[keep]))
+            qs.append(q[keep][o]+i0)
+            ids.append(i[keep][o])
+        return np.concatenate(qs),np.concatenate(ids)
+    def _nearest(self,pts,rtol=None,maxpairs=4000000):
+        '''
+        Nearest indexed point to each query point, searching rings of cells
+        of growing radius until no closer point can remain
+        '''
+        n = pts.shape[0]
+        best = np.full(n,-1,dtype=np.int64)
+        d2best = np.full(n,np.inf)
+        # Squared distance factor within which candidates are ties
+        f = 1. if rtol is None else (1.+rtol)**2
+        ties = []
+        c = self._cells(pts)
+        todo = np.arange(n)
+        r = 0
+        while len(todo):
+            rng = np.arange(-r,r+1)
+            off = np.array(np.meshgrid(rng,rng,rng,indexing='ij')).reshape(3,-1).T
+            off = off[(np.abs(off).max(axis=1) == r) & np.all(np.abs(off) < self.dims,axis=1)]
+            step = max(1,maxpairs//len(off))
+            for t0 in range(0,len(todo),step):
+                t = todo[t0:t0+step]
+                cq = c[t][:,None,:]+off[None,:,:]
+                # Skip cells outside the grid or farther than the current best
+                clo = self.lo+cq*self.cell
+                dd = np.maximum(np.maximum(clo-pts[t][:,None,:],pts[t][:,None,:]-clo-self.cell),0.)
+                ok = np.all((cq >= 0) & (cq < self.dims),axis=2) & (np.sum(dd*dd,axis=2) <= d2best[t][:,None]*f)
+                qi,oi = np.nonzero(ok)
+                key = self._key(cq[qi,oi])
+                starts = np.searchsorted(self.keys,key,side='left')
+                ends = np.searchsorted(self.keys,key,side='right')
+                q = np.repeat(t[qi],ends-starts)
+                if len(q) == 0:
+                    continue
+                ids = self.order[_concat_ranges(starts,ends)]
+                d2 = np.sum((self.xyz[ids]-pts[q])**2,axis=1)
+                if rtol is not None:
+                    ties.append((q,ids,d2))
+                # q is sorted, take the first closest candidate of each query
+                starts = np.flatnonzero(np.r_[True,q[1:] != q[:-1]])
+                dmin = np.minimum.reduceat(d2,starts)
+                counts = np.diff(np.r_[starts,len(q)])
+                pos = np.flatnonzero(d2 == np.repeat(dmin,counts))
+                pos = pos[np.r_[True,q[pos][1:] != q[pos][:-1]]]
+                q,ids,d2 = q[pos],ids[pos],d2[pos]
+                better = d2 < d2best[q]
+                best[q[better]] = ids[better]
+                d2best[q[better]] = d2[better]
+            # Distance from each query to the cells beyond each face of the
+            # searched block, faces at the boundary of the grid excluded
+            p = pts[todo]
+            glo = np.broadcast_to(self.lo,p.shape)
+            ghi = np.broadcast_to(self.lo+self.dims*self.cell,p.shape)
+            bound = np.full(len(todo),np.inf)
+            for a in range(3):
+                for side in (-1,1):
+                    ca = c[todo,a]+side*r
+                    open_face = ca > 0 if side < 0 else ca < self.dims[a]-1
+                    blo,bhi = glo.copy(),ghi.copy()
+                    if side < 0:
+                        bhi[:,a] = self.lo[a]+ca*self.cell
+                    else:
+                        blo[:,a] = self.lo[a]+(ca+1)*self.cell
+                    dd = np.maximum(np.maximum(blo-p,p-bhi),0.)
+                    bound = np.where(open_face,np.minimum(bound,np.sum(dd*dd,axis=1)),bound)
+            todo = todo[d2best[todo]*f > bound]
+            r += 1
+        if rtol is None:
+            return best,d2best
+        ties = [np.concatenate(v) for v in zip(*ties)] if len(ties) else [np.zeros(0,dtype=np.int64)]*2+[np.zeros(0)]
+        keep = ties[2] <= d2best[ties[0]]*f
+        return best,d2best,tuple(v[keep] for v in ties)
+
+# Decomposition of each element type into simplices (tets or triangles)
+elem_simplices = {
+    'tri':[(0,1,2)],
+    'quad':[(0,1,2),(0,2,3)],
+    'tet':[(0,1,2,3)],
+    'pyr':[(0,1,2,4),(0,2,3,4)],
+    'prism':[(0,1,2,3),(1,2,3,4),(2,3,4,5)],
+    'hex':[(0,1,2,6),(0,2,3,6),(0,3,7,6),(0,7,4,6),(0,4,5,6),(0,5,1,6)],
+}
+
+class ElementIndex(object):
+    '''
+    Spatial index of the elements of a mesh for point location.
+
+    Elements are split into tets (or triangles for 2D meshes) and each
+    simplex is registered in the uniform grid cells overlapped by its
+    bounding box. Barycentric coordinates of query points are computed
+    with precomputed inverse simplex matrices. 2D meshes are located in the
+    plane of the two coordinates with the largest extent.
+
+    :arg mesh: mesh arrays
+    :type mesh: MeshArrays
+    :arg ppc: target number of simplices per cell
+    :type ppc: int
+
+    Example:
+    from pylagrit import utilities as util
+    index = util.ElementIndex(mesh)
+    elem,nodes,weights = index.locate(points)
+    '''
+    def __init__(self,mesh,ppc=2):
+        self.mesh = mesh
+        types = mesh.itettyp
+        simp,parent = [],[]
+        for t in np.unique(types):
+            if t not in elem_simplices:
+                raise ValueError('Point location is not supported for '+t+' elements')
+            ids = np.flatnonzero(types == t)
+            for s in elem_simplices[t]:
+                simp.append(mesh.itet[ids][:,list(s)])
+                parent.append(ids)
+        nv = set([s.shape[1] for s in simp])
+        if len(nv) > 1:
+            raise ValueError('Mixed 2D and 3D elements are not supported')
+        self.nv = nv.pop() if len(nv) else 4
+        self.simplices = np.concatenate(simp) if len(simp) else np.zeros((0,self.nv),dtype=int)
+        self.parent = np.concatenate(parent) if len(parent) else np.zeros(0,dtype=int)
+        xyz = mesh.xyz
+        if self.nv == 3:
+            # Locate 2D meshes in their dominant plane
+            ext = np.ptp(xyz,axis=0) if len(xyz) else np.ones(3)
+            self.axes = np.sort(np.argsort(ext)[::-1][:2])
+            xyz = np.column_stack([xyz[:,self.axes],np.zeros(len(xyz))])
+        else:
+            self.axes = np.arange(3)
+        self.xyz = xyz
+        V = xyz[self.simplices]
+        self.origin = V[:,0]
+        T = np.zeros((len(V),3,3))
+        for k in range(1,self.nv):
+            T[:,:,k-1] = V[:,k]-V[:,0]
+        if self.nv == 3:
+            T[:,2,2] = 1.
+        det = np.linalg.det(T) if len(T) else np.zeros(0)
+        scale = np.abs(T).max(axis=(1,2)) if len(T) else np.zeros(0)
+        self.valid = np.abs(det) > 1.e-12*scale**(self.nv-1)
+        self.inv = np.zeros_like(T)
+        if np.any(self.valid):
+            self.inv[self.valid] = np.linalg.inv(T[self.valid])
+        # Register simplex bounding boxes in grid cells
+        bmin,bmax = V.min(axis=1),V.max(axis=1)
+        self.lo = xyz.min(axis=0) if len(xyz) else np.zeros(3)
+        ext = (xyz.max(axis=0) if len(xyz) else np.zeros(3))-self.lo
+        active = ext > 0
+        m = max(len(V),1)
+        cell = (np.prod(ext[active])*ppc/float(m))**(1./max(np.sum(active),1)) if np.any(active) else 1.
+        # Cells about half the typical simplex size keep candidate lists short
+        size = 0.5*np.median((bmax-bmin)[:,active].mean(axis=1)) if len(V) and np.any(active) else cell
+        cell = max(cell,size,1.e-300)
+        while True:
+            self.cell = cell
+            self.dims = (np.floor(ext/cell)+1).astype(np.int64)
+            clo = self._cells(bmin)
+            span = self._cells(bmax)-clo+1
+            counts = np.prod(span,axis=1)
+            if counts.sum() <= 32*m:
+                break
+            cell *= 2.
+        s = np.repeat(np.arange(len(V)),counts)
+        k = np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts,counts)
+        sy,sz = span[s,1],span[s,2]
+        c = clo[s]+np.column_stack([k//(sy*sz),(k//sz)%sy,k%sz])
+        keys = self._key(c)
+        order = np.argsort(keys,kind='stable')
+        self.keys = keys[order]
+        self.cell_simplex = s[order]
+    def __len__(self):
+        return self.mesh.nelems
+    def _cells(self,x):
+        '''
+        Grid cell of each point, clipped to the grid
+        '''
+        return np.clip(np.floor((x-self.lo)/self.cell).astype(np.int64),0,self.dims-1)
+    def _key(self,c):
+        '''
+        Flat key of integer cell coordinates
+        '''
+        return (c[...,0]*self.dims[1]+c[...,1])*self.dims[2]+c[...,2]
+    def _project(self,points):
+        '''
+        Points in the frame of the simplices, surface meshes use the two
+        coordinate axes of the plane with a zero third coordinate
+        '''
+        pts = np.asarray(points,dtype=float).reshape(-1,3)
+        if self.nv == 3:
+            pts = np.column_stack([pts[:,self.axes],np.zeros(len(pts))])
+        return pts
+    def _candidates(self,pts):
+        '''
+        (query, simplex, barycentric weights) of simplices in the query cells
+        '''
+        eps = 1.e-9*self.cell
+        inside = np.all((pts >= self.lo-eps) & (pts <= self.lo+self.dims*self.cell+eps),axis=1)
+        q = np.flatnonzero(inside)
+        key = self._key(self._cells(pts[q]))
+        starts = np.searchsorted(self.keys,key,side='left')
+        ends = np.searchsorted(self.keys,key,side='right')
+        s = self.cell_simplex[_concat_ranges(starts,ends)]
+        q = np.repeat(q,ends-starts)
+        lam = np.einsum('kij,kj->ki',self.inv[s],pts[q]-self.origin[s])[:,:self.nv-1]
+        w = np.column_stack([1.-lam.sum(axis=1),lam])
+        w[~self.valid[s]] = -np.inf
+        return q,s,w
+    def locate(self,points,tol=1.e-8,chunk=100000):
+        '''
+        Element containing each point and the barycentric weights of the
+        point in the simplex of the element containing it. When a point is
+        on a shared face, the element in which it lies deepest is returned.
+        :arg points: query coordinates
+        :type points: array(float), npoints x 3
+        :arg tol: tolerance on barycentric coordinates for points on faces
+        :type tol: float
+        :arg chunk: number of queries processed at once
+        :type chunk: int
+        Returns: (array(int) elements, -1 outside the mesh;
+                  array(int) simplex nodes, npoints x (3 or 4);
+                  array(float) barycentric weights, npoints x (3 or 4))
+        '''
+        pts = self._project(points)
+        n = pts.shape[0]
+        elem = np.full(n,-1,dtype=np.int64)
+        nodes = np.full((n,self.nv),-1,dtype=np.int64)
+        weights = np.zeros((n,self.nv))
+        for i0 in range(0,n,chunk):
+            q,s,w = self._candidates(pts[i0:i0+chunk])
+            depth = w.min(axis=1)
+            hit = depth >= -tol
+            q,s,w,depth = q[hit],s[hit],w[hit],depth[hit]
+            o = np.lexsort((-depth,q))
+            q,s,w = q[o],s[o],w[o]
+            first = np.ones(len(q),dtype=bool)
+            first[1:] = q[1:] != q[:-1]
+            q,s,w = q[first]+i0,s[first],w[first]
+            elem[q] = self.parent[s]
+            nodes[q] = self.simplices[s]
+            weights[q] = w
+        return elem,nodes,weights
+    def containing(self,points,tol=1.e-8,chunk=100000):
+        '''
+        All elements containing each point, including both elements sharing
+        a face through the point.
+        :arg points: query coordinates
+        :type points: array(float), npoints x 3
+        :arg tol: tolerance on barycentric coordinates for points on faces
+        :type tol: float
+        :arg chunk: number of queries processed at once
+        :type chunk: int
+        Returns: (array(int) point indices, array(int) elements) of each pair
+        '''
+        pts = self._project(points)
+        qs,es = [],[]
+        for i0 in range(0,pts.shape[0],chunk):
+            q,s,w = self._candidates(pts[i0:i0+chunk])
+            hit = w.min(axis=1) >= -tol
+            pairs = np.unique(np.column_stack([q[hit]+i0,self.parent[s[hit]]]),axis=0)
+            qs.append(pairs[:,0])
+            es.append(pairs[:,1])
+        if len(qs) == 0:
+            return np.zeros(0,dtype=np.int64),np.zeros(0,dtype=np.int64)
+        return np.concatenate(qs),np.concatenate(es)
+
+def stride_mask(n,stride=(1,0,0),itp=None):
+    '''
+    Nodes selected by a LaGriT ifirst,ilast,istride triplet, following
+    pntlimn: zero values take the defaults 1, n and 1, ifirst is clipped
+    to n, an ilast below ifirst is taken as a count past ifirst and
+    negative values are offsets from the defaults. Like LaGriT, dudded and
+    merged nodes (itp1 20-29) are excluded.
+    :arg n: number of nodes
+    :type n: int
+    :arg stride: ifirst, ilast, istride (1-based, 0 for defaults)
+    :type stride: tuple(int,int,int)
+    :arg itp: node itp1 values
+    :type itp: array(int)
+    Returns: boolean array of size n
+    '''
+    ifirst,ilast,istride = [int(v) for v in stride]
+    if ifirst < 0:
+        ifirst = max(0,1-ifirst)
+    if ilast < 0:
+        ilast = max(0,n-ilast)
+    if istride < 0:
+        istride = max(1,1-istride)
+    if ifirst == 0:
+        ifirst = 1
+    if ilast == 0:
+        ilast = n
+    if istride == 0:
+        istride = 1
+    ifirst = min(ifirst,n)
+    if ilast < ifirst:
+        ilast = ifirst+ilast
+    ilast = min(ilast,n)
+    mask = np.zeros(n,dtype=bool)
+    mask[ifirst-1:ilast:istride] = True
+    if itp is not None:
+        mask &= (itp < 20) | (itp > 29)
+    return mask
+
+def select_geom(xyz,mins,maxs,ctr=(0,0,0),geom='xyz',index=None):
+    '''
+    Nodes inside a LaGriT pset geometry, following pset/geom semantics:
+    bounds are inclusive, cylindrical (rtz) and spherical (rtp) angles are
+    in degrees relative to the center ctr. As in angle3v, the azimuth
+    (theta for rtz, phi for rtp) lies in [0,360) and the polar angle
+    (theta for rtp) in [0,180]; angle ranges are not wrapped, so a theta
+    range of -45 to 45 selects azimuths from 0 to 45 only.
+    :arg xyz: node coordinates
+    :type xyz: array(float), nnodes x 3
+    :arg mins: (x1,y1,z1), (r1,theta1,z1) or (r1,theta1,phi1)
+    :type mins: tuple(float)
+    :arg maxs: (x2,y2,z2), (r2,theta2,z2) or (r2,theta2,phi2)
+    :type maxs: tuple(float)
+    :arg ctr: center of the geometry
+    :type ctr: tuple(float)
+    :arg geom: 'xyz', 'rtz' or 'rtp'
+    :type geom: str
+    :arg index: spatial index of xyz used to find candidates
+    :type index: GridIndex
+    Returns: sorted array of node indices
+    '''
+    lo = np.asarray(mins,dtype=float)
+    hi = np.asarray(maxs,dtype=float)
+    ctr = np.asarray(ctr,dtype=float)
+    big = np.finfo(float).max/4.
+    if geom == 'xyz':
+        if np.any(lo > hi):
+            return np.zeros(0,dtype=np.int64)
+        blo,bhi = ctr+lo,ctr+hi
+    elif geom == 'rtz':
+        lo[0] = max(lo[0],-1.e-20)
+        r = max(abs(lo[0]),abs(hi[0]))
+        blo = np.array([ctr[0]-r,ctr[1]-r,ctr[2]+min(lo[2],hi[2])])
+        bhi = np.array([ctr[0]+r,ctr[1]+r,ctr[2]+max(lo[2],hi[2])])
+    elif geom == 'rtp':
+        r = max(abs(lo[0]),abs(hi[0]))
+        blo,bhi = ctr-r,ctr+r
+    else:
+        raise ValueError("geom must be one of 'xyz', 'rtz' or 'rtp'")
+    blo = np.clip(blo,-big,big)
+    bhi = np.clip(bhi,-big,big)
+    if index is None:
+        index = GridIndex(xyz)
+    ids = index.candidates(blo,bhi)
+    d = xyz[ids]-ctr
+    if geom == 'xyz':
+        v = d
+    else:
+        # Angles as computed by LaGriT's angle3v, in degrees
+        az = np.degrees(np.arctan2(d[:,1],d[:,0]))%360.
+        az[(np.abs(d[:,0]) < 1.e-10) & (np.abs(d[:,1]) < 1.e-10)] = 0.
+        if geom == 'rtz':
+            r = np.hypot(d[:,0],d[:,1])
+            v = np.column_stack([r,np.where(r == 0.,0.5*(lo[1]+hi[1]),az),d[:,2]])
+        else:
+            r = np.linalg.norm(d,axis=1)
+            with np.errstate(divide='ignore',invalid='ignore'):
+                pol = np.degrees(np.arccos(np.clip(d[:,2]/r,-1.,1.)))
+            v = np.column_stack([r,np.where(r == 0.,0.5*(lo[1]+hi[1]),pol),np.where(r == 0.,0.5*(lo[2]+hi[2]),az)])
+    # Same bin test as pset/geom
+    c = 0.5*(lo+hi)
+    half = 0.5*(np.abs(hi-lo)+1.e-20)*(1.+1.e-14)
+    inside = np.all(np.abs(v-c) < half,axis=1)
+    return np.sort(ids[inside])
+
+def write_faceset(filename,idelem,idface):
+    '''
+    Write a faceset file for dump/exo in the AVS format written by
+    dump/avs2/filename/mo/0 0 0 2: a header without nodes or elements and
+    the idelem1 and idface1 integer columns, each as wide as LaGriT makes
+    them for its largest value.
+    :arg filename: name of faceset file
+    :type filename: str
+    :arg idelem: 1-based parent element of each face (idelem1)
+    :type idelem: array(int)
+    :arg idface: local face number of each face in its parent element (idface1)
+    :type idface: array(int)
+    '''
+    data = np.column_stack([np.asarray(idelem),np.asarray(idface)]).astype(int).reshape(-1,2)
+    # dumpavs width: nint(log10(max|v|+1))+3, at least 3
+    widths = []
+    for col in data.T:
+        vmax = np.abs(col).max() if len(col) else 0
+        widths.append(max(3,int(np.floor(np.log10(vmax+1.)+0.5))+3))
+    with open(filename,'w') as fh:
+        fh.write('%10d %10d %10d %10d %10d \n'%(0,0,0,2,0))
+        fh.write('00002  1  1\nidelem1, integer \nidface1, integer \n')
+        np.savetxt(fh,data,fmt='%%%dd%%%dd'%tuple(widths))
+
+def surface_normals(mesh):
+    '''
+    Normal vectors of the elements of a surface mesh computed from their
+    first three nodes, as done by settets/normal.
+    :arg mesh: surface mesh arrays
+    :type mesh: MeshArrays
+    Returns: array(float), nelems x 3
+    '''
+    X = mesh.xyz[mesh.itet[:,:3]]
+    return np.cross(X[:,1]-X[:,0],X[:,2]-X[:,0])
+
+def normal_sides(normals,eps=1.e-10):
+    '''
+    Classify normal vectors into the six box sides used by settets/normal:
+    1 bottom (-z), 2 top (+z), 3 right (+x), 4 back (+y), 5 left (-x),
+    6 front (-y). Normals without a strictly dominant direction (e.g. at
+    45 degrees between two sides) are assigned 0.
+    :arg normals: normal vectors
+    :type normals: array(float), n x 3
+    :arg eps: relative tolerance for dominance of a direction
+    :type eps: float
+    Returns: array(int) of side ids
+    '''
+    normals = np.asarray(normals,dtype=float).reshape(-1,3)
+    a = np.abs(normals)
+    axis = np.argmax(a,axis=1)
+    rows = np.arange(len(a))
+    top = a[rows,axis]
+    second = np.sort(a,axis=1)[:,1]
+    dominant = top-second > eps*np.linalg.norm(normals,axis=1)
+    positive = normals[rows,axis] > 0
+    # (axis, positive) -> side id
+    ids = np.array([[5,3],[6,4],[1,2]])[axis,positive.astype(int)]
+    return np.where(dominant,ids,0)
+
+def grid_elements(nx,ny,elem_type='quad'):
+    '''
+    Connectivity of a structured nx by ny grid of nodes numbered with x
+    varying fastest. Quads are ordered row by row and oriented
+    counterclockwise in the xy plane; with elem_type 'tri' each quad is
+    split into two triangles along its diagonal.
+    :arg nx: number of nodes in x
+    :type nx: int
+    :arg ny: number of nodes in y
+    :type ny: int
+    :arg elem_type: 'quad' or 'tri'
+    :type elem_type: str
+    Returns: array(int), nelems x nodes per element
+    '''
+    i,j = np.meshgrid(np.arange(nx-1),np.arange(ny-1))
+    n = (j*nx+i).ravel()
+    quad = np.column_stack([n,n+1,n+nx+1,n+nx])
+    if elem_type == 'quad':
+        return quad
+    if elem_type != 'tri':
+        raise ValueError("elem_type must be 'quad' or 'tri'")
+    return np.column_stack([quad[:,[0,1,2]],quad[:,[0,2,3]]]).reshape(-1,3)
+
+def stack_surfaces(x,y,surfaces,nlayers=None,matids=None,elem_type='quad',
+                   buffer=None,pinch=None,trunc=None,fill=True):
+    '''
+    Stack surfaces sharing a structured (x,y) grid into a layered mesh,
+    following the rules of stack/layers and stack/fill.
+
+    Surfaces are listed from bottom to top. Units between consecutive
+    surfaces take the material of their lower surface and are refined with
+    proportional layers. Nodes and elements are ordered layer by layer from
+    the bottom up, and the node attribute layertyp marks each node layer as
+    -1 bottom, -2 top, 0 input surface, 1 buffer or 2 refinement.
+
+    :arg x: x grid locations
+    :type x: array(float)
+    :arg y: y grid locations
+    :type y: array(float)
+    :arg surfaces: elevations of each surface, len(y) x len(x) or flat with x varying fastest
+    :type surfaces: list(array(float))
+    :arg nlayers: number of refinement layers added below each surface after the first
+    :type nlayers: list(int)
+    :arg matids: material id of each surface
+    :type matids: list(int)
+    :arg elem_type: 'quad' (hex mesh) or 'tri' (prism mesh)
+    :type elem_type: str
+    :arg buffer: thickness of buffer layers placed around interior surfaces
+    :type buffer: float
+    :arg pinch: minimum layer thickness; thinner layers are collapsed onto the layer below
+    :type pinch: float
+    :arg trunc: index of the surface truncating the surfaces below it
+    :type trunc: int
+    :arg fill: fill the stack with volume elements, otherwise return the layered surfaces
+    :type fill: bool
+    Returns: MeshArrays
+    '''
+    x = np.asarray(x,dtype=float).ravel()
+    y = np.asarray(y,dtype=float).ravel()
+    nx,ny = len(x),len(y)
+    npoints = nx*ny
+    zs = [np.asarray(s,dtype=float).ravel() for s in surfaces]
+    nfile = len(zs)
+    if nfile < 2:
+        raise ValueError('At least two surfaces are required')
+    for s in zs:
+        if s.size != npoints:
+            raise ValueError('Surface size does not match the (x,y) grid')
+    refine = [0]+[int(n) for n in (nlayers if nlayers is not None else [0]*(nfile-1))]
+    if len(refine) != nfile:
+        raise ValueError('nlayers must have one entry per surface after the first')
+    clr = list(matids) if matids is not None else [1]*nfile
+    if len(clr) != nfile:
+        raise ValueError('matids must have one entry per surface')
+    xthick = 0. if pinch is None else float(pinch)
+    if buffer is not None and xthick > buffer:
+        raise ValueError('pinch greater than buffer')
+
+    # Total number of layers and layers below the truncating surface
+    nft = nfile if trunc is None else trunc+1
+    ninter_top = nft if trunc is not None and nft != nfile else nfile-1
+    nlayer_tot,ntrunc = 0,0
+    for i in range(1,nfile+1):
+        nlayer_tot += refine[i-1]+1
+        if buffer is not None and i != 1 and i <= ninter_top:
+            nlayer_tot += 2
+        if i <= nft:
+            ntrunc = nlayer_tot
+    if buffer is not None and trunc is not None:
+        ntrunc -= 1
+
+    def truncate(z,nlayer):
+        '''
+        Elevations of a node layer, raised to the truncating surface where
+        the layer lies closer to it than the minimum thickness
+        '''
+        if trunc is None or nlayer >= ntrunc:
+            return z
+        return np.where(zs[trunc]-z < xthick,zs[trunc],z)
+
+    lower = truncate(zs[0],0)
+    layers,ltyp,lclr = [lower],[-1],[clr[0]]
+    for ii in range(2,nfile+1):
+        upper = truncate(zs[ii-1],len(layers))
+        thick = np.maximum(upper-lower,0.)
+        ncmo = refine[ii-1]+1
+        if buffer is not None:
+            ncmo += 1
+            if ii != 2 and ii <= ninter_top:
+                ncmo += 1
+        for icmo in range(1,ncmo+1):
+            if ii == 2 and icmo != ncmo:
+                laytyp = 1 if buffer is not None and icmo == ncmo-1 else 2
+            elif ii == nfile and icmo != ncmo:
+                laytyp = 1 if buffer is not None and icmo == 1 else 2
+            elif buffer is not None and icmo in (1,ncmo-1):
+                laytyp = 1
+            elif icmo != ncmo and refine[ii-1] != 0:
+                laytyp = 2
+            else:
+                laytyp = 0
+            if laytyp == 1:
+                # constant offset above the lower or below the upper surface
+                if icmo != 1 or ii == 2:
+                    z = upper-buffer
+                else:
+                    z = lower+buffer
+                z = np.where(thick <= buffer,lower+0.5*thick,z)
+            elif laytyp == 2:
+                if buffer is None:
+                    f = float(icmo)/ncmo
+                elif ii == 2:
+                    f = float(icmo)/(ncmo-1)
+                elif ii == nfile:
+                    f = float(icmo-1)/(ncmo-1)
+                else:
+                    f = float(icmo-1)/(ncmo-2)
+                z = lower+f*thick
+            else:
+                z = upper
+            if pinch is not None:
+                z = np.where(layers[-1]+xthick > z,layers[-1],z)
+            layers.append(z)
+            ltyp.append(laytyp)
+            lclr.append(clr[ii-1] if icmo == ncmo else clr[ii-2])
+        lower = layers[-1]
+    ltyp[-1] = -2
+    nlay = len(layers)
+
+    xy = np.column_stack([np.tile(x,ny),np.repeat(y,nx)])
+    xyz = np.column_stack([np.tile(xy,(nlay,1)),np.concatenate(layers)])
+    elem = grid_elements(nx,ny,elem_type)
+    offsets = (np.arange(nlay)*npoints).reshape(-1,1,1)
+    if fill:
+        itet = np.concatenate([elem+offsets[:-1],elem+offsets[1:]],axis=2).reshape(-1,2*elem.shape[1])
+        itettyp = 'hex' if elem_type == 'quad' else 'prism'
+        eclr = np.array(lclr[:-1])
+        # stack/fill colors each node layer with the elements above it
+        nclr = np.array(lclr[:-2]+[lclr[-2]]*2)
+    else:
+        itet = (elem+offsets).reshape(-1,elem.shape[1])
+        itettyp = elem_type
+        eclr = np.array(lclr)
+        nclr = eclr
+    itetclr = np.repeat(eclr,elem.shape[0])
+    node_attrs = OrderedDict([('imt1',np.repeat(nclr,npoints)),
+                              ('layertyp',np.repeat(np.array(ltyp),npoints))])
+    return MeshArrays(xyz,itet,itettyp,itetclr,node_attrs=node_attrs)
+
+def geometry_hash(mesh):
+    '''
+    Hash of the node coordinates and connectivity of a mesh, cached on the
+    mesh arrays object.
+    :arg mesh: mesh arrays
+    :type mesh: MeshArrays
+    Returns: str
+    '''
+    h = getattr(mesh,'_geometry_hash',None)
+    if h is None:
+        sha = hashlib.sha1()
+        sha.update(np.ascontiguousarray(mesh.xyz,dtype=np.float64).tobytes())
+        sha.update(np.ascontiguousarray(mesh.itet,dtype=np.int64).tobytes())
+        sha.update(' '.join(mesh.itettyp).encode())
+        h = mesh._geometry_hash = sha.hexdigest()
+    return h
+
+class SparseMap(object):
+    '''
+    Sparse map from source values to sink values stored as sorted
+    (row, column, weight) triplets.
+
+    Rows without entries are sink points the map could not reach and are
+    assigned a fill value when the map is applied.
+
+    :arg rows: sink index of each entry
+    :type rows: array(int)
+    :arg cols: source index of each entry
+    :type cols: array(int)
+    :arg weights: weight of each entry
+    :type weights: array(float)
+    :arg shape: (number of sinks, number of sources)
+    :type shape: tuple(int)
+    '''
+    def __init__(self,rows,cols,weights,shape):
+        rows = np.asarray(rows,dtype=np.int64).ravel()
+        order = np.argsort(rows,kind='stable')
+        self.rows = rows[order]
+        self.cols = np.asarray(cols,dtype=np.int64).ravel()[order]
+        self.weights = np.asarray(weights,dtype=float).ravel()[order]
+        self.shape = (int(shape[0]),int(shape[1]))
+        self.indptr = np.r_[0,np.cumsum(np.bincount(self.rows,minlength=self.shape[0]))]
+    def __repr__(self):
+        return 'SparseMap(shape=%s, nnz=%d)'%(self.shape,len(self.rows))
+    @property
+    def found(self):
+        '''Boolean array of sink rows with at least one entry'''
+        return np.diff(self.indptr) > 0
+    def apply(self,values,reduce='sum',fill=np.nan):
+        '''
+        Map source values to the sinks.
+        :arg values: source values
+        :type values: array, length shape[1]
+        :arg reduce: 'sum' for the weighted sum of the entries of each row, 'max' or 'min' for their extreme value
+        :type reduce: str
+        :arg fill: value of rows without entries
+        :type fill: float
+        Returns: array(float), length shape[0]
+        '''
+        values = np.asarray(values,dtype=float).ravel()
+        if values.shape[0] != self.shape[1]:
+            raise ValueError('Expected %d source values, got %d'%(self.shape[1],values.shape[0]))
+        found = self.found
+        out = np.full(self.shape[0],fill,dtype=float)
+        if reduce == 'sum':
+            s = np.bincount(self.rows,weights=self.weights*values[self.cols],minlength=self.shape[0])
+            out[found] = s[found]
+        elif reduce in ('max','min'):
+            ufunc = np.maximum if reduce == 'max' else np.minimum
+            if len(self.rows):
+                out[found] = ufunc.reduceat(values[self.cols],self.indptr[:-1][found])
+        else:
+            raise ValueError("reduce must be 'sum', 'max' or 'min'")
+        return out
+
+def interpolation_map(src,points,method,node_index=None,elem_index=None):
+    '''
+    Sparse map from the nodes or elements of a source mesh to points, the
+    numpy counterpart of interpolate/voronoi, map and continuous.
+
+    voronoi maps the nearest source node, map the source elements
+    containing each point (several on shared faces, to be reduced with a
+    tie rule) and continuous the barycentric weights of the nodes of the
+    source element containing each point. Hex, prism and pyramid elements
+    are interpolated linearly on their tet decomposition.
+
+    :arg src: source mesh arrays
+    :type src: MeshArrays
+    :arg points: sink point coordinates
+    :type points: array(float), npoints x 3
+    :arg method: 'voronoi', 'map' or 'continuous'
+    :type method: str
+    :arg node_index: spatial index of the source nodes, built if None
+    :type node_index: GridIndex
+    :arg elem_index: spatial index of the source elements, built if None
+    :type elem_index: ElementIndex
+    Returns: SparseMap from source nodes (voronoi, continuous) or elements (map) to points
+    '''
+    points = np.asarray(points,dtype=float).reshape(-1,3)
+    n = points.shape[0]
+    if method == 'voronoi':
+        if node_index is None:
+            node_index = GridIndex(src.xyz)
+        ids,d = node_index.nearest(points)
+        ok = ids >= 0
+        return SparseMap(np.flatnonzero(ok),ids[ok],np.ones(ok.sum()),(n,src.nnodes))
+    if elem_index is None:
+        elem_index = ElementIndex(src)
+    if method == 'map':
+        q,e = elem_index.containing(points)
+        return SparseMap(q,e,np.ones(len(q)),(n,src.nelems))
+    if method == 'continuous':
+        elem,nodes,weights = elem_index.locate(points)
+        ok = elem >= 0
+        nv = nodes.shape[1]
+        rows = np.repeat(np.flatnonzero(ok),nv)
+        return SparseMap(rows,nodes[ok].ravel(),weights[ok].ravel(),(n,src.nnodes))
+    raise ValueError("method must be 'voronoi', 'map' or 'continuous'")
+
+def nearest_node_map(src_xyz,sink_xyz,index=None,rtol=1.e-8):
+    '''
+    Sparse nearest-node map assigning each fine source node to the coarse
+    sink node closest to it, i.e. whose Voronoi cell contains it, as done
+    by upscale. This is not a volume overlap: each source node counts with
+    its own weight, such as its Voronoi volume, in the sink it falls in.
+    Source nodes on Voronoi boundaries are assigned to every sink node
+    sharing the boundary.
+    :arg src_xyz: source node coordinates
+    :type src_xyz: array(float), nsrc x 3
+    :arg sink_xyz: sink node coordinates
+    :type sink_xyz: array(float), nsink x 3
+    :arg index: spatial index of the sink nodes, built if None
+    :type index: GridIndex
+    :arg rtol: relative distance tolerance for Voronoi boundaries
+    :type rtol: float
+    Returns: SparseMap from source to sink nodes
+    '''
+    src_xyz = np.asarray(src_xyz,dtype=float).reshape(-1,3)
+    if index is None:
+        index = GridIndex(sink_xyz)
+    q,ids = index.nearest_all(src_xyz,rtol=rtol)
+    return SparseMap(ids,q,np.ones(len(q)),(len(index),src_xyz.shape[0]))
+
+def upscale_values(smap,values,method,boundary_choice=None,weights=None,fill=np.nan):
+    '''
+    Upscale source values with a nearest-node map from nearest_node_map().
+
+    :arg smap: nearest-node map from source to sink nodes
+    :type smap: SparseMap
+    :arg values: source values
+    :type values: array(float)
+    :arg method: 'ariave', 'geoave', 'harave', 'sum', 'min' or 'max'
+    :type method: str
+    :arg boundary_choice: use of source nodes on Voronoi boundaries: 'multiple' (default) in every sink, 'single' in their first sink only, 'divide' split evenly between sinks
+    :type boundary_choice: str
+    :arg weights: source weights such as Voronoi volumes for the averages, multiplying the values for sum
+    :type weights: array(float)
+    :arg fill: value of sinks without source nodes, NaN by default
+    :type fill: float
+    Returns: array(float) of sink values
+    '''
+    x = np.asarray(values,dtype=float).ravel()
+    w = np.ones_like(x) if weights is None else np.asarray(weights,dtype=float).ravel()
+    if boundary_choice == 'single':
+        first = np.unique(smap.cols,return_index=True)[1]
+        smap = SparseMap(smap.rows[first],smap.cols[first],smap.weights[first],smap.shape)
+    elif boundary_choice == 'divide':
+        share = np.bincount(smap.cols,minlength=smap.shape[1])
+        smap = SparseMap(smap.rows,smap.cols,smap.weights/share[smap.cols],smap.shape)
+    elif boundary_choice not in (None,'multiple'):
+        raise ValueError("boundary_choice must be 'multiple', 'single' or 'divide'")
+    if method in ('min','max'):
+        return smap.apply(x,reduce=method,fill=fill)
+    if method == 'sum':
+        return smap.apply(w*x,fill=fill)
+    used = smap.cols
+    if method == 'geoave' and np.any(x[used] <= 0.):
+        raise ValueError('geoave requires source values greater than zero')
+    if method == 'harave' and np.any(x[used] == 0.):
+        raise ValueError('harave requires nonzero source values')
+    wsum = smap.apply(w,fill=np.nan)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        if method == 'ariave':
+            out = smap.apply(w*x,fill=np.nan)/wsum
+        elif method == 'geoave':
+            lx = np.zeros_like(x)
+            lx[used] = np.log(x[used])
+            out = np.exp(smap.apply(w*lx,fill=np.nan)/wsum)
+        elif method == 'harave':
+            ix = np.zeros_like(x)
+            ix[used] = 1./x[used]
+            out = wsum/smap.apply(w*ix,fill=np.nan)
+        else:
+            raise ValueError("method must be 'ariave', 'geoave', 'harave', 'sum', 'min' or 'max'")
+    out[~smap.found] = fill
+    return out
+
+def merge_arrays(meshes):
+    '''
+    Concatenate meshes into one, offsetting the connectivity of each mesh
+    by the number of nodes before it. Attributes missing from some meshes
+    are filled with zeros.
+    :arg meshes: meshes to merge
+    :type meshes: list(MeshArrays)
+    Returns: MeshArrays
+    '''
+    meshes = list(meshes)
+    offsets = np.r_[0,np.cumsum([m.nnodes for m in meshes])]
+    width = max([m.itet.shape[1] for m in meshes])
+    itet = []
+    for m,off in zip(meshes,offsets):
+        t = np.full((m.nelems,width),-1,dtype=np.int64)
+        t[:,:m.itet.shape[1]] = np.where(m.itet >= 0,m.itet+off,-1)
+        itet.append(t)
+    def merged(attrs,lengths,shift=None):
+        '''
+        Concatenate the attributes of the meshes, filling attributes missing
+        from a mesh with zeros and offsetting the node numbers of shift
+        '''
+        names = []
+        for a in attrs:
+            names += [k for k in a if k not in names]
+        out = OrderedDict()
+        for k in names:
+            ref = [a[k] for a in attrs if k in a][0]
+            cols = []
+            for a,n,off in zip(attrs,lengths,offsets):
+                v = a[k] if k in a else np.zeros((n,)+ref.shape[1:],dtype=ref.dtype)
+                # isn1 holds node numbers of parent/child chains
+                if shift == k:
+                    v = np.where(v > 0,v+off,v)
+                cols.append(v)
+            out[k] = np.concatenate(cols)
+        return out
+    return MeshArrays(np.concatenate([m.xyz for m in meshes]),np.concatenate(itet),
+                      np.concatenate([m.itettyp for m in meshes]),np.concatenate([m.itetclr for m in meshes]),
+                      merged([m.node_attrs for m in meshes],[m.nnodes for m in meshes],shift='isn1'),
+                      merged([m.elem_attrs for m in meshes],[m.nelems for m in meshes]))
+
+def _hash_cells(c):
+    '''
+    Spatial hash of integer cell coordinates, collisions only add candidates
+    '''
+    c = c.astype(np.uint64)
+    with np.errstate(over='ignore'):
+        return (c[:,0]*np.uint64(73856093))^(c[:,1]*np.uint64(19349663))^(c[:,2]*np.uint64(83492791))
+
+def find_duplicates(xyz,tol):
+    '''
+    Find nodes within distance tol of each other.
+
+    Coordinates are quantized into cells of size tol and hashed. Each node
+    is compared with the nodes of its own cell and of the 13 neighbour cells
+    in the positive half of its 3x3x3 neighbourhood, so pairs on either side
+    of a cell boundary are found exactly once. Nodes connected through a
+    chain of close pairs form one group.
+    :arg xyz: node coordinates
+    :type xyz: array(float), nnodes x 3
+    :arg tol: distance tolerance
+    :type tol: float
+    Returns: array(int), the smallest node index of the group of each node
+
+    Example:
+    from pylagrit import utilities as util
+    rep = util.find_duplicates(mesh.xyz,1.e-6)
+    unique = rep == numpy.arange(len(rep))
+    '''
+    xyz = np.asarray(xyz,dtype=float).reshape(-1,3)
+    n = xyz.shape[0]
+    rep = np.arange(n)
+    if n < 2:
+        return rep
+    if tol <= 0:
+        raise ValueError('tol must be positive')
+    cells = np.floor((xyz-xyz.min(axis=0))/tol).astype(np.int64)
+    keys = _hash_cells(cells)
+    order = np.argsort(keys,kind='stable')
+    skeys = keys[order]
+    rng = np.arange(-1,2)
+    offsets = np.array(np.meshgrid(rng,rng,rng,indexing='ij')).reshape(3,-1).T
+    # The cell itself and the positive half of the neighbourhood
+    offsets = offsets[13:]
+    pi,pj = [],[]
+    for o in offsets:
+        nkeys = _hash_cells(cells[order]+o)
+        starts = np.searchsorted(skeys,nkeys,side='left')
+        ends = np.searchsorted(skeys,nkeys,side='right')
+        if not np.any(o):
+            # Pairs within a cell are taken once, in sorted order
+            starts = np.maximum(starts,np.arange(n)+1)
+        i = np.repeat(order,np.maximum(ends-starts,0))
+        j = order[_concat_ranges(starts,ends)]
+        close = np.sum((xyz[i]-xyz[j])**2,axis=1) <= tol*tol
+        pi.append(i[close])
+        pj.append(j[close])
+    pi = np.concatenate(pi)
+    pj = np.concatenate(pj)
+    # Connected components by minimum label propagation
+    while len(pi):
+        m = np.minimum(rep[pi],rep[pj])
+        old = rep.copy()
+        np.minimum.at(rep,pi,m)
+        np.minimum.at(rep,pj,m)
+        while True:
+            nxt = rep[rep]
+            if np.array_equal(nxt,rep):
+                break
+            rep = nxt
+        if np.array_equal(rep,old):
+            break
+    return rep
+
+def dedupe_arrays(mesh,tol):
+    '''
+    Merge nodes within distance tol of each other, keeping the first node
+    of each group and remapping the connectivity. Elements collapsed by the
+    merge, i.e. with a repeated node, are removed.
+    :arg mesh: mesh arrays
+    :type mesh: MeshArrays
+    :arg tol: distance tolerance
+    :type tol: float
+    Returns: (MeshArrays, array(int) new index of each original node)
+    '''
+    rep = find_duplicates(mesh.xyz,tol)
+    keep = rep == np.arange(mesh.nnodes)
+    new = np.cumsum(keep)-1
+    node_map = new[rep]
+    itet = np.where(mesh.itet >= 0,node_map[np.maximum(mesh.itet,0)],-1)
+    node_attrs = OrderedDict()
+    for k,v in mesh.node_attrs.items():
+        v = v[keep]
+        # isn1 holds node numbers of parent/child chains
+        if k == 'isn1':
+            v = np.where(v > 0,node_map[np.maximum(v-1,0)]+1,v)
+        node_attrs[k] = v
+    s = np.sort(itet,axis=1)
+    ok = np.all((s[:,1:] != s[:,:-1]) | (s[:,:-1] < 0),axis=1)
+    elem_attrs = OrderedDict([(k,v[ok]) for k,v in mesh.elem_attrs.items()])
+    return MeshArrays(mesh.xyz[keep],itet[ok],mesh.itettyp[ok],mesh.itetclr[ok],node_attrs,elem_attrs),node_map
+
+def subset_arrays(mesh,nodes,exclusive=True):
+    '''
+    Extract the part of a mesh supported by the selected nodes, following
+    rmpoint semantics for the complement of the selection. Exclusive keeps
+    every element with at least one selected node along with all of its
+    nodes, inclusive keeps only elements whose nodes are all selected.
+    :arg mesh: mesh arrays
+    :type mesh: MeshArrays
+    :arg nodes: indices or boolean mask of the selected nodes
+    :type nodes: array(int) or array(bool)
+    :arg exclusive: rmpoint exclusive (True) or inclusive (False) semantics
+    :type exclusive: bool
+    Returns: (MeshArrays, array(int) kept node indices, array(int) kept element indices)
+    '''
+    sel = np.zeros(mesh.nnodes,dtype=bool)
+    sel[np.asarray(nodes)] = True
+    valid = mesh.itet >= 0
+    hit = np.where(valid,sel[np.maximum(mesh.itet,0)],False)
+    if exclusive:
+        emask = hit.any(axis=1)
+    else:
+        emask = (hit | ~valid).all(axis=1) & valid.any(axis=1)
+    keep = sel.copy()
+    if exclusive:
+        itet = mesh.itet[emask]
+        keep[itet[itet >= 0]] = True
+    kn = np.flatnonzero(keep)
+    ke = np.flatnonzero(emask)
+    return _gather(mesh,kn,ke),kn,ke
+
+def _gather(mesh,kn,ke):
+    '''
+    Mesh of the kept nodes kn and elements ke, which must only reference
+    kept nodes, with the connectivity renumbered.
+    '''
+    new = np.full(mesh.nnodes,-1,dtype=np.int64)
+    new[kn] = np.arange(kn.size)
+    itet = mesh.itet[ke]
+    itet = np.where(itet >= 0,new[np.maximum(itet,0)],-1)
+    node_attrs = OrderedDict()
+    for k,v in mesh.node_attrs.items():
+        v = v[kn]
+        # isn1 holds node numbers of parent/child chains
+        if k == 'isn1':
+            v = np.where(v > 0,np.maximum(new[np.maximum(v-1,0)]+1,0),v)
+        node_attrs[k] = v
+    elem_attrs = OrderedDict((k,v[ke]) for k,v in mesh.elem_attrs.items())
+    return MeshArrays(mesh.xyz[kn],itet,mesh.itettyp[ke],mesh.itetclr[ke],node_attrs,elem_attrs)
+
+def node_graph(mesh):
+    '''
+    Node adjacency graph of the mesh edges in compressed sparse row form,
+    the coupling pattern of FEHM and PFLOTRAN matrices.
+    :arg mesh: mesh arrays
+    :type mesh: MeshArrays
+    Returns: (indptr, indices) with sorted neighbours of each node
+    '''
+    n = mesh.nnodes
+    pairs = []
+    for etype in np.unique(mesh.itettyp):
+        if etype not in elem_edges:
+            continue
+        E = np.array(elem_edges[etype])
+        t = mesh.itet[mesh.itettyp == etype]
+        pairs.append(np.column_stack([t[:,E[:,0]].ravel(),t[:,E[:,1]].ravel()]))
+    if len(pairs):
+        pairs = np.concatenate(pairs)
+    else:
+        pairs = np.zeros((0,2),dtype=np.int64)
+    pairs = pairs[pairs[:,0] != pairs[:,1]]
+    key = np.unique(np.concatenate([pairs[:,0]*n+pairs[:,1],pairs[:,1]*n+pairs[:,0]]))
+    rows,indices = key//n,key%n
+    indptr = np.r_[0,np.cumsum(np.bincount(rows,minlength=n))]
+    return indptr,indices
+
+def _expand(indptr,indices,frontier):
+    '''
+    Neighbours of the frontier nodes and the frontier position each came from.
+    '''
+    counts = indptr[frontier+1]-indptr[frontier]
+    nbrs = indices[_concat_ranges(indptr[frontier],indptr[frontier+1])]
+    return nbrs,np.repeat(np.arange(frontier.size),counts)
+
+def _bfs_levels(indptr,indices,start):
+    '''
+    Breadth first level structure rooted at start.
+    '''
+    levels = [np.array([start])]
+    seen = np.zeros(indptr.size-1,dtype=bool)
+    seen[start] = True
+    while True:
+        nbrs = np.unique(_expand(indptr,indices,levels[-1])[0])
+        nbrs = nbrs[~seen[nbrs]]
+        if nbrs.size == 0:
+            return levels
+        seen[nbrs] = True
+        levels.append(nbrs)
+
+def rcm_order(indptr,indices):
+    '''
+    Reverse Cuthill-McKee ordering of a graph. Each connected component is
+    started from a pseudo-peripheral node of minimum degree and the
+    neighbours of each level are numbered in order of their parent and by
+    increasing degree. Isolated nodes are numbered last.
+    :arg indptr: row pointers of the adjacency
+    :type indptr: array(int)
+    :arg indices: neighbours of each node
+    :type indices: array(int)
+    Returns: array(int) old node index at each new position
+    '''
+    n = indptr.size-1
+    deg = np.diff(indptr)
+    visited = deg == 0
+    order = []
+    while not visited.all():
+        cand = np.flatnonzero(~visited)
+        root = cand[np.argmin(deg[cand])]
+        levels = _bfs_levels(indptr,indices,root)
+        # George-Liu search for a pseudo-peripheral node
+        for it in range(8):
+            last = levels[-1]
+            x = last[np.argmin(deg[last])]
+            lx = _bfs_levels(indptr,indices,x)
+            if len(lx) <= len(levels):
+                break
+            root,levels = x,lx
+        frontier = np.array([root])
+        visited[root] = True
+        order.append(frontier)
+        while frontier.size:
+            nbrs,parent = _expand(indptr,indices,frontier)
+            keep = ~visited[nbrs]
+            nbrs,parent = nbrs[keep],parent[keep]
+            s = np.lexsort((deg[nbrs],parent))
+            nbrs = nbrs[s]
+            first = np.unique(nbrs,return_index=True)[1]
+            frontier = nbrs[np.sort(first)]
+            visited[frontier] = True
+            order.append(frontier)
+    order.append(np.flatnonzero(deg == 0))
+    return np.concatenate(order)[::-1].copy() if n else np.zeros(0,dtype=np.int64)
+
+def _quantize(xyz,bits):
+    '''
+    Integer coordinates on a 2**bits grid spanning the bounding cube.
+    '''
+    xyz = np.asarray(xyz,dtype=float).reshape(-1,3)
+    if xyz.shape[0] == 0:
+        return np.zeros((0,3),dtype=np.uint64)
+    lo = xyz.min(axis=0)
+    span = max(np.ptp(xyz,axis=0).max(),np.finfo(float).tiny)
+    q = np.floor((xyz-lo)/span*((1 << bits)-1)+0.5)
+    return q.astype(np.uint64)
+
+def _interleave(q,bits):
+    '''
+    Morton keys interleaving the bits of the quantized coordinates q
+    '''
+    key = np.zeros(q.shape[0],dtype=np.uint64)
+    one = np.uint64(1)
+    for b in range(bits-1,-1,-1):
+        for i in range(3):
+            key = (key << one) | ((q[:,i] >> np.uint64(b)) & one)
+    return key
+
+def morton_keys(xyz,bits=21):
+    '''
+    Morton (Z-order) keys of points, interleaving the bits of the
+    quantized coordinates.
+    :arg xyz: point coordinates
+    :type xyz: array(float), n x 3
+    :arg bits: bits per coordinate, at most 21
+    :type bits: int
+    Returns: array(uint64)
+    '''
+    return _interleave(_quantize(xyz,bits),bits)
+
+def hilbert_keys(xyz,bits=21):
+    '''
+    Hilbert curve keys of points, using Skilling's transpose algorithm
+    on the quantized coordinates.
+    :arg xyz: point coordinates
+    :type xyz: array(float), n x 3
+    :arg bits: bits per coordinate, at most 21
+    :type bits: int
+    Returns: array(uint64)
+    '''
+    X = _quantize(xyz,bits)
+    Q = 1 << (bits-1)
+    while Q > 1:
+        P,Qu = np.uint64(Q-1),np.uint64(Q)
+        for i in range(3):
+            hit = (X[:,i] & Qu) != 0
+            t = np.where(hit,np.uint64(0),(X[:,0] ^ X[:,i]) & P)
+            X[:,0] ^= np.where(hit,P,t)
+            if i:
+                X[:,i] ^= t
+        Q >>= 1
+    for i in range(1,3):
+        X[:,i] ^= X[:,i-1]
+    t = np.zeros(X.shape[0],dtype=np.uint64)
+    Q = 1 << (bits-1)
+    while Q > 1:
+        t[(X[:,2] & np.uint64(Q)) != 0] ^= np.uint64(Q-1)
+        Q >>= 1
+    X ^= t[:,None]
+    return _interleave(X,bits)
+
+def nested_dissection_order(xyz,indptr,indices,leaf=64):
+    '''
+    Geometric nested dissection ordering. Nodes are split recursively at
+    the median of their longest extent, the nodes of the lower half
+    adjacent to the upper half form the separator, and each part is
+    numbered before its separator.
+    :arg xyz: node coordinates
+    :type xyz: array(float), nnodes x 3
+    :arg indptr: row pointers of the adjacency
+    :type indptr: array(int)
+    :arg indices: neighbours of each node
+    :type indices: array(int)
+    :arg leaf: size below which parts are not split
+    :type leaf: int
+    Returns: array(int) old node index at each new position
+    '''
+    side = np.zeros(indptr.size-1,dtype=np.int8)
+    def dissect(ids):
+        '''
+        Recursive coordinate bisection of the nodes ids, returned as parts
+        ordered with the separators of each split last
+        '''
+        if ids.size <= leaf:
+            return [ids]
+        X = xyz[ids]
+        axis = np.argmax(np.ptp(X,axis=0))
+        s = np.argsort(X[:,axis],kind='mergesort')
+        lower,upper = ids[s[:ids.size//2]],ids[s[ids.size//2:]]
+        side[upper] = 1
+        nbrs,parent = _expand(indptr,indices,lower)
+        sep = np.zeros(lower.size,dtype=bool)
+        sep[parent[side[nbrs] == 1]] = True
+        side[upper] = 0
+        return dissect(lower[~sep])+dissect(upper)+[lower[sep]]
+    return np.concatenate(dissect(np.arange(indptr.size-1)))
+
+def bandwidth_profile(indptr,indices,order=None):
+    '''
+    Bandwidth and profile of the adjacency matrix of a graph whose nodes
+    are numbered in the given order.
+    :arg indptr: row pointers of the adjacency
+    :type indptr: array(int)
+    :arg indices: neighbours of each node
+    :type indices: array(int)
+    :arg order: old node index at each new position, identity if None
+    :type order: array(int)
+    Returns: OrderedDict with bandwidth and profile
+    '''
+    n = indptr.size-1
+    new = np.arange(n)
+    if order is not None:
+        new[np.asarray(order)] = np.arange(n)
+    i = new[np.repeat(np.arange(n),np.diff(indptr))]
+    j = new[indices]
+    first = np.arange(n)
+    np.minimum.at(first,i,j)
+    return OrderedDict([('bandwidth',int(np.abs(i-j).max()) if i.size else 0),
+                        ('profile',int((np.arange(n)-first).sum()))])
+
+def node_order(mesh,method='rcm',graph=None,bits=21):
+    '''
+    New node order of a mesh.
+    :arg mesh: mesh arrays
+    :type mesh: MeshArrays
+    :arg method: 'rcm' (reverse Cuthill-McKee), 'hilbert', 'morton' or 'nd' (nested dissection)
+    :type method: str
+    :arg graph: (indptr, indices) node adjacency, computed with node_graph if None
+    :type graph: tuple(array(int))
+    :arg bits: bits per coordinate of the space filling curve keys
+    :type bits: int
+    Returns: array(int) old node index at each new position
+    '''
+    if method == 'hilbert':
+        return np.argsort(hilbert_keys(mesh.xyz,bits),kind='mergesort')
+    if method == 'morton':
+        return np.argsort(morton_keys(mesh.xyz,bits),kind='mergesort')
+    if graph is None:
+        graph = node_graph(mesh)
+    if method == 'rcm':
+        return rcm_order(*graph)
+    if method == 'nd':
+        return nested_dissection_order(mesh.xyz,*graph)
+    raise ValueError("method must be one of 'rcm', 'hilbert', 'morton' or 'nd'")
+
+def element_order(mesh,method='hilbert',by_material=True,bits=21):
+    '''
+    New element order of a mesh from the element centroids.
+    :arg mesh: mesh arrays
+    :type mesh: MeshArrays
+    :arg method: 'hilbert' or 'morton' space filling curve, or 'median' to sort on z, y, x of the centroids as sort/index on zmed ymed xmed
+    :type method: str
+    :arg by_material: group the elements by itetclr first
+    :type by_material: bool
+    :arg bits: bits per coordinate of the space filling curve keys
+    :type bits: int
+    Returns: array(int) old element index at each new position
+    '''
+    c = mesh.centroids
+    if method == 'hilbert':
+        keys = [hilbert_keys(c,bits)]
+    elif method == 'morton':
+        keys = [morton_keys(c,bits)]
+    elif method == 'median':
+        keys = [c[:,0],c[:,1],c[:,2]]
+    else:
+        raise ValueError("method must be one of 'hilbert', 'morton' or 'median'")
+    if by_material:
+        keys.append(mesh.itetclr)
+    return np.lexsort(keys)
+
+def partition_geometric(points,nparts):
+    '''
+    Recursive coordinate bisection of points into parts of equal size.
+    Each set is split across its longest extent, in proportion to the
+    number of parts on each side.
+    :arg points: point coordinates, usually element centroids
+    :type points: array(float), n x 3
+    :arg nparts: number of parts
+    :type nparts: int
+    Returns: array(int) zero-based part of each point
+    '''
+    points = np.asarray(points,dtype=float).reshape(-1,3)
+    parts = np.zeros(points.shape[0],dtype=np.int64)
+    stack = [(np.arange(points.shape[0]),0,int(nparts))]
+    while stack:
+        ids,first,k = stack.pop()
+        if k <= 1 or ids.size == 0:
+            parts[ids] = first
+            continue
+        kl = k//2
+        X = points[ids]
+        axis = np.argmax(np.ptp(X,axis=0))
+        nl = int(round(ids.size*kl/float(k)))
+        s = np.argsort(X[:,axis],kind='mergesort')
+        stack.append((ids[s[:nl]],first,kl))
+        stack.append((ids[s[nl:]],first+kl,k-kl))
+    return parts
+
+def partition_arrays(mesh,parts,part,nghost=1):
+    '''
+    Mesh of the elements of one part and nghost layers of ghost elements
+    sharing a node with the layer inside them. The element attribute
+    ighost holds 0 for owned elements and the layer of ghost elements, and
+    the global one-based numbers of nodes and elements are stored in
+    inode_global and ielem_global.
+    :arg mesh: mesh arrays
+    :type mesh: MeshArrays
+    :arg parts: part of each element
+    :type parts: array(int)
+    :arg part: part to extract
+    :type part: int
+    :arg nghost: number of ghost layers
+    :type nghost: int
+    Returns: MeshArrays
+    '''
+    sel = np.asarray(parts) == part
+    level = np.where(sel,0,-1)
+    valid = mesh.itet >= 0
+    for k in range(1,nghost+1):
+        touched = np.zeros(mesh.nnodes,dtype=bool)
+        t = mesh.itet[sel]
+        touched[t[t >= 0]] = True
+        layer = np.where(valid,touched[np.maximum(mesh.itet,0)],False).any(axis=1) & ~sel
+        if not layer.any():
+            break
+        level[layer] = k
+        sel |= layer
+    ke = np.flatnonzero(sel)
+    t = mesh.itet[ke]
+    kn = np.unique(t[t >= 0])
+    sub = _gather(mesh,kn,ke)
+    sub.node_attrs['inode_global'] = kn+1
+    sub.elem_attrs['ielem_global'] = ke+1
+    sub.elem_attrs['ighost'] = level[ke]
+    return sub
+
+def circumspheres(X):
+    '''
+    Circumscribed spheres of tetrahedra. Degenerate tetrahedra have
+    infinite radius.
+    :arg X: vertex coordinates of each tetrahedron
+    :type X: array(float), ntets x 4 x 3
+    Returns: (array(float) centers, array(float) radii)
+    '''
+    a,b,c = X[:,1]-X[:,0],X[:,2]-X[:,0],X[:,3]-X[:,0]
+    det = np.sum(a*np.cross(b,c),axis=1)
+    num = (np.sum(a*a,axis=1)[:,None]*np.cross(b,c)+np.sum(b*b,axis=1)[:,None]*np.cross(c,a)+
+           np.sum(c*c,axis=1)[:,None]*np.cross(a,b))
+    with np.errstate(divide='ignore',invalid='ignore'):
+        d = num/(2.*det[:,None])
+    r = np.linalg.norm(d,axis=1)
+    r[~np.isfinite(r)] = np.inf
+    return X[:,0]+d,r
+
+def block_owner(points,lo,size,nblocks):
+    '''
+    Block of a regular grid of blocks containing each point, points outside
+    the grid are assigned to the nearest block.
+    :arg points: point coordinates
+    :type points: array(float), n x 3
+    :arg lo: grid origin
+    :type lo: array(float)
+    :arg size: block size along each axis
+    :type size: array(float)
+    :arg nblocks: number of blocks along each axis
+    :type nblocks: array(int)
+    Returns: array(int) flat block index, x varying slowest
+    '''
+    nb = np.asarray(nblocks)
+    with np.errstate(invalid='ignore'):
+        q = np.floor((np.nan_to_num(points)-lo)/size)
+    q = np.clip(q,0,nb-1).astype(np.int64)
+    return (q[:,0]*nb[1]+q[:,1])*nb[2]+q[:,2]
+
+def delaunay_check(xyz,tets,check=None,sample=10000,rtol=1.e-8,index=None,seed=0):
+    '''
+    Check a tetrahedral mesh against the Delaunay criterion. The
+    circumsphere of each checked tetrahedron must not contain any point,
+    which is tested exactly with a nearest point query on its center. The
+    tetrahedra in check and a random sample of the others are tested.
+    Faces shared by more than two tetrahedra, which indicate overlapping
+    elements, are counted over the whole mesh, and so are faces used by a
+    single tetrahedron that are not on the convex hull of the points,
+    which indicate holes such as missing elements along a seam.
+    :arg xyz: node coordinates
+    :type xyz: array(float), nnodes x 3
+    :arg tets: tetrahedra
+    :type tets: array(int), ntets x 4
+    :arg check: boolean mask of tetrahedra that are always tested
+    :type check: array(bool)
+    :arg sample: number of other tetrahedra tested
+    :type sample: int
+    :arg rtol: tolerance relative to the circumradius, and to the extent of the points for the convex hull
+    :type rtol: float
+    :arg index: spatial index of xyz
+    :type index: GridIndex
+    :arg seed: random seed of the sample
+    :type seed: int
+    Returns: OrderedDict with the number of tetrahedra checked, the number
+    and indices of violations, the largest violation relative to the
+    circumradius, the number of overlapping faces and the number of hole
+    faces
+    '''
+    tets = np.asarray(tets)
+    if check is None:
+        check = np.zeros(tets.shape[0],dtype=bool)
+    rest = np.flatnonzero(~check)
+    rng = np.random.RandomState(seed)
+    if rest.size > sample:
+        rest = rng.choice(rest,sample,replace=False)
+    ids = np.union1d(np.flatnonzero(check),rest)
+    c,r = circumspheres(xyz[tets[ids]])
+    if index is None:
+        index = GridIndex(xyz)
+    ok = np.isfinite(r)
+    d = np.full(ids.size,np.inf)
+    d[ok] = index.nearest(c[ok])[1]
+    with np.errstate(invalid='ignore'):
+        depth = np.where(ok,(r-d)/r,0.)
+    bad = depth > rtol
+    # Face k of a tetrahedron leaves out its node k
+    faces = tets[:,[[1,2,3],[0,2,3],[0,1,3],[0,1,2]]].reshape(-1,3)
+    first,counts = np.unique(np.sort(faces,axis=1),axis=0,return_index=True,return_counts=True)[1:]
+    single = first[counts == 1]
+    holes = _hole_faces(xyz,faces[single],tets.reshape(-1)[single],rtol)
+    return OrderedDict([('checked',int(ids.size)),('violations',int(bad.sum())),('violating',ids[bad]),
+                        ('max_violation',float(depth.max()) if ids.size else 0.),
+                        ('overlapping_faces',int((counts > 2).sum())),('hole_faces',holes)])
+
+def _hole_faces(xyz,faces,opposite,rtol):
+    '''
+    Number of boundary faces that are not on the convex hull of their
+    nodes. A face is on the hull when no boundary node lies beyond its
+    plane, with the normal pointing away from the opposite node of its
+    tetrahedron.
+    '''
+    if len(faces) == 0:
+        return 0
+    xyz = np.asarray(xyz,dtype=float)
+    a = xyz[faces[:,0]]
+    n = np.cross(xyz[faces[:,1]]-a,xyz[faces[:,2]]-a)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        n /= np.linalg.norm(n,axis=1)[:,None]
+    n *= np.sign(np.einsum('ij,ij->i',n,a-xyz[opposite]))[:,None]
+    ok = np.all(np.isfinite(n),axis=1)
+    pts = xyz[np.unique(faces)]
+    tol = rtol*max(np.ptp(pts,axis=0).max(),np.finfo(float).tiny)
+    # Coplanar faces share a normal, the support of the points is found
+    # once per direction
+    u,inv = np.unique(np.round(n[ok],12),axis=0,return_inverse=True)
+    inv = inv.reshape(-1)
+    h = np.empty(len(u))
+    step = max(1,(1<<22)//len(pts))
+    for i in range(0,len(u),step):
+        h[i:i+step] = np.dot(u[i:i+step],pts.T).max(axis=1)
+    return int((np.einsum('ij,ij->i',u[inv],a[ok]) < h[inv]-tol).sum())
+
+
+def read_sheet(filename,NXY,file_type='ascii',flip='none',skip_lines=0,data_type='float',window=None):
+    '''
+    Read an elevation file of the kind read by read/sheetij. Binary files
+    are memory mapped and ascii files are read in blocks of lines, keeping
+    only the values of the window, so tiles can be cut without loading the
+    raster.
+    :arg filename: elevation file, values with x varying fastest
+    :type filename: str
+    :arg NXY: [nx, ny] number of columns and rows
+    :type NXY: list(int)
+    :arg file_type: 'ascii' or 'binary'
+    :type file_type: str
+    :arg flip: 'x', 'y', 'xy' or 'none' to reflect the raster as read/sheetij does
+    :type flip: str
+    :arg skip_lines: number of header lines of ascii files
+    :type skip_lines: int
+    :arg data_type: 'float' or 'double' values of binary files
+    :type data_type: str
+    :arg window: ((first row, end row), (first column, end column)) of the reflected raster, all of it if None
+    :type window: tuple
+    Returns: array(float), rows x columns of the window, row j at y = miny+j*dy
+    '''
+    nx,ny = [int(v) for v in NXY]
+    (r0,r1),(c0,c1) = window if window is not None else ((0,ny),(0,nx))
+    # Rows and columns of the window in the file
+    if 'y' in flip:
+        r0,r1 = ny-r1,ny-r0
+    if 'x' in flip:
+        c0,c1 = nx-c1,nx-c0
+    if file_type == 'binary':
+        z = np.memmap(filename,dtype=np.float32 if data_type == 'float' else np.float64,mode='r',shape=(ny,nx))
+        z = z[r0:r1,c0:c1]
+    else:
+        with open(filename) as fh:
+            for i in range(skip_lines):
+                fh.readline()
+            z = _read_ascii_rows(fh,nx,r0,r1)[:,c0:c1]
+    if 'x' in flip:
+        z = z[:,::-1]
+    if 'y' in flip:
+        z = z[::-1,:]
+    return z
+
+def _read_ascii_rows(fh,nx,r0,r1,block=1<<22):
+    '''
+    Rows r0 to r1-1 of an ascii raster of nx columns, read in blocks of
+    about block bytes and stopping after the last row.
+    '''
+    start,stop = r0*nx,r1*nx
+    z = np.empty(stop-start)
+    pos,n = 0,0
+    while pos < stop:
+        lines = fh.readlines(block)
+        if not lines:
+            break
+        words = ' '.join(lines).split()
+        lo,hi = max(start-pos,0),min(stop-pos,len(words))
+        if hi > lo:
+            z[n:n+hi-lo] = np.array(words[lo:hi],dtype=float)
+            n += hi-lo
+        pos += len(words)
+    if n < z.size:
+        raise ValueError('%s ends before row %d of the raster'%(getattr(fh,'name','file'),r1))
+    return z.reshape(r1-r0,nx)
+
+def tile_ranges(n,ntiles):
+    '''
+    Split n grid lines into ntiles ranges sharing their boundary line.
+    :arg n: number of grid lines
+    :type n: int
+    :arg ntiles: number of tiles
+    :type ntiles: int
+    Returns: list of (first, last) inclusive line indices
+    '''
+    edges = np.unique(np.round(np.linspace(0,n-1,max(min(ntiles,n-1),1)+1)).astype(int))
+    return list(zip(edges[:-1],edges[1:]))
@@ -174,6 +174,20 @@ class TestPyLaGriT(unittest.TestCase):
             
         if any([not isinstance(x, pylagrit.MO) for x in mo_subs]):
             raise ValueError('MO not returned.')
+
+    def test_compare(self):
+        '''
+        Test the Compare Function
+
+        Tests that a mesh read into LaGriT compares equal to its source file.
+        '''
+
+        lg = self.lg
+        with suppress_stdout():
+            mo = lg.read('contour_file.avs')
+            report = pylagrit.compare(mo, 'contour_file.avs')
+        if not report['equal']:
+            raise ValueError('Mesh differs from its source file.')
                      
 @contextmanager
 def suppress_stdout():
@@ -198,6 +212,7 @@ if __name__ == '__main__':
     suite.addTest(TestPyLaGriT('test_copy'))
     suite.addTest(TestPyLaGriT('test_pset_not'))
     suite.addTest(TestPyLaGriT('test_subset'))
+    suite.addTest(TestPyLaGriT('test_compare'))
     runner.run(suite)
     
     
@@ -0,0 +1,456 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import warnings
+from collections import OrderedDict
+import numpy
+from pylagrit import PyLaGriT
+from pylagrit import utilities as util
+
+class StubLaGriT(PyLaGriT):
+    '''
+    Session that keeps its meshes as arrays instead of running LaGriT.
+
+    Only the commands used by the array transfers are understood: read and
+    dump of AVS files, addmesh/merge, cmo/release, cmo/readatt,
+    pset/attribute, eltset definitions by attribute value and
+    eltset/write. Every command is recorded in self.log.
+    '''
+
+    def __init__(self):
+        self.verbose = False
+        self.mo = {}
+        self.batch = False
+        self._ncmd = 0
+        self._interp_cache = OrderedDict()
+        self.encoding = None
+        self.linesep = b'\n'
+        self.before = b''
+        self.meshes = {}
+        self.psets = {}
+        self.eltsets = {}
+        self.log = []
+
+    def expect(self,expectstr='Enter a command',timeout=None):
+        pass
+
+    def send(self,s):
+        cmd = s.decode().strip()
+        self.log.append(cmd)
+        if cmd.startswith('cmo select'):
+            self.selected = cmd.split()[-1]
+            return len(s)
+        words = cmd.split('/')
+        if words[0] == 'read':
+            self.meshes[words[-1]] = util.read_avs(words[-2])
+        elif words[:2] == ['dump','avs']:
+            util.write_avs(words[2],self.meshes[words[3]])
+        elif words[:2] == ['addmesh','merge']:
+            self.meshes[words[2]] = util.merge_arrays([self.meshes[words[3]],self.meshes[words[4]]])
+        elif words[:2] == ['cmo','release']:
+            del self.meshes[words[2]]
+        elif words[:2] == ['cmo','readatt']:
+            mesh = self.meshes[words[2]]
+            vals = numpy.loadtxt(words[-1],ndmin=2)
+            atts = OrderedDict(mesh.node_attrs)
+            for i,k in enumerate(words[3].split(',')):
+                atts[k] = vals[:,i]
+            self.meshes[words[2]] = util.MeshArrays(mesh.xyz,mesh.itet,mesh.itettyp,mesh.itetclr,
+                                                    atts,mesh.elem_attrs)
+        elif words[0] == 'pset' and words[2] == 'attribute':
+            mesh = self.meshes[self.selected]
+            self.psets[words[1]] = numpy.flatnonzero(mesh.node_attrs[words[3]] == 1)
+        elif words[0] == 'eltset' and words[2] == 'write':
+            with open(words[3]+'.cellset','w') as fh:
+                fh.write(words[1]+'\nascii\n')
+                fh.write('\n'.join([str(i+1) for i in self.eltsets[words[1]]])+'\n')
+        elif words[0] == 'eltset' and words[3] == 'eq':
+            mesh = self.meshes[self.selected]
+            att = mesh.itetclr if words[2] == 'itetclr' else mesh.elem_attrs[words[2]]
+            self.eltsets[words[1]] = numpy.flatnonzero(att == float(words[4]))
+        return len(s)
+
+    def dumps(self):
+        return [c for c in self.log if c.startswith('dump')]
+
+# Stand-in LaGriT executable: answers each command with the prompt, writes
+# the outx3dgen and logx3dgen logs and the files of dump commands, and
+# reports an error when an input file holds the word BAD.
+FAKE_LAGRIT = '''#!%s
+import os
+import sys
+for log in ('outx3dgen','logx3dgen'): open(log,'w').close()
+suffixes = {'fehm':['.fehmn','_material.zone','_outside.zone','.stor'],'pflotran':['.uge']}
+names = []
+while True:
+    sys.stdout.write('Enter a command\\n')
+    sys.stdout.flush()
+    line = sys.stdin.readline()
+    if not line: break
+    words = line.strip().split('/')
+    if words[0] == 'read':
+        filename = [w for w in words[1:] if os.path.isfile(w)][0]
+        with open(filename) as fh: text = fh.read()
+        if 'BAD' in text: sys.stdout.write(' ERROR: cannot read '+words[1]+'\\n')
+        elif filename.endswith('.lg'): names.append(text)
+    elif words[0] == 'cmo' and words[1] == 'status':
+        for name in names: sys.stdout.write(' Mesh Object name: '+name+'\\n')
+    elif words[0] == 'dump':
+        format,root = words[1],words[2]
+        if format == 'lagrit':
+            with open(root,'w') as fh: fh.write(words[3])
+        for f in [root+sfx for sfx in suffixes.get(format,[''])]: open(f,'w').close()
+'''
+
+def brick(n,atts=None):
+    #Utility to build a unit cube of n x n x n hex elements.
+    g = numpy.linspace(0.,1.,n+1)
+    z,y,x = numpy.meshgrid(g,g,g,indexing='ij')
+    xyz = numpy.column_stack([x.ravel(),y.ravel(),z.ravel()])
+    i,j,k = [v.ravel() for v in numpy.meshgrid(range(n),range(n),range(n),indexing='ij')]
+    base = i*(n+1)**2+j*(n+1)+k
+    dx,dy,dz = 1,n+1,(n+1)**2
+    itet = numpy.column_stack([base,base+dx,base+dx+dy,base+dy,
+                               base+dz,base+dz+dx,base+dz+dx+dy,base+dz+dy])
+    return util.MeshArrays(xyz,itet,'hex',numpy.ones(len(itet),dtype=int),atts or {},{})
+
+class TestSession(unittest.TestCase):
+    '''
+    PyLaGriT Session Test
+
+    Represents a test of the session side of PyLaGriT, the mesh array
+    caches and local psets, against a stub session without LaGriT.
+    '''
+
+    def setUp(self):
+        #Sets up a stub session in a scratch directory.
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        self.lg = StubLaGriT()
+        fine = brick(4)
+        self.src = self.lg.from_arrays(util.MeshArrays(fine.xyz,fine.itet,'hex',fine.itetclr,
+                                                       {'perm':fine.xyz[:,0]+1.,'poro':fine.xyz[:,2]},{}),name='src')
+        self.sink = self.lg.from_arrays(brick(2),name='sink')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def test_arrays_cache(self):
+        '''
+        Test the Mesh Array Cache
+
+        Tests that reading the arrays of one mesh object keeps the cache of
+        another valid, and that other commands invalidate both.
+        '''
+
+        lg = self.lg
+        a = self.src.arrays()
+        b = self.sink.arrays()
+        self.assertEqual(len(lg.dumps()),2)
+        self.assertIs(self.src.arrays(),a)
+        self.assertIs(self.sink.arrays(),b)
+        self.assertEqual(len(lg.dumps()),2)
+        self.sink.sendline('cmo/setatt/sink/imt/1,0,0/2')
+        self.assertIsNot(self.src.arrays(),a)
+        self.assertIsNot(self.sink.arrays(),b)
+        self.assertEqual(len(lg.dumps()),4)
+
+    def test_interpolate_cached(self):
+        '''
+        Test the Cached Interpolation
+
+        Tests that the arrays are dumped once and that a repeated call with
+        the map cached issues no dump.
+        '''
+
+        lg = self.lg
+        self.sink.interpolate_cached('continuous',['perm','poro'],self.src)
+        self.assertEqual(len(lg.dumps()),2)
+        sink = lg.meshes['sink']
+        self.assertTrue(numpy.allclose(sink.node_attrs['perm'],sink.xyz[:,0]+1.))
+        self.assertTrue(numpy.allclose(sink.node_attrs['poro'],sink.xyz[:,2]))
+        self.sink.interpolate_cached('voronoi',['perm','poro'],self.src)
+        self.sink.interpolate_cached('voronoi',['perm'],self.src,['poro'])
+        self.assertEqual(len(lg.dumps()),2)
+        self.assertEqual(len(lg._interp_cache),2)
+        self.assertTrue(numpy.allclose(lg.meshes['sink'].node_attrs['perm'],sink.xyz[:,2]))
+
+    def test_upscale_cached(self):
+        '''
+        Test the Cached Upscaling
+
+        Tests that the arrays are dumped once and that repeated upscales
+        against the same geometry issue no dump.
+        '''
+
+        lg = self.lg
+        self.sink.upscale_cached('ariave','kave',self.src,'perm')
+        self.assertEqual(len(lg.dumps()),2)
+        self.sink.upscale_cached(['max','min'],['kmax','kmin'],self.src,['perm','perm'])
+        self.assertEqual(len(lg.dumps()),2)
+        sink = lg.meshes['sink']
+        self.assertTrue(numpy.all(sink.node_attrs['kmin'] <= sink.node_attrs['kave']))
+        self.assertTrue(numpy.all(sink.node_attrs['kave'] <= sink.node_attrs['kmax']))
+
+    def test_local_psets(self):
+        '''
+        Test the Local PSets
+
+        Tests that locally evaluated psets, and booleans of them, are
+        defined in LaGriT in one transfer before the next command, with the
+        nodes selected by a brute force loop.
+        '''
+
+        lg = self.lg
+        m = self.src
+        m.local_psets = True
+        xyz = m.arrays().xyz
+        p1 = m.pset_geom((0.,0.,0.),(0.5,0.5,1.))
+        p2 = m.pset_geom((0.,0.,0.25),(0.5,180.,1.),ctr=(0.5,0.5,0.),geom='rtz')
+        p3 = m.pset_bool([p1,p2],boolean='inter')
+        p4 = m.pset_bool([p1,p2],boolean='not')
+        p5 = m.pset_bool(p1,boolean='not')
+        nlog = len(lg.log)
+        self.assertFalse([c for c in lg.log if c.startswith('pset')])
+        m.sendline('cmo/setatt/src/imt/1,0,0/2')
+        cmds = lg.log[nlog:]
+        self.assertTrue(cmds[1].startswith('cmo/readatt/src/'))
+        self.assertEqual([c.split('/')[1] for c in cmds if c.startswith('pset')],
+                         [p1.name,p2.name,p3.name,p4.name,p5.name])
+        self.assertEqual(cmds[-1],'cmo/setatt/src/imt/1,0,0/2')
+        in1 = [i for i,p in enumerate(xyz) if numpy.all(p <= [0.5,0.5,1.])]
+        in2 = [i for i,p in enumerate(xyz)
+               if numpy.hypot(p[0]-0.5,p[1]-0.5) <= 0.5 and p[2] >= 0.25 and
+               (p[0] == 0.5 and p[1] == 0.5 or 0. <= numpy.degrees(numpy.arctan2(p[1]-0.5,p[0]-0.5)) <= 180.)]
+        self.assertEqual(list(lg.psets[p1.name]),in1)
+        self.assertEqual(list(lg.psets[p2.name]),in2)
+        self.assertEqual(list(lg.psets[p3.name]),sorted(set(in1)&set(in2)))
+        self.assertEqual(list(lg.psets[p4.name]),sorted(set(in1)-set(in2)))
+        self.assertEqual(list(lg.psets[p5.name]),sorted(set(range(len(xyz)))-set(in1)))
+        self.assertFalse(m._local_pset)
+
+    def test_boundary_facesets(self):
+        '''
+        Test the Boundary Facesets
+
+        Tests that surface faces are written to the faceset of their side or
+        label, that faces between sides and degenerate faces are left out
+        and get a zero normal, and that stacked layers use layertyp.
+        '''
+
+        lg = self.lg
+        xyz = numpy.array([[0.,0.,0.],[1.,0.,0.],[0.,1.,0.],[1.,1.,0.],
+                           [0.,0.,1.],[1.,0.,1.],[0.,1.,1.],[1.,1.,1.]])
+        quads = numpy.array([[0,2,3,1],[4,5,7,6],[1,3,7,5],[2,6,7,3],[0,4,6,2],[0,1,5,4],
+                             [0,1,7,6],[0,0,0,0]])
+        surf = util.MeshArrays(xyz,quads,'quad',numpy.ones(len(quads),dtype=int),
+                               {'layertyp':numpy.array([-1,-1,-1,-1,-2,-2,-2,-2])},
+                               {'idelem1':numpy.arange(1,9),'idface1':numpy.array([1,2,3,4,5,6,1,2])})
+        self.src.extract_surfmesh = lambda reorder=False,external=True: lg.from_arrays(surf,name='surf')
+        def faces(fs):
+            #Utility to read the idelem1 and idface1 columns of a faceset file.
+            return numpy.loadtxt(fs.filename,skiprows=4,ndmin=2).astype(int).tolist()
+        fs = self.src.create_boundary_facesets(base_name='fs')
+        self.assertEqual(list(fs.keys()),['bottom','top','right','back','left','front'])
+        self.assertEqual([faces(f) for f in fs.values()],[[[i,i]] for i in range(1,7)])
+        normals = []
+        def slanted(c,n,s):
+            normals.append(n)
+            return numpy.abs(n[:,2]-numpy.sqrt(0.5)) < 1.e-8
+        labels = OrderedDict([('slanted',slanted),('none',0),('top',2)])
+        fs = self.src.create_boundary_facesets(base_name='fs',labels=labels)
+        self.assertEqual(faces(fs['slanted']),[[7,1]])
+        self.assertEqual(faces(fs['none']),[[7,1],[8,2]])
+        self.assertEqual(faces(fs['top']),[[2,2]])
+        self.assertTrue(numpy.all(numpy.isfinite(normals[0])))
+        self.assertTrue(numpy.allclose(normals[0][7],0.))
+        fs = self.src.create_boundary_facesets(stacked_layers=True,base_name='fs')
+        self.assertEqual(faces(fs['bottom']),[[1,1],[8,2]])
+        self.assertEqual(faces(fs['top']),[[2,2]])
+        self.assertEqual(faces(fs['left']),[[5,5]])
+
+    def test_create_faceset(self):
+        '''
+        Test the Eltset Faceset
+
+        Tests that the faceset of an eltset on a surface mesh holds the
+        idelem1 and idface1 of its faces in the dump/avs2 format and that a
+        mesh without these attributes is rejected.
+        '''
+
+        lg = self.lg
+        xyz = numpy.array([[0.,0.,0.],[1.,0.,0.],[1.,1.,0.],[0.,1.,0.]])
+        tris = numpy.array([[0,1,2],[0,2,3],[0,1,2],[0,2,3],[0,1,2]])
+        surf = lg.from_arrays(util.MeshArrays(xyz,tris,'tri',numpy.array([1,2,2,1,2]),{},
+                                              {'idelem1':numpy.array([3,17,120,5,9]),
+                                               'idface1':numpy.array([1,4,2,3,6])}),name='surf')
+        fs = surf.eltset_attribute('itetclr',2).create_faceset('fs.avs')
+        self.assertEqual(fs.filename,'fs.avs')
+        with open('fs.avs') as fh:
+            lines = fh.read().splitlines()
+        self.assertEqual(lines,['         0          0          0          2          0 ',
+                                '00002  1  1','idelem1, integer ','idface1, integer ',
+                                '   17   4','  120   2','    9   6'])
+        mesh = util.read_avs('fs.avs')
+        self.assertEqual(list(mesh.elem_attrs['idelem1']),[17,120,9])
+        self.assertEqual(list(mesh.elem_attrs['idface1']),[4,2,6])
+        self.assertRaises(ValueError,self.sink.eltset_attribute('itetclr',1).create_faceset)
+
+    def test_merge(self):
+        '''
+        Test the Mesh Merge
+
+        Tests that the tree method merges meshes pairwise in order,
+        releasing the intermediate meshes, and that the arrays method gives
+        the same mesh in one transfer.
+        '''
+
+        lg = self.lg
+        mos = [self.sink]+[lg.from_arrays(util.MeshArrays(brick(1).xyz+i,brick(1).itet,'hex',
+                                                          numpy.ones(1,dtype=int)*i,{},{}),name='b'+str(i))
+                           for i in range(1,5)]
+        meshes = [m.arrays() for m in mos]
+        nlog = len(lg.log)
+        tree = lg.merge(mos,name='tree')
+        merges = [c for c in lg.log[nlog:] if c.startswith('addmesh')]
+        self.assertEqual(len(merges),4)
+        self.assertEqual([c.split('/')[3:] for c in merges][:2],[['sink','b1'],['b2','b3']])
+        self.assertEqual(merges[-1].split('/')[2],'tree')
+        self.assertEqual(len([c for c in lg.log[nlog:] if c.startswith('cmo/release')]),3)
+        self.assertEqual(sorted(lg.meshes.keys()),['b1','b2','b3','b4','sink','src','tree'])
+        expected = util.merge_arrays(meshes)
+        for m in (tree.arrays(),lg.merge(mos,name='flat',method='arrays').arrays()):
+            self.assertTrue(numpy.allclose(m.xyz,expected.xyz))
+            self.assertEqual(m.itet.tolist(),expected.itet.tolist())
+            self.assertEqual(list(m.itetclr),list(expected.itetclr))
+        self.assertRaises(ValueError,lg.merge,mos[:1])
+        self.assertRaises(ValueError,lg.merge,mos,method='abc')
+
+    def test_subset(self):
+        '''
+        Test the Mesh Subset
+
+        Tests that a subset with the arrays method loads only the elements
+        and nodes of the geometry, renumbered, in one transfer without a
+        copy of the mesh, and that subset_nodes follows the inclusive mode.
+        '''
+
+        lg = self.lg
+        mesh = self.src.arrays()
+        nlog = len(lg.log)
+        sub = self.src.subset((0.,0.,0.),(0.25,1.,1.),method='arrays',name='sub')
+        self.assertEqual([c.split('/')[0] for c in lg.log[nlog:] if not c.startswith('cmo select')],['read'])
+        s = sub.arrays()
+        left = mesh.xyz[:,0] <= 0.25
+        ke = [i for i,t in enumerate(mesh.itet) if left[t].any()]
+        kn = numpy.unique(mesh.itet[ke])
+        self.assertEqual((s.nnodes,s.nelems),(len(kn),len(ke)))
+        self.assertEqual(kn[s.itet].tolist(),mesh.itet[ke].tolist())
+        self.assertTrue(numpy.allclose(s.xyz,mesh.xyz[kn]))
+        self.assertTrue(numpy.allclose(s.node_attrs['perm'],mesh.node_attrs['perm'][kn]))
+        s = self.src.subset_nodes(numpy.flatnonzero(left),exclusive=False).arrays()
+        ke = [i for i,t in enumerate(mesh.itet) if left[t].all()]
+        self.assertEqual((s.nnodes,s.nelems),(left.sum(),len(ke)))
+        self.assertEqual(numpy.flatnonzero(left)[s.itet].tolist(),mesh.itet[ke].tolist())
+        self.assertRaises(ValueError,self.src.subset,(0.,0.,0.),(1.,1.,1.),method='abc')
+
+class TestConvert(unittest.TestCase):
+    '''
+    PyLaGriT Conversion Test
+
+    Represents a test of file conversions run by worker sessions of a
+    stand-in LaGriT executable, which writes empty output files.
+    '''
+
+    def setUp(self):
+        #Sets up a session of the stand-in executable and input files.
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        with open('lagrit','w') as fh:
+            fh.write(FAKE_LAGRIT%sys.executable)
+        os.chmod('lagrit',0o755)
+        for f,text in [('out.inp','mesh'),('log.inp','mesh'),('bad.inp','BAD')]:
+            with open(f,'w') as fh:
+                fh.write(text)
+        self.lg = PyLaGriT(lagrit_exe=os.path.abspath('lagrit'),verbose=False)
+
+    def tearDown(self):
+        self.lg.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def test_convert_outputs(self):
+        '''
+        Test the Conversion Outputs
+
+        Tests that only the files written for the new format are collected,
+        not the session logs of inputs named out* or log*.
+        '''
+
+        res = self.lg.convert('out.inp','exo',outdir='exo')
+        self.assertEqual(res[0]['outputs'],[os.path.abspath('exo/out.exo')])
+        self.assertIsNone(res[0]['error'])
+        self.assertEqual(os.listdir('exo'),['out.exo'])
+        res = self.lg.convert('log.inp','fehm',outdir='fehm')
+        files = ['log.fehmn','log_material.zone','log_outside.zone','log.stor']
+        self.assertEqual(res[0]['outputs'],[os.path.abspath('fehm/'+f) for f in files])
+        self.assertEqual(sorted(os.listdir('fehm')),sorted(files))
+
+    def test_convert_errors(self):
+        '''
+        Test the Conversion Errors
+
+        Tests that a failed conversion is reported with the LaGriT error
+        without stopping the others, as a warning or a RuntimeError.
+        '''
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            res = self.lg.convert('*.inp','gmv',outdir='gmv',errors='return')
+        self.assertEqual([os.path.basename(r['file']) for r in res],['bad.inp','log.inp','out.inp'])
+        self.assertIn('ERROR: cannot read',res[0]['error'])
+        self.assertEqual(res[0]['outputs'],[])
+        self.assertEqual([r['error'] for r in res[1:]],[None,None])
+        self.assertEqual(sorted(os.listdir('gmv')),['log.gmv','out.gmv'])
+        self.assertTrue([x for x in w if '1 of 3 conversions failed' in str(x.message)])
+        with self.assertRaises(RuntimeError) as cm:
+            self.lg.convert('bad.inp','gmv',outdir='gmv')
+        self.assertIn('bad.inp: ',str(cm.exception))
+        self.assertRaises(ValueError,self.lg.convert,'out.inp','gmv',errors='abc')
+
+    def test_dump_many(self):
+        '''
+        Test the Concurrent Dumps
+
+        Tests that each format is written by a session reading the
+        snapshot and that only its files are moved to the destination.
+        '''
+
+        m = self.lg.read('out.inp',name='mesh')
+        os.mkdir('dump')
+        files = m.dump_many(OrderedDict([('fehm','dump/out'),('avs','dump/out.inp')]),tmpdir=self.tmp)
+        fehm = ['out.fehmn','out_material.zone','out_outside.zone','out.stor']
+        self.assertEqual(files['fehm'],[os.path.abspath('dump/'+f) for f in fehm])
+        self.assertEqual(files['avs'],[os.path.abspath('dump/out.inp')])
+        self.assertEqual(sorted(os.listdir('dump')),sorted(fehm+['out.inp']))
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner(verbosity=2)
+    suite = unittest.TestSuite()
+    suite.addTest(TestSession('test_arrays_cache'))
+    suite.addTest(TestSession('test_interpolate_cached'))
+    suite.addTest(TestSession('test_upscale_cached'))
+    suite.addTest(TestSession('test_local_psets'))
+    suite.addTest(TestSession('test_boundary_facesets'))
+    suite.addTest(TestSession('test_create_faceset'))
+    suite.addTest(TestSession('test_merge'))
+    suite.addTest(TestSession('test_subset'))
+    suite.addTest(TestConvert('test_convert_outputs'))
+    suite.addTest(TestConvert('test_convert_errors'))
+    suite.addTest(TestConvert('test_dump_many'))
+    runner.run(suite)
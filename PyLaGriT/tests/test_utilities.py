@@ -0,0 +1,629 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+from itertools import product
+import numpy
+from pylagrit import utilities as util
+
+def tet_mesh(xyz,itet,node_attrs=None):
+    #Utility to build tet mesh arrays with one material.
+    return util.MeshArrays(xyz,itet,numpy.array(['tet']*len(itet)),
+                           numpy.ones(len(itet),dtype=int),node_attrs or {},{})
+
+def hex_brick(n):
+    #Utility to build a unit cube of n x n x n hex elements.
+    g = numpy.linspace(0.,1.,n+1)
+    z,y,x = numpy.meshgrid(g,g,g,indexing='ij')
+    xyz = numpy.column_stack([x.ravel(),y.ravel(),z.ravel()])
+    i,j,k = [v.ravel() for v in numpy.meshgrid(range(n),range(n),range(n),indexing='ij')]
+    base = i*(n+1)**2+j*(n+1)+k
+    dx,dy,dz = 1,n+1,(n+1)**2
+    itet = numpy.column_stack([base,base+dx,base+dx+dy,base+dy,
+                               base+dz,base+dz+dx,base+dz+dx+dy,base+dz+dy])
+    return util.MeshArrays(xyz,itet,numpy.array(['hex']*len(itet)),
+                           numpy.ones(len(itet),dtype=int),{},{})
+
+class TestUtilities(unittest.TestCase):
+    '''
+    PyLaGriT Utilities Test
+
+    Represents a test of the numpy mesh utilities, which run without LaGriT.
+    '''
+
+    def setUp(self):
+        #Sets up a random tet mesh to be used during tests.
+        rng = numpy.random.RandomState(0)
+        self.xyz = rng.rand(400,3)*4.
+        self.itet = numpy.arange(400).reshape(-1,4)
+        self.rng = rng
+
+    def test_compare_meshes(self):
+        '''
+        Test the Mesh Comparison
+
+        Tests that a permuted and slightly moved copy of a mesh compares
+        equal, including nodes moved across a cell of the matching grid, and
+        that unmatched nodes are reported without attribute statistics.
+        '''
+
+        a = tet_mesh(self.xyz,self.itet,{'v':self.xyz[:,0].copy()})
+        p = self.rng.permutation(400)
+        inv = numpy.argsort(p)
+        b = tet_mesh(self.xyz[p]+2.e-6,inv[self.itet],{'v':self.xyz[p,0]})
+        report = util.compare_meshes(a,b,rtol=0.,atol=1.e-2)
+        self.assertTrue(report['equal'])
+        self.assertTrue(report['coordinates']['permuted'])
+        self.assertTrue(report['connectivity']['matched'])
+
+        xa = numpy.array([[0.00999999,0.,0.],[1.,1.,1.]])
+        xb = numpy.array([[1.,1.,1.],[0.0100001,0.,0.]])
+        self.assertEqual(list(util._match_nodes(xa,xb,1.e-5)),[1,0])
+
+        c = tet_mesh(self.rng.rand(400,3),self.itet,{'v':self.xyz[:,0].copy()})
+        report = util.compare_meshes(a,c)
+        self.assertFalse(report['equal'])
+        self.assertFalse(report['coordinates']['matched'])
+        self.assertNotIn('max_abs',report['coordinates'])
+        self.assertFalse(report['node_attributes']['v']['matched'])
+
+    def test_element_quality(self):
+        '''
+        Test the Element Quality
+
+        Tests the metrics of regular, inverted and flat tets and of a hex
+        brick against their known values.
+        '''
+
+        x = numpy.array([[0.,0.,0.],[1.,0.,0.],[0.5,3**0.5/2,0.],[0.5,3**0.5/6,(2./3)**0.5],[0.5,0.3,0.]])
+        q = util.element_quality(tet_mesh(x,numpy.array([[0,1,2,3],[0,2,1,3],[0,1,2,4]])))
+        self.assertTrue(numpy.allclose(q['volume'],[2**0.5/12,-2**0.5/12,0.]))
+        self.assertTrue(numpy.allclose(q['aspect_ratio'][:2],1.))
+        self.assertFalse(q['aspect_ratio'][2] > 1.e-6)
+        self.assertTrue(numpy.allclose(q['dihedral_min'][:2],numpy.degrees(numpy.arccos(1./3))))
+        self.assertTrue(numpy.allclose(q['skewness'][:2],0.))
+        q = util.element_quality(hex_brick(2),bins=[0.,0.1,0.2])
+        self.assertTrue(numpy.allclose(q['volume'],0.125))
+        self.assertTrue(numpy.allclose([q['dihedral_min'],q['dihedral_max']],90.))
+        self.assertTrue(numpy.allclose(q['aspect_ratio'],1.))
+        self.assertEqual(list(q['histograms']['volume'][0]),[0,8])
+
+    def test_grid_index(self):
+        '''
+        Test the Grid Index
+
+        Tests box, ball and nearest point queries against brute force.
+        '''
+
+        xyz = self.xyz
+        index = util.GridIndex(xyz)
+        self.assertEqual(len(index),len(xyz))
+        lo,hi = numpy.array([1.,0.5,2.]),numpy.array([2.5,3.,3.5])
+        inside = numpy.flatnonzero(numpy.all((xyz >= lo)&(xyz <= hi),axis=1))
+        self.assertEqual(sorted(index.box(lo,hi)),list(inside))
+        c = numpy.array([2.,2.,2.])
+        near = numpy.flatnonzero(numpy.sum((xyz-c)**2,axis=1) <= 1.)
+        self.assertEqual(sorted(index.ball(c,1.)),list(near))
+        pts = self.rng.rand(50,3)*5.-0.5
+        ids,d = index.nearest(pts)
+        dist = numpy.sqrt(((pts[:,None,:]-xyz[None,:,:])**2).sum(axis=2))
+        self.assertTrue(numpy.allclose(d,dist.min(axis=1)))
+        self.assertTrue(numpy.allclose(dist[numpy.arange(50),ids],d))
+
+    def test_element_index(self):
+        '''
+        Test the Element Index
+
+        Tests that points are located in the hex containing them and that
+        the barycentric weights reproduce the point coordinates.
+        '''
+
+        mesh = hex_brick(4)
+        index = util.ElementIndex(mesh)
+        pts = self.rng.rand(100,3)*0.98+0.01
+        elem,nodes,weights = index.locate(pts)
+        expected = numpy.floor(pts*4).astype(int)
+        expected = expected[:,2]*16+expected[:,1]*4+expected[:,0]
+        self.assertTrue(numpy.array_equal(elem,expected))
+        self.assertTrue(numpy.allclose((weights[:,:,None]*mesh.xyz[nodes]).sum(axis=1),pts))
+        elem,nodes,weights = index.locate(numpy.array([[2.,0.5,0.5]]))
+        self.assertEqual(elem[0],-1)
+        q,e = index.containing(numpy.array([[0.5,0.5,0.5]]))
+        self.assertEqual(len(q),8)
+
+    def test_sparse_map(self):
+        '''
+        Test the Sparse Map
+
+        Tests weighted sums, extreme values and the fill of empty rows.
+        '''
+
+        smap = util.SparseMap([2,0,0,2],[1,0,2,2],[0.5,1.,2.,0.5],(4,3))
+        self.assertEqual(list(smap.found),[True,False,True,False])
+        out = smap.apply([1.,2.,3.])
+        self.assertEqual(list(out[[0,2]]),[7.,2.5])
+        self.assertTrue(numpy.all(numpy.isnan(out[[1,3]])))
+        self.assertEqual(list(smap.apply([1.,2.,3.],reduce='max',fill=-1.)),[3.,-1.,3.,-1.])
+        self.assertRaises(ValueError,smap.apply,[1.,2.])
+        src = hex_brick(3)
+        pts = self.rng.rand(20,3)
+        cmap = util.interpolation_map(src,pts,'continuous')
+        f = lambda x: 1.+2.*x[:,0]-x[:,1]+0.5*x[:,2]
+        self.assertTrue(numpy.allclose(cmap.apply(f(src.xyz)),f(pts)))
+
+    def test_upscale(self):
+        '''
+        Test the Nearest-Node Upscaling
+
+        Tests that fine nodes are averaged in the sink node closest to them,
+        that boundary nodes can be divided and that empty sinks are NaN.
+        '''
+
+        src = numpy.array([[0.1,0.,0.],[0.2,0.,0.],[0.5,0.,0.],[0.9,0.,0.]])
+        sink = numpy.array([[0.,0.,0.],[1.,0.,0.],[5.,0.,0.]])
+        smap = util.nearest_node_map(src,sink)
+        vals = numpy.array([1.,3.,10.,7.])
+        out = util.upscale_values(smap,vals,'ariave')
+        self.assertTrue(numpy.allclose(out[:2],[14./3,8.5]))
+        self.assertTrue(numpy.isnan(out[2]))
+        out = util.upscale_values(smap,vals,'sum',boundary_choice='divide',fill=0.)
+        self.assertTrue(numpy.allclose(out,[9.,12.,0.]))
+        out = util.upscale_values(smap,vals,'max',boundary_choice='single')
+        self.assertTrue(numpy.allclose(out[:2],[10.,7.]))
+
+    def test_find_duplicates(self):
+        '''
+        Test the Duplicate Node Detection
+
+        Tests groups of close nodes against brute force, including chains
+        of close pairs, and that dedupe_arrays removes collapsed elements.
+        '''
+
+        dx = numpy.array([1.e-7,0.,0.])
+        xyz = numpy.vstack([self.xyz,self.xyz[:50]+dx,self.xyz[:10]+2.*dx])
+        rep = util.find_duplicates(xyz,1.5e-7)
+        self.assertEqual(list(rep[400:]),list(range(50))+list(range(10)))
+        self.assertTrue(numpy.array_equal(rep[:400],numpy.arange(400)))
+        rep = util.find_duplicates(numpy.array([[0.,0.,0.],[0.9,0.,0.],[1.8,0.,0.],[5.,0.,0.]]),1.)
+        self.assertEqual(list(rep),[0,0,0,3])
+        x = numpy.array([[0.,0.,0.],[1.,0.,0.],[0.,1.,0.],[0.,0.,1.],[1.e-9,1.,0.],[1.,1.,1.]])
+        mesh = tet_mesh(x,numpy.array([[0,1,2,3],[2,1,4,3],[1,2,3,5]]),{'v':numpy.arange(6.)})
+        mesh.elem_attrs['e'] = numpy.array([1.,2.,3.])
+        new,node_map = util.dedupe_arrays(mesh,1.e-6)
+        self.assertEqual(list(node_map),[0,1,2,3,2,4])
+        self.assertEqual(new.nnodes,5)
+        self.assertEqual(new.nelems,2)
+        self.assertEqual(list(new.elem_attrs['e']),[1.,3.])
+        self.assertEqual(list(new.node_attrs['v']),[0.,1.,2.,3.,5.])
+
+    def test_node_order(self):
+        '''
+        Test the Node Orderings
+
+        Tests the node graph, bandwidth and profile, that every ordering is
+        a permutation, that RCM restores a small bandwidth after shuffling
+        and that consecutive Hilbert keys are neighbour grid cells.
+        '''
+
+        indptr,indices = util.node_graph(tet_mesh(numpy.zeros((4,3)),numpy.array([[0,1,2,3]])))
+        self.assertEqual(list(numpy.diff(indptr)),[3,3,3,3])
+        path = util.MeshArrays(numpy.zeros((5,3)),numpy.array([[0,1],[1,2],[2,3],[3,4]]),'line')
+        graph = util.node_graph(path)
+        self.assertEqual(util.bandwidth_profile(*graph),{'bandwidth':1,'profile':4})
+        bp = util.bandwidth_profile(*graph,order=[0,2,4,1,3])
+        self.assertEqual((bp['bandwidth'],bp['profile']),(3,6))
+
+        mesh = hex_brick(6)
+        p = self.rng.permutation(mesh.nnodes)
+        inv = numpy.argsort(p)
+        mesh = util.MeshArrays(mesh.xyz[p],inv[mesh.itet],mesh.itettyp,mesh.itetclr,{},{})
+        graph = util.node_graph(mesh)
+        for method in ('rcm','hilbert','morton','nd'):
+            order = util.node_order(mesh,method=method,graph=graph)
+            self.assertTrue(numpy.array_equal(numpy.sort(order),numpy.arange(mesh.nnodes)))
+        before = util.bandwidth_profile(*graph)
+        after = util.bandwidth_profile(*graph,order=util.node_order(mesh,'rcm',graph=graph))
+        self.assertLessEqual(after['bandwidth'],2*7*7)
+        self.assertLess(after['profile'],before['profile']/4)
+
+        g = numpy.arange(8.)
+        cells = numpy.array(numpy.meshgrid(g,g,g,indexing='ij')).reshape(3,-1).T
+        walk = cells[numpy.argsort(util.hilbert_keys(cells,bits=3))]
+        self.assertTrue(numpy.all(numpy.abs(numpy.diff(walk,axis=0)).sum(axis=1) == 1))
+        keys = util.morton_keys(numpy.array([[0.,0.,0.],[1.,0.,0.],[0.,1.,0.],[0.,0.,1.]]),bits=1)
+        self.assertEqual(len(set(keys)),4)
+
+    def test_element_order(self):
+        '''
+        Test the Element Orderings
+
+        Tests that elements are grouped by material and sorted on z, y, x
+        of their centroids with the median method.
+        '''
+
+        mesh = hex_brick(4)
+        p = self.rng.permutation(mesh.nelems)
+        mesh = util.MeshArrays(mesh.xyz,mesh.itet[p],mesh.itettyp,self.rng.randint(1,4,mesh.nelems),{},{})
+        for method in ('hilbert','morton','median'):
+            order = util.element_order(mesh,method=method)
+            self.assertTrue(numpy.array_equal(numpy.sort(order),numpy.arange(mesh.nelems)))
+            self.assertTrue(numpy.all(numpy.diff(mesh.itetclr[order]) >= 0))
+        c = mesh.centroids[util.element_order(mesh,method='median',by_material=False)]
+        self.assertTrue(numpy.array_equal(numpy.lexsort(c.T),numpy.arange(mesh.nelems)))
+
+    def test_partition(self):
+        '''
+        Test the Mesh Partitioning
+
+        Tests that the parts are balanced and that each part mesh holds its
+        owned elements and the ghost layers with their global numbers.
+        '''
+
+        mesh = hex_brick(4)
+        parts = util.partition_geometric(mesh.centroids,4)
+        self.assertEqual(list(numpy.bincount(parts)),[16,16,16,16])
+        parts = (mesh.centroids[:,0] > 0.5).astype(int)
+        sub = util.partition_arrays(mesh,parts,0,nghost=1)
+        ke = sub.elem_attrs['ielem_global']-1
+        self.assertEqual(sub.nelems,48)
+        self.assertTrue(numpy.array_equal(sub.elem_attrs['ighost'],(parts[ke] == 1).astype(int)))
+        self.assertTrue(numpy.allclose(sub.xyz,mesh.xyz[sub.node_attrs['inode_global']-1]))
+        self.assertTrue(numpy.array_equal(sub.node_attrs['inode_global'][sub.itet],mesh.itet[ke]+1))
+        sub = util.partition_arrays(mesh,parts,0,nghost=2)
+        self.assertEqual(sub.nelems,64)
+        self.assertEqual(sorted(set(sub.elem_attrs['ighost'])),[0,1,2])
+
+    def test_geometry_hash(self):
+        '''
+        Test the Geometry Hash
+
+        Tests that the hash is cached and changes with the coordinates.
+        '''
+
+        a = hex_brick(2)
+        b = hex_brick(2)
+        h = util.geometry_hash(a)
+        self.assertEqual(h,util.geometry_hash(b))
+        self.assertIs(util.geometry_hash(a),h)
+        b.xyz[0,0] += 1.e-9
+        b = util.MeshArrays(b.xyz,b.itet,b.itettyp,b.itetclr,{},{})
+        self.assertNotEqual(h,util.geometry_hash(b))
+
+    def test_delaunay_check(self):
+        '''
+        Test the Delaunay Check
+
+        Tests that a brick split into tetrahedra passes and that removed
+        and duplicated tetrahedra are reported as hole and overlapping faces.
+        '''
+
+        mesh = hex_brick(3)
+        split = [[0,1,2,6],[0,2,3,6],[0,3,7,6],[0,7,4,6],[0,4,5,6],[0,5,1,6]]
+        tets = mesh.itet[:,split].reshape(-1,4)
+        rep = util.delaunay_check(mesh.xyz,tets)
+        self.assertEqual(rep['checked'],len(tets))
+        self.assertEqual(rep['violations'],0)
+        self.assertEqual(rep['overlapping_faces'],0)
+        self.assertEqual(rep['hole_faces'],0)
+        # The center hex is interior, one of its tets leaves a hole
+        rep = util.delaunay_check(mesh.xyz,numpy.delete(tets,13*6,axis=0))
+        self.assertEqual(rep['hole_faces'],4)
+        self.assertEqual(rep['overlapping_faces'],0)
+        # Removing a corner tet exposes the faces it shared inside the hull
+        rep = util.delaunay_check(mesh.xyz,tets[1:])
+        self.assertGreater(rep['hole_faces'],0)
+        rep = util.delaunay_check(mesh.xyz,numpy.vstack([tets,tets[13*6]]))
+        self.assertEqual(rep['overlapping_faces'],4)
+
+    def test_read_sheet(self):
+        '''
+        Test the Raster Reader
+
+        Tests that windows of reflected ascii and binary rasters match the
+        full raster, for ascii values wrapped across lines.
+        '''
+
+        z = numpy.arange(35.).reshape(5,7)
+        tmp = tempfile.mkdtemp()
+        try:
+            fa = os.path.join(tmp,'z.dat')
+            with open(fa,'w') as fh:
+                fh.write('header\n')
+                for i in range(0,35,3): fh.write(' '.join('%g'%v for v in z.ravel()[i:i+3])+'\n\n')
+            fb = os.path.join(tmp,'z.bin')
+            z.astype(numpy.float32).tofile(fb)
+            for f,opts in [(fa,dict(skip_lines=1)),(fb,dict(file_type='binary'))]:
+                for flip in ['none','x','y','xy']:
+                    full = util.read_sheet(f,[7,5],flip=flip,**opts)
+                    ref = z[::-1 if 'y' in flip else 1,::-1 if 'x' in flip else 1]
+                    self.assertTrue(numpy.array_equal(full,ref))
+                    for (r0,r1),(c0,c1) in product(util.tile_ranges(5,2),util.tile_ranges(7,3)):
+                        win = util.read_sheet(f,[7,5],flip=flip,window=((r0,r1+1),(c0,c1+1)),**opts)
+                        self.assertTrue(numpy.array_equal(win,ref[r0:r1+1,c0:c1+1]))
+            self.assertRaises(ValueError,util.read_sheet,fa,[7,6],skip_lines=1)
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEqual(util.tile_ranges(7,3),[(0,2),(2,4),(4,6)])
+        self.assertEqual(util.tile_ranges(2,4),[(0,1)])
+
+    def test_stride_mask(self):
+        '''
+        Test the Stride Mask
+
+        Tests that ifirst,ilast,istride triplets select the nodes chosen by
+        LaGriT's pntlimn, including defaults, clipping and an ilast below
+        ifirst, and that dudded and merged nodes are excluded.
+        '''
+
+        cases = [((1,0,0),range(1,11)),
+                 ((0,0,0),range(1,11)),
+                 ((2,8,3),[2,5,8]),
+                 ((3,0,4),[3,7]),
+                 ((4,20,0),range(4,11)),
+                 ((12,0,0),[10]),
+                 ((5,2,1),[5,6,7]),
+                 ((8,5,2),[8,10]),
+                 ((-2,0,0),range(3,11)),
+                 ((1,-1,-1),[1,3,5,7,9])]
+        for stride,nodes in cases:
+            mask = util.stride_mask(10,stride)
+            self.assertEqual(list(numpy.flatnonzero(mask)+1),list(nodes),msg=str(stride))
+        itp = numpy.array([0,10,20,21,29,30,2,12,19,0])
+        mask = util.stride_mask(10,(1,0,0),itp)
+        self.assertEqual(list(numpy.flatnonzero(mask)+1),[1,2,6,7,8,9,10])
+
+    def test_select_geom(self):
+        '''
+        Test the Geometry Selection
+
+        Tests that the nodes selected for each pset geometry are those of a
+        brute force loop over the nodes, with inclusive bounds, azimuths in
+        [0,360) without wrapping of the angle ranges, polar angles from +z
+        and nodes at the center or on the axis.
+        '''
+
+        import math
+        g = numpy.linspace(0.,1.,9)
+        grid = numpy.array(list(product(g,g,g)))
+        xyz = numpy.vstack([grid,self.rng.rand(2000,3)])
+        ctr = (0.5,0.5,0.5)
+        def coords(p,geom):
+            dx,dy,dz = [p[i]-ctr[i] for i in range(3)]
+            if geom == 'xyz': return dx,dy,dz
+            az = math.degrees(math.atan2(dy,dx))%360.
+            if geom == 'rtz': return math.hypot(dx,dy),az,dz
+            r = math.sqrt(dx*dx+dy*dy+dz*dz)
+            return r,math.degrees(math.acos(dz/r)) if r > 0. else 0.,az
+        def brute(mins,maxs,geom):
+            ids = []
+            for i,p in enumerate(xyz):
+                v = coords(p,geom)
+                inside = True
+                for k in range(3):
+                    lo,hi = mins[k],maxs[k]
+                    c = v[k]
+                    # Angles are undefined at the center
+                    if v[0] == 0. and (geom,k) in (('rtz',1),('rtp',1),('rtp',2)): c = 0.5*(lo+hi)
+                    inside &= lo-1.e-12 <= c <= hi+1.e-12
+                if inside: ids.append(i)
+            return ids
+        cases = [('xyz',(-0.25,0.,0.25),(0.25,0.5,0.5)),
+                 ('xyz',(-1.,-1.,-1.),(0.,0.,0.)),
+                 ('rtz',(0.,0.,-0.25),(0.375,90.,0.25)),
+                 ('rtz',(0.1,-45.,-1.),(0.4,45.,1.)),
+                 ('rtz',(0.,300.,-1.),(1.,420.,1.)),
+                 ('rtz',(0.,180.,0.),(0.5,270.,0.5)),
+                 ('rtp',(0.,0.,0.),(0.5,90.,360.)),
+                 ('rtp',(0.2,45.,90.),(0.6,135.,180.)),
+                 ('rtp',(0.,90.,-90.),(1.,180.,45.))]
+        for geom,mins,maxs in cases:
+            ids = util.select_geom(xyz,mins,maxs,ctr,geom)
+            self.assertEqual(list(ids),brute(mins,maxs,geom),msg=geom+str(mins)+str(maxs))
+        # Negative and wrapping theta ranges are not taken mod 360
+        a = util.select_geom(xyz,(0.,-45.,-1.),(1.,45.,1.),ctr,'rtz')
+        b = util.select_geom(xyz,(0.,0.,-1.),(1.,45.,1.),ctr,'rtz')
+        self.assertEqual(list(a),list(b))
+        self.assertEqual(len(util.select_geom(xyz,(0.,0.,0.),(1.,1.,1.),ctr,'xyz',
+                                              index=util.GridIndex(xyz))),
+                         len(brute((0.,0.,0.),(1.,1.,1.),'xyz')))
+        self.assertEqual(len(util.select_geom(xyz,(0.,0.,0.),(-1.,1.,1.),ctr,'xyz')),0)
+        self.assertRaises(ValueError,util.select_geom,xyz,(0.,0.,0.),(1.,1.,1.),ctr,'abc')
+
+    def test_normal_sides(self):
+        '''
+        Test the Normal Sides
+
+        Tests that surface normals follow the node order of the faces and
+        that they are classified into the six box sides, with ties between
+        sides and degenerate normals assigned 0.
+        '''
+
+        xyz = numpy.array(list(product([0.,1.],[0.,1.],[0.,1.])))[:,::-1]
+        quads = numpy.array([[0,2,3,1],[4,5,7,6],[1,3,7,5],[2,6,7,3],[0,4,6,2],[0,1,5,4],
+                             [0,1,7,6],[0,0,0,0]])
+        surf = util.MeshArrays(xyz,quads,'quad',numpy.ones(len(quads),dtype=int),{},{})
+        normals = util.surface_normals(surf)
+        self.assertTrue(numpy.allclose(normals[:6],[[0,0,-1],[0,0,1],[1,0,0],[0,1,0],[-1,0,0],[0,-1,0]]))
+        self.assertTrue(numpy.allclose(normals[6:],[[0,-1,1],[0,0,0]]))
+        self.assertEqual(list(util.normal_sides(normals)),[1,2,3,4,5,6,0,0])
+        self.assertEqual(list(util.normal_sides(1.e-8*normals)),[1,2,3,4,5,6,0,0])
+        ties = [[1.,1.,0.],[-1.,0.,-1.],[1.,1.,1.],[0.,-2.,2.],[0.,0.,0.]]
+        self.assertEqual(list(util.normal_sides(ties)),[0,0,0,0,0])
+        near = [[1.,1.-1.e-6,0.],[0.1,-0.2,-0.3],[-5.,4.9,-4.9]]
+        self.assertEqual(list(util.normal_sides(near)),[3,1,5])
+        self.assertEqual(list(util.normal_sides([0.,3.,0.])),[4])
+
+    def test_write_faceset(self):
+        '''
+        Test the Faceset File
+
+        Tests that a faceset file has the header, attribute lines and
+        column widths of dump/avs2/file/mo/0 0 0 2 and that it reads back.
+        '''
+
+        tmp = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp,'fs.avs')
+            util.write_faceset(filename,numpy.array([1,99,1000]),numpy.array([6,5,4]))
+            with open(filename) as fh:
+                lines = fh.read().splitlines()
+            self.assertEqual(lines,['         0          0          0          2          0 ',
+                                    '00002  1  1','idelem1, integer ','idface1, integer ',
+                                    '     1   6','    99   5','  1000   4'])
+            mesh = util.read_avs(filename)
+            self.assertEqual((mesh.nnodes,mesh.nelems),(0,0))
+            self.assertEqual(list(mesh.elem_attrs['idelem1']),[1,99,1000])
+            self.assertEqual(list(mesh.elem_attrs['idface1']),[6,5,4])
+            util.write_faceset(filename,[],[])
+            with open(filename) as fh:
+                self.assertEqual(len(fh.read().splitlines()),4)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_stack_surfaces(self):
+        '''
+        Test the Stacked Surfaces
+
+        Tests the layer elevations, layertyp, materials and connectivity of
+        stacks on a 2 x 2 grid against hand computed values, with refinement,
+        buffer layers, pinch out and truncation.
+        '''
+
+        x,y = [0.,1.],[0.,2.]
+        flat = lambda v: numpy.full(4,float(v))
+        def layers(m):
+            #Utility to reshape the node elevations by layer.
+            return m.xyz[:,2].reshape(-1,4).tolist()
+        # Refinement layer below the middle surface
+        m = util.stack_surfaces(x,y,[flat(0),[4.,4.,8.,8.],flat(10)],nlayers=[1,0],matids=[1,2,3])
+        self.assertTrue(numpy.allclose(m.xyz[:4,:2],[[0,0],[1,0],[0,2],[1,2]]))
+        self.assertEqual(layers(m),[[0,0,0,0],[2,2,4,4],[4,4,8,8],[10,10,10,10]])
+        self.assertEqual(m.node_attrs['layertyp'].reshape(-1,4)[:,0].tolist(),[-1,2,0,-2])
+        self.assertEqual(m.node_attrs['imt1'].reshape(-1,4)[:,0].tolist(),[1,1,2,2])
+        self.assertEqual(list(m.itetclr),[1,1,2])
+        self.assertEqual(list(m.itettyp),['hex']*3)
+        self.assertEqual(m.itet.tolist(),[[0,1,3,2,4,5,7,6],[4,5,7,6,8,9,11,10],[8,9,11,10,12,13,15,14]])
+        # Prisms and unfilled layered surfaces
+        m = util.stack_surfaces(x,y,[flat(0),flat(1)],matids=[4,5],elem_type='tri')
+        self.assertEqual(m.itet.tolist(),[[0,1,3,4,5,7],[0,3,2,4,7,6]])
+        self.assertEqual(list(m.itettyp),['prism']*2)
+        self.assertEqual(list(m.itetclr),[4,4])
+        m = util.stack_surfaces(x,y,[flat(0),flat(1)],matids=[4,5],elem_type='tri',fill=False)
+        self.assertEqual(m.itet.tolist(),[[0,1,3],[0,3,2],[4,5,7],[4,7,6]])
+        self.assertEqual(list(m.itetclr),[4,4,5,5])
+        self.assertEqual(m.node_attrs['imt1'].reshape(-1,4)[:,0].tolist(),[4,5])
+        # Buffer layers at a constant offset, or halfway across thin units
+        m = util.stack_surfaces(x,y,[flat(0),[5.,5.,0.5,0.5],flat(10)],buffer=1.)
+        self.assertEqual(layers(m),[[0,0,0,0],[4,4,0.25,0.25],[5,5,0.5,0.5],[6,6,1.5,1.5],[10,10,10,10]])
+        self.assertEqual(m.node_attrs['layertyp'].reshape(-1,4)[:,0].tolist(),[-1,1,0,1,-2])
+        # Layers thinner than pinch collapse onto the layer below
+        m = util.stack_surfaces(x,y,[flat(0),[0.5,3.,0.5,3.],[4.,3.5,4.,3.5]],pinch=1.)
+        self.assertEqual(layers(m),[[0,0,0,0],[0,3,0,3],[4,3,4,3]])
+        # Surfaces below the truncating surface are cut by it
+        m = util.stack_surfaces(x,y,[flat(0),[2.,6.,2.,6.],flat(5)],trunc=2)
+        self.assertEqual(layers(m),[[0,0,0,0],[2,5,2,5],[5,5,5,5]])
+        m = util.stack_surfaces(x,y,[[0.,4.,0.,4.],flat(3),flat(5)],trunc=1)
+        self.assertEqual(layers(m),[[0,3,0,3],[3,3,3,3],[5,5,5,5]])
+        self.assertRaises(ValueError,util.stack_surfaces,x,y,[flat(0)])
+        self.assertRaises(ValueError,util.stack_surfaces,x,y,[flat(0),numpy.zeros(3)])
+        self.assertRaises(ValueError,util.stack_surfaces,x,y,[flat(0),flat(1)],pinch=2.,buffer=1.)
+
+    def test_merge_arrays(self):
+        '''
+        Test the Merged Arrays
+
+        Tests that merging a tet and a hex mesh offsets the connectivity and
+        the nonzero isn1 chain links by the nodes before each mesh, pads the
+        connectivity of smaller elements and fills missing attributes with
+        zeros of the attribute type.
+        '''
+
+        xyz = numpy.array([[0.,0.,0.],[1.,0.,0.],[0.,1.,0.],[0.,0.,1.]])
+        a = util.MeshArrays(xyz,numpy.array([[0,1,2,3]]),'tet',numpy.array([7]),
+                            OrderedDict([('isn1',numpy.array([0,3,2,0])),('u',numpy.array([1.,2.,3.,4.]))]),
+                            {'q':numpy.array([9])})
+        h = hex_brick(1)
+        b = util.MeshArrays(h.xyz+2.,h.itet,h.itettyp,numpy.array([8]),
+                            OrderedDict([('v',numpy.arange(8)),('isn1',numpy.array([0,0,5,0,0,0,0,3]))]),{})
+        m = util.merge_arrays([a,b,a])
+        self.assertEqual((m.nnodes,m.nelems),(16,3))
+        self.assertTrue(numpy.allclose(m.xyz,numpy.vstack([xyz,h.xyz+2.,xyz])))
+        self.assertEqual(m.itet.tolist(),[[0,1,2,3,-1,-1,-1,-1],
+                                          (h.itet[0]+4).tolist(),
+                                          [12,13,14,15,-1,-1,-1,-1]])
+        self.assertEqual(list(m.itettyp),['tet','hex','tet'])
+        self.assertEqual(list(m.itetclr),[7,8,7])
+        self.assertEqual(list(m.node_attrs.keys()),['isn1','u','v'])
+        self.assertEqual(m.node_attrs['isn1'].tolist(),[0,3,2,0,0,0,9,0,0,0,0,7,0,15,14,0])
+        self.assertEqual(m.node_attrs['u'].tolist(),[1,2,3,4]+[0]*8+[1,2,3,4])
+        self.assertEqual(m.node_attrs['v'].tolist(),[0]*4+list(range(8))+[0]*4)
+        self.assertEqual(m.node_attrs['v'].dtype,b.node_attrs['v'].dtype)
+        self.assertEqual(m.elem_attrs['q'].tolist(),[9,0,9])
+
+    def test_subset_arrays(self):
+        '''
+        Test the Subset Arrays
+
+        Tests that exclusive and inclusive subsets keep the elements and
+        nodes chosen by a brute force loop, with the connectivity, padding
+        and isn1 chain links renumbered to the kept nodes.
+        '''
+
+        h = hex_brick(2)
+        isn1 = numpy.zeros(27,dtype=int)
+        for i,j in [(0,26),(1,2),(3,9),(4,13)]:
+            isn1[i],isn1[j] = j+1,i+1
+        tet = tet_mesh(numpy.array([[0.,0.,0.],[0.5,0.,0.],[0.,0.5,0.],[0.,0.,-1.]]),
+                       numpy.array([[0,1,2,3]]))
+        mesh = util.merge_arrays([util.MeshArrays(h.xyz,h.itet,h.itettyp,numpy.arange(1,9),
+                                                  {'isn1':isn1},{'e':numpy.arange(8)*10}),tet])
+        sel = numpy.flatnonzero(mesh.xyz[:,0] <= 0.5)
+        for exclusive in (True,False):
+            sub,kn,ke = util.subset_arrays(mesh,sel,exclusive=exclusive)
+            elems,nodes = [],set(sel)
+            for i,t in enumerate(mesh.itet):
+                t = [n for n in t if n >= 0]
+                inside = [n in nodes for n in t]
+                if any(inside) if exclusive else all(inside):
+                    elems.append(i)
+            if exclusive:
+                for i in elems: nodes |= set([n for n in mesh.itet[i] if n >= 0])
+            self.assertEqual(list(ke),elems)
+            self.assertEqual(list(kn),sorted(nodes))
+            self.assertTrue(numpy.allclose(sub.xyz,mesh.xyz[kn]))
+            self.assertEqual(numpy.where(sub.itet >= 0,kn[sub.itet],-1).tolist(),mesh.itet[ke].tolist())
+            self.assertEqual(list(sub.itetclr),list(mesh.itetclr[ke]))
+            self.assertEqual(list(sub.itettyp),list(mesh.itettyp[ke]))
+            self.assertEqual(list(sub.elem_attrs['e']),list(mesh.elem_attrs['e'][ke]))
+            links = [list(kn).index(v-1)+1 if v-1 in kn else 0 for v in mesh.node_attrs['isn1'][kn]]
+            self.assertEqual(list(sub.node_attrs['isn1']),links)
+        self.assertEqual(len(util.subset_arrays(mesh,sel,exclusive=True)[2]),9)
+        self.assertEqual(len(util.subset_arrays(mesh,sel,exclusive=False)[2]),5)
+        mask = mesh.xyz[:,0] <= 0.5
+        self.assertEqual(list(util.subset_arrays(mesh,mask,exclusive=False)[1]),list(sel))
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner(verbosity=2)
+    suite = unittest.TestSuite()
+    suite.addTest(TestUtilities('test_compare_meshes'))
+    suite.addTest(TestUtilities('test_element_quality'))
+    suite.addTest(TestUtilities('test_grid_index'))
+    suite.addTest(TestUtilities('test_element_index'))
+    suite.addTest(TestUtilities('test_sparse_map'))
+    suite.addTest(TestUtilities('test_upscale'))
+    suite.addTest(TestUtilities('test_find_duplicates'))
+    suite.addTest(TestUtilities('test_node_order'))
+    suite.addTest(TestUtilities('test_element_order'))
+    suite.addTest(TestUtilities('test_partition'))
+    suite.addTest(TestUtilities('test_geometry_hash'))
+    suite.addTest(TestUtilities('test_delaunay_check'))
+    suite.addTest(TestUtilities('test_read_sheet'))
+    suite.addTest(TestUtilities('test_stride_mask'))
+    suite.addTest(TestUtilities('test_select_geom'))
+    suite.addTest(TestUtilities('test_normal_sides'))
+    suite.addTest(TestUtilities('test_write_faceset'))
+    suite.addTest(TestUtilities('test_stack_surfaces'))
+    suite.addTest(TestUtilities('test_merge_arrays'))
+    suite.addTest(TestUtilities('test_subset_arrays'))
+    runner.run(suite)
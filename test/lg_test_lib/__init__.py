@@ -3,6 +3,9 @@ import argparse
 import lg_test_lib.clean_test as cln
 import lg_test_lib.run_test as run
 import lg_test_lib.check_test as chk
+import lg_test_lib.bench_test as bench
+import lg_test_lib.scaling_test as scaling
+import lg_test_lib.changed_test as changed
 
 # Set module variables
 dtop = None
@@ -11,6 +14,10 @@ all_levels = []
 checkdir = None
 testfile = None
 flags = None
+jobs = 1
+baseline = None
+rtol = chk.RTOL
+atol = chk.ATOL
 
 class readable_dir(argparse.Action):
     '''
@@ -51,11 +58,13 @@ def TestSingle(testcase:str,clean:bool=True,test:bool=True,check:bool=True):
         run.RunTest(tag=testfile,
                     executable=lagrit_exe,
                     flags=flags,
+                    jobs=jobs,
                     test_dir=testcase.split('/')[-1])
 
     if check:
         chk.Check(target=checkdir,
-                  test_dir=testcase.split('/')[-1])
+                  test_dir=testcase.split('/')[-1],
+                  rtol=rtol,atol=atol)
     
     os.chdir(os.path.join(dtop,testcase))
 
@@ -79,7 +88,78 @@ def TestDir(testing_dir:str,clean:bool=True,test:bool=True,check:bool=True):
         cln.Clean(tag=testfile)
 
     if test:
-        run.RunTest(tag=testfile,executable=lagrit_exe,flags=flags)
+        run.RunTest(tag=testfile,executable=lagrit_exe,flags=flags,jobs=jobs)
 
     if check:
-        chk.Check(target=checkdir)
+        chk.Check(target=checkdir,jobs=jobs,rtol=rtol,atol=atol)
+
+
+def ListTests(testing_dir:str):
+    '''
+    Returns the test directories (relative to dtop) within a level
+    directory, i.e. the subdirectories holding an input.lgi file.
+    '''
+    level = os.path.join(dtop,testing_dir)
+    return [os.path.join(testing_dir,d) for d in sorted(os.listdir(level))
+            if os.path.isfile(os.path.join(level,d,'input.lgi'))]
+
+
+def TestBench(testcases:list,repeat:int=5,threshold:float=0.1,
+              min_time:float=0.1,ref:str=None,save:bool=True):
+    '''
+    Benchmarks test cases against the performance baseline.
+
+    Args:
+       testcases (list): test directories relative to dtop
+                         (i.e., 'level01/connect_cube')
+
+    Kwargs:
+       repeat (int): runs per test, the median time is compared
+       threshold (float): allowed relative slow down
+       min_time (float): reference time (s) below which slow downs are ignored
+       ref (str): executable hash of the baseline entry to compare to
+       save (bool): store this executable's medians if nothing regressed
+
+    Returns the number of failed tests.
+    '''
+    os.chdir(dtop)
+    return bench.Bench(testcases,lagrit_exe,flags,
+                       baseline or os.path.join(dtop,'bench_baseline.json'),
+                       dtop=dtop,repeat=repeat,threshold=threshold,
+                       min_time=min_time,ref=ref,save=save)
+
+
+def TestScaling(outdir:str,commands:list=None,sizes:list=None):
+    '''
+    Generates and runs the synthetic scaling benchmarks in outdir
+    (relative to dtop) and fits the time and memory scaling exponents.
+
+    Kwargs:
+       commands (list): benchmark names, default all of scaling.COMMANDS
+       sizes (list): approximate node counts, default scaling.SIZES
+    '''
+    return scaling.Scaling(os.path.join(dtop,outdir),lagrit_exe,flags,testfile,
+                           commands=commands,sizes=sizes,jobs=jobs)
+
+
+def TestChanged(testcases:list,cache:str=None,src_dir:str=None,
+                trust_keywords:bool=False):
+    '''
+    Runs and checks only the test cases whose inputs, relevant LaGriT
+    sources or executable changed since they last passed.
+
+    Args:
+       testcases (list): candidate test directories relative to dtop
+
+    Kwargs:
+       cache (str): cache file, default changed_cache.json in dtop
+       src_dir (str): LaGriT sources, default ../src from dtop
+       trust_keywords (bool): skip tests whose executable changed with
+                              sources that match none of their commands
+
+    Returns the number of failed tests.
+    '''
+    os.chdir(dtop)
+    return changed.Changed(dtop,testcases,lagrit_exe,flags,testfile,
+                           cache_file=cache,src_dir=src_dir,jobs=jobs,
+                           rtol=rtol,atol=atol,trust_keywords=trust_keywords)
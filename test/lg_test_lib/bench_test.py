@@ -0,0 +1,158 @@
+#------------------------------------------------------------------------------
+#  Name: bench_test.py
+#
+#  Performance baseline for the test suite.  Runs selected tests several
+#  times, takes the median wall/CPU time and max RSS of each, and compares
+#  them with a baseline JSON file holding earlier medians keyed by the
+#  sha256 of the LaGriT executable and the test name.  A test whose median
+#  wall time grows by more than the threshold fails the run.
+#------------------------------------------------------------------------------
+
+import os, sys, time, json, hashlib, statistics
+from collections import OrderedDict
+from .run_test import RunIsolated
+
+__all__ = ["ExecutableHash", "LoadBaseline", "Bench"]
+
+#------------------------------------------------------------------------------
+def ExecutableHash(path, length=16):
+    '''
+    Returns the leading length hex digits of the sha256 of file path.
+    '''
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()[:length]
+
+#------------------------------------------------------------------------------
+def LoadBaseline(filename):
+    '''
+    Reads the baseline file, returns an empty baseline if it does not exist.
+    The layout is {executable hash: {"executable", "date", "tests":
+    {test name: {"wall", "user", "sys", "maxrss", "repeat"}}}}.
+    '''
+    if not os.path.exists(filename):
+        return OrderedDict()
+    with open(filename, 'r') as fh:
+        return json.load(fh, object_pairs_hook=OrderedDict)
+
+#------------------------------------------------------------------------------
+def _reference(baseline, exe_hash, ref=None):
+    '''
+    Picks the baseline entry to compare against: the entry whose hash
+    starts with ref if given, else the most recent entry of a different
+    executable, else the entry of this executable.
+    '''
+    if ref is not None:
+        keys = [k for k in baseline if k.startswith(ref)]
+        if len(keys) != 1:
+            raise KeyError("Baseline reference %s matches %d executables" % (ref, len(keys)))
+        return keys[0]
+    others = [k for k in baseline if k != exe_hash]
+    if others:
+        return max(others, key=lambda k: baseline[k].get('time', 0.0))
+    if exe_hash in baseline:
+        return exe_hash
+    return None
+
+#------------------------------------------------------------------------------
+def Bench(tests, executable, flags, baseline, dtop=None, repeat=5,
+          threshold=0.10, min_time=0.1, ref=None, save=True):
+    '''
+    Benchmarks tests against the baseline file.
+
+    Arguments
+    ---------
+       tests (list): test directories relative to dtop, e.g. 'level01/connect_cube'
+       executable (str): LaGriT binary
+       flags (str): command line flags passed to LaGriT
+       baseline (str): baseline JSON file
+       dtop (str): top test directory, default current directory
+       repeat (int): runs per test, the median is kept
+       threshold (float): allowed relative slow down of the median wall time
+       min_time (float): tests faster than this in the reference (seconds)
+           are reported but never fail, their timings are mostly noise
+       ref (str): hash (or prefix) of the baseline executable to compare to
+       save (bool): record the medians of this executable in the baseline
+           when no test regressed
+
+    Returns the number of regressed tests.
+    '''
+    if dtop is None:
+        dtop = os.getcwd()
+    repeat = max(1, repeat)
+    exe_hash = ExecutableHash(executable)
+    data = LoadBaseline(baseline)
+    refkey = _reference(data, exe_hash, ref)
+    reftests = data[refkey]['tests'] if refkey is not None else {}
+
+    print("=======")
+    print("Benchmark executable:\t%s (%s)" % (executable, exe_hash))
+    if refkey is None:
+        print("Baseline:\t\t%s has no entries, recording only" % baseline)
+    else:
+        print("Baseline:\t\t%s (%s)" % (data[refkey].get('executable', ''), refkey))
+    print("Runs per test:\t\t%d, threshold %.0f%%" % (repeat, 100*threshold))
+    print("=======")
+
+    medians = OrderedDict()
+    nfail = 0
+    for name in tests:
+        path = os.path.join(dtop, name)
+        if not os.path.exists(os.path.join(path, "input.lgi")):
+            print("ERROR: File missing: %s/input.lgi" % name)
+            continue
+        runs = []
+        for i in range(repeat):
+            code, screen, usage = RunIsolated(path, executable, flags, copy_back=False)
+            if code != 0:
+                break
+            runs.append(usage)
+        if len(runs) < repeat:
+            print("%-40s exit code %d, not timed" % (name, code))
+            nfail += 1
+            continue
+
+        med = OrderedDict()
+        for key in ('wall', 'user', 'sys'):
+            med[key] = round(statistics.median([u[key] for u in runs]), 6)
+        med['maxrss'] = int(statistics.median([u['maxrss'] for u in runs]))
+        med['repeat'] = repeat
+        medians[name] = med
+
+        old = reftests.get(name)
+        if old is None:
+            print("%-40s %8.3fs %10d kB   (new)" % (name, med['wall'], med['maxrss']))
+            continue
+        ratio = med['wall']/old['wall'] if old['wall'] > 0 else 1.0
+        status = ""
+        if ratio > 1.0 + threshold:
+            if old['wall'] >= min_time:
+                status = "SLOWER"
+                nfail += 1
+            else:
+                status = "slower (below %.2fs, ignored)" % min_time
+        print("%-40s %8.3fs -> %8.3fs  x%.2f  %10d -> %10d kB  %s" %
+              (name, old['wall'], med['wall'], ratio,
+               old['maxrss'], med['maxrss'], status))
+
+    if nfail:
+        print("\nBenchmark: %d of %d tests failed or slowed down by more than %.0f%%" %
+              (nfail, len(tests), 100*threshold))
+    else:
+        print("\nBenchmark: all %d tests within %.0f%% of the baseline" %
+              (len(medians), 100*threshold))
+
+    if save and not nfail and medians:
+        entry = data.setdefault(exe_hash, OrderedDict())
+        entry['executable'] = os.path.abspath(executable)
+        entry['date'] = time.ctime()
+        entry['time'] = time.time()
+        entry.setdefault('tests', OrderedDict()).update(medians)
+        with open(baseline, 'w') as fh:
+            json.dump(data, fh, indent=2)
+            fh.write("\n")
+        print("Baseline for %s written to: %s\n" % (exe_hash, baseline))
+
+    return nfail
@@ -0,0 +1,280 @@
+#------------------------------------------------------------------------------
+#  Name: changed_test.py
+#
+#  Change-aware test selection.  A cache (changed_cache.json in the top test
+#  directory) records, for every test that was run and checked, the hash of
+#  its inputs (input.lgi and the files it reads), the LaGriT source tree
+#  it was checked with, the hash of the executable and whether the check
+#  passed.  Only tests whose record is missing, failed or out of date are
+#  run again.
+#
+#  The relevant sources of a test are the files in src/ whose name starts
+#  with one of its command keywords (connect -> connect.f, connect2d_lg.f,
+#  dump/fehm -> dumpfehm.f, dump_fehm_geom.f, ...).  This is a heuristic,
+#  so a test also runs again when a source changed since its last check
+#  that matches no command of any selected test, and every test runs again
+#  when the executable changed.  Only with trust_keywords are tests skipped
+#  whose executable changed with sources that match none of its commands.
+#------------------------------------------------------------------------------
+
+import os, re, time, json, hashlib
+from collections import OrderedDict
+from .bench_test import ExecutableHash
+from .clean_test import CleanSingleDir
+from .run_test import RunTest
+from .check_test import Check, RTOL, ATOL
+
+__all__ = ["InputFiles", "Keywords", "SourceHashes", "Stale", "Changed"]
+
+SOURCE_EXT = ('.f', '.F', '.f90', '.F90', '.c', '.cpp', '.h', '.inc')
+SPLIT = re.compile(r"[\s/,;]+")
+# tokens that may be paths, '/' separates only when it is not inside a word
+WORDS = re.compile(r"[\s,;]+|\s/|/\s")
+
+#------------------------------------------------------------------------------
+def _statements(text, split=SPLIT):
+    '''
+    Commands of an input.lgi as token lists, comments dropped and
+    continuation lines (ending in &) joined.  Tokens are separated by
+    the split regular expression.
+    '''
+    stmts = []
+    prev = ''
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in '#*':
+            continue
+        if line.endswith('&'):
+            prev += line[:-1] + ' '
+            continue
+        words = [w for w in split.split(prev + line) if w and w != '/']
+        prev = ''
+        if words:
+            stmts.append(words)
+    return stmts
+
+def _paths(word):
+    '''
+    Relative paths a token may hold: the runs of its '/' separated parts,
+    since read/avs/sub/in.inp/mo is one token when written without spaces.
+    '''
+    parts = word.split('/')
+    return ['/'.join(parts[i:j]) for i in range(len(parts))
+            for j in range(i + 1, len(parts) + 1) if all(parts[i:j])]
+
+def InputFiles(testdir):
+    '''
+    Returns input.lgi and the files of testdir that it reads, also in
+    subdirectories, i.e. tokens naming an existing file, except on
+    dump/write commands and except output files removed by CleanSingleDir.
+    '''
+    flgi = os.path.join(testdir, "input.lgi")
+    with open(flgi, 'r', errors='replace') as fh:
+        stmts = _statements(fh.read(), WORDS)
+    files = set(['input.lgi'])
+    written = set()
+    for words in stmts:
+        first = words[0].split('/')
+        words = ['/'.join(first[1:])] + words[1:]
+        names = [os.path.normpath(p) for w in words for p in _paths(w)
+                 if os.path.isfile(os.path.join(testdir, p))]
+        if first[0].lower() in ('dump', 'write'):
+            written.update(names)
+        else:
+            files.update(names)
+    files = [f for f in files - written
+             if not (os.path.basename(f).startswith("out") or
+                     f.endswith("gmvF") or f.endswith("x3dgen"))]
+    return sorted(files)
+
+def Keywords(testdir):
+    '''
+    Command keywords of a test, dump formats as dump<format>.
+    '''
+    with open(os.path.join(testdir, "input.lgi"), 'r', errors='replace') as fh:
+        stmts = _statements(fh.read())
+    keys = set()
+    for words in stmts:
+        key = words[0].lower()
+        if not re.match(r"[a-z]", key) or key in ('finish', 'define'):
+            continue
+        if key == 'dump' and len(words) > 1:
+            key = 'dump' + words[1].lower()
+        keys.add(key)
+    return sorted(keys)
+
+def _hash_files(paths, top=None):
+    h = hashlib.sha256()
+    for path in paths:
+        h.update((os.path.relpath(path, top) if top else os.path.basename(path)).encode())
+        with open(path, 'rb') as fh:
+            h.update(fh.read())
+    return h.hexdigest()[:16]
+
+def SourceHashes(src_dir):
+    '''
+    Hash of every LaGriT source file in src_dir, by file name.
+    '''
+    if not os.path.isdir(src_dir):
+        return OrderedDict()
+    return OrderedDict((f, _hash_files([os.path.join(src_dir, f)]))
+                       for f in sorted(os.listdir(src_dir))
+                       if f.endswith(SOURCE_EXT))
+
+def _hash_tree(sources):
+    return hashlib.sha256(json.dumps(sources, sort_keys=True).encode()).hexdigest()[:16]
+
+def _relevant(keys, sources):
+    '''
+    Source files whose name (without _ and extension) starts with a keyword.
+    '''
+    rel = []
+    for f in sources:
+        base = os.path.splitext(f)[0].lower()
+        flat = base.replace('_', '')
+        if any(base.startswith(k) or flat.startswith(k.replace('_', '')) for k in keys):
+            rel.append(f)
+    return rel
+
+#------------------------------------------------------------------------------
+def Stale(dtop, tests, executable, cache, src_dir, trust_keywords=False):
+    '''
+    Decides which tests have to run.
+
+    Arguments
+    ---------
+       dtop (str): top test directory
+       tests (list): test directories relative to dtop
+       executable (str): LaGriT binary
+       cache (dict): the loaded cache, may be empty
+       src_dir (str): LaGriT source directory
+       trust_keywords (bool): skip tests whose executable changed with
+           sources that match none of their commands, by default every
+           test checked with another executable runs again
+
+    Returns (stale, state, sources) where stale is an OrderedDict of test
+    name to reason, state holds the current inputs, executable and source
+    tree hashes per test, and sources the current source hashes.
+    '''
+    exe_hash = ExecutableHash(executable)
+    sources = SourceHashes(src_dir)
+    tree = _hash_tree(sources)
+    trees = cache.get('trees', {})
+    records = cache.get('tests', {})
+
+    # sources any selected test uses, other changes cannot be attributed
+    names = set(sources)
+    for t in trees.values():
+        names.update(t)
+    keys = OrderedDict((name, Keywords(os.path.join(dtop, name))) for name in tests)
+    known = set()
+    for k in keys.values():
+        known.update(_relevant(k, names))
+
+    stale = OrderedDict()
+    state = OrderedDict()
+    for name in tests:
+        path = os.path.join(dtop, name)
+        state[name] = OrderedDict([
+            ('inputs', _hash_files([os.path.join(path, f) for f in InputFiles(path)], path)),
+            ('binary', exe_hash),
+            ('tree', tree)])
+        rec = records.get(name)
+        if rec is None:
+            stale[name] = "never checked"
+            continue
+        old = trees.get(rec.get('tree'))
+        if old is None:
+            stale[name] = "source tree not recorded"
+            continue
+        changed = sorted(f for f in set(sources) | set(old) if sources.get(f) != old.get(f))
+        rel = _relevant(keys[name], changed)
+        other = [f for f in changed if f not in known]
+        if not rec.get('passed'):
+            stale[name] = "failed last time"
+        elif rec.get('inputs') != state[name]['inputs']:
+            stale[name] = "inputs changed"
+        elif rel:
+            stale[name] = "sources changed: " + ", ".join(rel[:3]) + \
+                          (" (+%d more)" % (len(rel) - 3) if len(rel) > 3 else "")
+        elif other:
+            stale[name] = "unattributed source changed: " + ", ".join(other[:3]) + \
+                          (" (+%d more)" % (len(other) - 3) if len(other) > 3 else "")
+        elif rec.get('binary') != exe_hash and not changed:
+            stale[name] = "executable changed without source changes"
+        elif rec.get('binary') != exe_hash and not trust_keywords:
+            stale[name] = "executable changed, no source of its commands changed"
+    return stale, state, sources
+
+#------------------------------------------------------------------------------
+def Changed(dtop, tests, executable, flags, tag, cache_file=None,
+            src_dir=None, jobs=1, rtol=RTOL, atol=ATOL, trust_keywords=False):
+    '''
+    Runs and checks only the stale tests and updates the cache.
+
+    Arguments
+    ---------
+       dtop (str): top test directory
+       tests (list): candidate test directories relative to dtop
+       executable (str): LaGriT binary
+       flags (str): command line flags passed to LaGriT
+       tag (str): output file name tag
+       cache_file (str): default dtop/changed_cache.json
+       src_dir (str): default dtop/../src
+       jobs (int): tests run and checked at once
+       rtol, atol (float): check tolerances
+       trust_keywords (bool): passed on to Stale
+
+    Returns the number of failed tests.
+    '''
+    if cache_file is None:
+        cache_file = os.path.join(dtop, "changed_cache.json")
+    if src_dir is None:
+        src_dir = os.path.join(dtop, '..', 'src')
+    cache = OrderedDict()
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r') as fh:
+            cache = json.load(fh, object_pairs_hook=OrderedDict)
+
+    stale, state, sources = Stale(dtop, tests, executable, cache, src_dir,
+                                  trust_keywords)
+    print("=======")
+    print("Changed tests: %d of %d need to run" % (len(stale), len(tests)))
+    for name, why in stale.items():
+        print("  %-40s %s" % (name, why))
+    print("=======")
+
+    records = cache.setdefault('tests', OrderedDict())
+    nfail = 0
+    levels = OrderedDict()
+    for name in stale:
+        level, test = os.path.split(name)
+        levels.setdefault(level, []).append(test)
+
+    for level, names in levels.items():
+        os.chdir(os.path.join(dtop, level))
+        for test in names:
+            CleanSingleDir(test)
+        RunTest(tag=tag, executable=executable, flags=flags, jobs=jobs, tests=names)
+        result = Check(target=os.curdir, jobs=jobs, rtol=rtol, atol=atol,
+                       tests=names, exit_on_fail=False)
+        for test in names:
+            name = os.path.join(level, test)
+            rec = OrderedDict(state[name])
+            rec['passed'] = result.get(test, -1) == 0
+            rec['date'] = time.ctime()
+            records[name] = rec
+            nfail += not rec['passed']
+        os.chdir(dtop)
+
+    # source trees are kept while a test record refers to them
+    trees = cache.setdefault('trees', OrderedDict())
+    trees[_hash_tree(sources)] = sources
+    used = set(rec.get('tree') for rec in records.values())
+    for t in [t for t in trees if t not in used]:
+        del trees[t]
+    with open(cache_file, 'w') as fh:
+        json.dump(cache, fh, indent=2)
+        fh.write("\n")
+    print("Changed: %d run, %d failed, cache written to %s\n" % (len(stale), nfail, cache_file))
+    return nfail
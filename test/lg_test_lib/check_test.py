@@ -16,8 +16,13 @@
 #  writes differences to diffout_$OS.txt
 #  and copies file to directory result_files 
 #
-#  Uses difflib.py providing diffs in four formats:
-#  Current version uses unified
+#  Lines that differ are compared token by token, numbers with
+#  |test - ref| <= atol + rtol*|ref| in bulk with numpy, see compare_lines.
+#  Per-test overrides in <test dir>/tolerance.json.
+#  diffout lists only the mismatched blocks.
+#
+#  diff_chunk below is the previous line by line compare, which
+#  used difflib.py providing diffs in four formats:
 #
 # ndiff:    lists every line and highlights interline changes.
 # context:  highlights clusters of changes in a before/after format.
@@ -26,9 +31,19 @@
 #
 #------------------------------------------------------------------------------
 
-import fileinput, array, string, os, difflib, sys, datetime, time, copy
+import fileinput, array, string, os, difflib, sys, datetime, time, copy, re, json, shutil
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+__all__ = ["fail", "rstrip", "diff_chunk", "tokenize", "compare_lines", "CheckDir", "Check"]
 
-__all__ = ["fail", "rstrip", "diff_chunk", "Check"]
+# default tolerances, numbers match when |test - ref| <= ATOL + RTOL*|ref|
+# ATOL is the old diff_chunk epsilon, needed to compare 1.73469E+02 to 1.734693909E+02
+RTOL = 1.0e-6
+ATOL = 1.0e-3
+# changed regions of unequal length up to this many line pairs are aligned
+# with difflib on their signatures, larger ones are paired by position
+SMALL_REGION = 4000000
 
 def remove_junk_from_filestream(lines,
                                 banner='-----oOo-----',
@@ -223,38 +238,271 @@ def diff_chunk(rlines,tlines,rcnt,tcnt, wfile) :
      
 
 #------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+# vectorized compare
+#
+# Lines that differ are tokenized once.  Each line gets a signature in
+# which the numeric tokens are replaced by a placeholder, and the changed
+# lines are paired on their signatures, so a changed number never breaks
+# the alignment.  The numbers
+# of all paired lines are then compared in one numpy operation with
+# |test - ref| <= atol + rtol*|ref|, and only the lines that fail (or have
+# no partner) are reported, grouped into blocks.
+
+# the Fortran exponent without a letter (1.0-100) needs a '.' in the
+# mantissa, so integer ranges such as 1-100 stay text
+NUMBER = re.compile(r"[+-]?(?:\d+\.\d*|\.\d+|\d+(?![+-]))([eEdD][+-]?\d+|[+-]\d{3})?$")
+
+def _to_float(tok):
+  '''
+  Fortran forms 1.0D+05 and 1.0-100 as a string float() accepts.
+  '''
+  tok = tok.replace('D','E').replace('d','e')
+  if len(tok) > 4 and tok[-4] in '+-' and tok[-5] in '0123456789.':
+    tok = tok[:-4] + 'E' + tok[-4:]
+  return tok
+
+def tokenize(lines):
+  '''
+  Splits lines into tokens once.  Returns (signatures, values, numline,
+  noff): the per-line signature strings, the float values of all numeric
+  tokens in file order, the line index of each value, and the offset of
+  each line's first value (length nlines+1).
+  '''
+  sigs = []
+  nums = []
+  counts = np.zeros(len(lines), dtype=np.int64)
+  match = NUMBER.match
+  for i, line in enumerate(lines):
+    words = line.split()
+    sig = []
+    n = 0
+    for w in words:
+      m = match(w)
+      if m is None:
+        sig.append(w)
+      else:
+        sig.append("\x00")
+        e = m.group(1)
+        nums.append(w if e is None or e[0] in 'eE' else _to_float(w))
+        n += 1
+    sigs.append(" ".join(sig))
+    counts[i] = n
+  values = np.asarray(nums, dtype=str).astype(np.float64) if nums else np.zeros(0)
+  noff = np.zeros(len(lines) + 1, dtype=np.int64)
+  np.cumsum(counts, out=noff[1:])
+  numline = np.repeat(np.arange(len(lines)), counts)
+  return sigs, values, numline, noff
+
+def read_tolerance(dwork, rtol=RTOL, atol=ATOL):
+  '''
+  Reads the optional per-test overrides dwork/tolerance.json, e.g.
+  {"rtol": 1e-4, "atol": 1e-8, "ignore": ["elapsed time", "^Program"]}.
+  Lines matching an ignore regular expression are dropped from both files.
+  '''
+  opts = {'rtol': rtol, 'atol': atol, 'ignore': []}
+  ftol = os.path.join(dwork, "tolerance.json")
+  if os.path.exists(ftol):
+    with open(ftol, 'r') as fh:
+      opts.update(json.load(fh))
+  return opts
+
+def _ranges(start, stop):
+  '''
+  Concatenation of arange(start[k], stop[k]) for all k, without a loop.
+  '''
+  counts = stop - start
+  first = np.cumsum(counts) - counts
+  return np.repeat(start - first, counts) + np.arange(counts.sum())
 
+def _align(rsig, tsig):
+  '''
+  Pairs lines of a changed region on their signatures.  Returns the
+  paired (ref, test) indices and the unpaired lines of both sides.
+  '''
+  nr, nt = len(rsig), len(tsig)
+  if nr == nt or nr*nt > SMALL_REGION:
+    # positional pairing, as diff_chunk did for line pairs of a chunk
+    n = min(nr, nt)
+    pairs = [(k, k) for k in range(n) if rsig[k] == tsig[k]]
+    rbad = [k for k in range(n) if rsig[k] != tsig[k]] + list(range(n, nr))
+    tbad = [k for k in range(n) if rsig[k] != tsig[k]] + list(range(n, nt))
+    return pairs, rbad, tbad
+  pairs, rbad, tbad = [], [], []
+  sm = difflib.SequenceMatcher(None, rsig, tsig, autojunk=False)
+  for op, i1, i2, j1, j2 in sm.get_opcodes():
+    if op == 'equal':
+      pairs.extend(zip(range(i1, i2), range(j1, j2)))
+    else:
+      rbad.extend(range(i1, i2))
+      tbad.extend(range(j1, j2))
+  return pairs, rbad, tbad
+
+def compare_lines(rlines, tlines, rtol=RTOL, atol=ATOL):
+  '''
+  Compares reference and test lines.  Returns (blocks, nfail) where each
+  block is (rstart, rlist, tstart, tlist) with the failing reference and
+  test line indices, and nfail is the number of failed lines.
+  '''
+  nr, nt = len(rlines), len(tlines)
+
+  # identical lines need no tokens, find the identical head and tail
+  rh = np.array([hash(x) for x in rlines], dtype=np.int64)
+  th = np.array([hash(x) for x in tlines], dtype=np.int64)
+  n = min(nr, nt)
+  diff = np.flatnonzero(rh[:n] != th[:n])
+  head = int(diff[0]) if len(diff) else n
+  diff = np.flatnonzero(rh[head:][::-1][:n-head] != th[head:][::-1][:n-head])
+  tail = int(diff[0]) if len(diff) else n - head
+  r1, t1 = nr - tail, nt - tail
+
+  # with the same length in between, first try pairing the lines that
+  # differ one to one (numbers changed, structure kept); if many of them
+  # fail, lines were shifted and the regions come from difflib instead
+  if r1 - head == t1 - head:
+    idx = head + np.flatnonzero(rh[head:r1] != th[head:t1])
+    regions = [(int(k), int(k) + 1, int(k), int(k) + 1) for k in idx]
+    blocks, nfail = _compare_regions(rlines, tlines, regions, rtol, atol)
+    if nfail <= max(10, (r1 - head)//100):
+      return blocks, nfail
+
+  sm = difflib.SequenceMatcher(None, rlines[head:r1], tlines[head:t1])
+  regions = [(i1 + head, i2 + head, j1 + head, j2 + head)
+             for op, i1, i2, j1, j2 in sm.get_opcodes() if op != 'equal']
+  return _compare_regions(rlines, tlines, regions, rtol, atol)
+
+def _compare_regions(rlines, tlines, regions, rtol, atol):
+  '''
+  Compares the changed regions (i1, i2, j1, j2) of reference and test
+  lines, returns (blocks, nfail) as compare_lines.
+  '''
+  # tokenize the lines of all changed regions once
+  ridx = np.array([k for i1, i2, j1, j2 in regions for k in range(i1, i2)], dtype=np.int64)
+  tidx = np.array([k for i1, i2, j1, j2 in regions for k in range(j1, j2)], dtype=np.int64)
+  rsig, rval, rnumline, rnoff = tokenize([rlines[k] for k in ridx])
+  tsig, tval, tnumline, tnoff = tokenize([tlines[k] for k in tidx])
+
+  # pair the lines of each region on their signatures
+  pr, pt = [], []
+  bad = []
+  a0 = b0 = 0
+  for i1, i2, j1, j2 in regions:
+    a1, b1 = a0 + i2 - i1, b0 + j2 - j1
+    pairs, rbad, tbad = _align(rsig[a0:a1], tsig[b0:b1])
+    pr.extend(a0 + p[0] for p in pairs)
+    pt.extend(b0 + p[1] for p in pairs)
+    # a pair of one token lines was a junk line in diff_chunk, skip it;
+    # lines without a partner are always reported
+    if i2 - i1 == j2 - j1:
+      junk = set(k for k in rbad if len(rsig[a0 + k].split()) == 1 and
+                 len(tsig[b0 + k].split()) == 1)
+      rbad = [k for k in rbad if k not in junk]
+      tbad = [k for k in tbad if k not in junk]
+    rbad = [i1 + k for k in rbad]
+    tbad = [j1 + k for k in tbad]
+    if rbad or tbad:
+      bad.append((rbad[0] if rbad else i1, rbad, tbad[0] if tbad else j1, tbad))
+    a0, b0 = a1, b1
+
+  # all numbers of paired lines in one comparison
+  pr = np.array(pr, dtype=np.int64)
+  pt = np.array(pt, dtype=np.int64)
+  ri = _ranges(rnoff[pr], rnoff[pr+1])
+  ti = _ranges(tnoff[pt], tnoff[pt+1])
+  a = rval[ri]
+  b = tval[ti]
+  with np.errstate(invalid='ignore'):
+    ok = np.abs(b - a) <= atol + rtol*np.abs(a)
+  ok |= (a == b) | (np.isnan(a) & np.isnan(b))
+  fail = np.flatnonzero(~ok)
+
+  blocks = []
+  lines = np.unique(np.stack([ridx[rnumline[ri[fail]]], tidx[tnumline[ti[fail]]]]), axis=1)
+  rl, tl = lines[0], lines[1]
+  # paired lines fail together, group consecutive ones into blocks
+  if len(rl):
+    brk = np.flatnonzero((np.diff(rl) != 1) | (np.diff(tl) != 1)) + 1
+    for rr, tt in zip(np.split(rl, brk), np.split(tl, brk)):
+      blocks.append((int(rr[0]), rr.tolist(), int(tt[0]), tt.tolist()))
+  blocks.extend(bad)
+
+  blocks.sort(key=lambda b: (b[2], b[0]))
+  nfail = sum(max(len(b[1]), len(b[3])) for b in blocks)
+  return blocks, nfail
+
+def CheckDir(dwork, rtol=RTOL, atol=ATOL):
+  '''
+  Compares dwork/outx3dgen with dwork/reference/outx3dgen.
+  Returns (nfail, report) with nfail = -1 if outx3dgen is missing.
+  '''
+  fromfile = os.path.join(dwork, "reference", "outx3dgen")
+  tofile = os.path.join(dwork, "outx3dgen")
+  if not os.path.exists(tofile):
+    return -1, ""
+  opts = read_tolerance(dwork, rtol, atol)
+
+  fromlines = remove_junk_from_filestream(open(fromfile,'r',newline=None,errors='replace').readlines())
+  tolines = remove_junk_from_filestream(open(tofile,'r',newline=None,errors='replace').readlines())
+  if opts['ignore']:
+    skip = re.compile("|".join("(?:%s)" % p for p in opts['ignore']))
+    fromlines = [l for l in fromlines if not skip.search(l)]
+    tolines = [l for l in tolines if not skip.search(l)]
+
+  blocks, nfail = compare_lines(fromlines, tolines, opts['rtol'], opts['atol'])
+
+  out = ["--- " + fromfile + "\t" + time.ctime(os.stat(fromfile).st_mtime),
+         "+++ " + tofile + "\t" + time.ctime(os.stat(tofile).st_mtime),
+         "Tolerance: rtol %g atol %g" % (opts['rtol'], opts['atol'])]
+  for rstart, rlist, tstart, tlist in blocks:
+    out.append("")
+    out.append("Test has " + repr(max(len(rlist), len(tlist))) + " diffs at line " + repr(tstart + 1) + " >>")
+    if len(tlist) > len(rlist):
+      out.append("Test has " + repr(len(tlist) - len(rlist)) + " extra lines in this chunk.")
+    elif len(rlist) > len(tlist):
+      out.append("Test has " + repr(len(rlist) - len(tlist)) + " missing lines in this chunk.")
+    for k in range(max(len(rlist), len(tlist))):
+      out.append(("-" + fromlines[rlist[k]]).rstrip() if k < len(rlist) else "-")
+      out.append(("+" + tolines[tlist[k]]).rstrip() if k < len(tlist) else "+")
+  out.append("")
+  out.append("Lines Essentially the Same: {0} out of {1}".format(
+             max(len(tolines) - nfail, 0), max(len(tolines), len(fromlines))))
+  return nfail, "\n".join(out)
 
 ##############################################################################
 # MAIN begin
 #
 #------------------------------------------------------------------------------
-def Check(target=None,test_dir:str=None):
+def Check(target=None,test_dir:str=None,jobs:int=1,rtol:float=RTOL,atol:float=ATOL,
+          tests:list=None,exit_on_fail:bool=True):
   '''
   Checks run and reference outx3dgen files for differences.
   If differences are higher than some threshold, fails.
 
+  Numbers are equal when |test - ref| <= atol + rtol*|ref|; a test
+  directory can override rtol/atol and ignore lines in tolerance.json.
+  Only the mismatched blocks are written to diffout_*.txt.
+
   Arguments
   ---------
       target (str):
       test_dir (str): Sub-directory to test. Default (None)
           tests all in current directory.
+      jobs (int): number of directories compared at once
+      rtol (float): default relative tolerance
+      atol (float): default absolute tolerance
+      tests (list): only check these sub-directories
+      exit_on_fail (bool): sys.exit(1) when a check fails
+
+  Returns a dict of failed line counts per directory (-1 for a missing
+  outx3dgen) when it does not exit.
   '''
 
-  debug = 0
-  JUNK='\n \t'
   errList=[]
   errmess=[]
-  rlines=[]
-  tlines=[]
-  nlines = 1
-  rmspace = 0
   ierr=0
-  ifail=0
   nfail=0
   ndirs=0
   result_dir = 0
-  diffcopy = ''
 
 # get platform
   osname="unknown"
@@ -278,14 +526,11 @@ def Check(target=None,test_dir:str=None):
   date = time.ctime()
   buff = "Start in directory: "+dtop_path+" at "+date
 
-  fref = "/reference/outx3dgen"
-  ftest = "/outx3dgen"
-
 # for each test directory
 # main loop
 
   if target == dtop:
-  	dirnames = os.listdir(dtop)
+  	dirnames = sorted(os.listdir(dtop))
   else:
   	dirnames = [target]
   	fout = dtop_path + "/diffout" + ostag + "_select.txt"
@@ -294,197 +539,69 @@ def Check(target=None,test_dir:str=None):
   wfile.write(buff+"\n")
   wfile.close()
 
+  dworks = []
   for name in dirnames:
     dwork = os.path.join(dtop,name)
 
 #---skip results directory until end 
     if (dwork == "./test_results") : 
         result_dir = 1 
-
-#---check output for each directory and reference 
-#   header --- old reference file +++ new test file 
     elif os.path.isdir(dwork):
-
         # If configured for a single test,
         # then validate that we are parsing the correct test.
         if test_dir is not None:
           if dwork.split('/')[-1] != test_dir:
             continue
+        if tests is not None and name not in tests:
+          continue
+        dworks.append(dwork)
+
+#---compare output for each directory and reference, in parallel if asked
+  if jobs > 1 and len(dworks) > 1:
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+      results = list(pool.map(CheckDir, dworks, [rtol]*len(dworks), [atol]*len(dworks)))
+  else:
+    results = [CheckDir(dwork, rtol, atol) for dwork in dworks]
+
+#---report in directory order
+  wfile = open(fout,'a')
+  for dwork, (ifail, report) in zip(dworks, results):
+    wfile.write("\n"+"Diff Summary "+'='*67+"\n\n")
+    ndirs = ndirs+1
+    buff = repr(ndirs)+" Check Directory "+dwork+" --------------------------"
+    print(buff)
+    wfile.write(buff+"\n")
 
-        wfile = open(fout,'a')
-        wfile.write("\n"+"Diff Summary "+'='*67+"\n\n")
-        ndirs = ndirs+1
-        buff = repr(ndirs)+" Check Directory "+dwork+" --------------------------"
-        print(buff)
-        wfile.write(buff+"\n")
-
-        fromfile = dwork + fref
-        tofile = dwork + ftest
-
-#-------compare the output files
-        if (os.path.exists(tofile)) : 
-
-          fromdate = time.ctime(os.stat(fromfile).st_mtime)
-          todate = time.ctime(os.stat(tofile).st_mtime)
-          fromlines = open(fromfile,'r',newline=None).readlines()
-          tolines = open(tofile,'r',newline=None).readlines()
-
-          # Remove comments + banner
-          fromlines = remove_junk_from_filestream(fromlines)
-          tolines = remove_junk_from_filestream(tolines)
-
-          icomment=0
-          ijunk=0
-          ifail=0
-          iprintatt=0
-
-          nlines=0
-          diff = difflib.unified_diff(fromlines, tolines, fromfile, tofile, fromdate, todate, nlines)
-          diffcopy = difflib.unified_diff(fromlines, tolines, fromfile, tofile, fromdate, todate, nlines)
-
-#--------       
-#         Loop through lines in diff result 
-#         write full result to diffout_*.txt, summary to screen
-#         Check the chunk from diff formatted result
-#         start with line @@ -lineno,chunksize +lineno,chunksize @@ 
-#         followed by chunksize number of lines
-#         later versions of diff allow a single number
-#         ' 'for common line -in reference file  +in test file
-
-          chunk = 0
-          for line in diff :
-            words = line.split(None)
-
-#           check to see if this is a new set of lines
-#           if chunksize are equal, compare line pairs
-#           otherwise print the whole chunk
-            if words[0].find("@") > -1 :
-               oldlins = words[1].split(',')
-               newlins = words[2].split(',')
-               tlineno = int(newlins[0][1:])
-
-#          versions of python greater than 2.5 allow single value instead of pairs
-#          avoid indexing number that may not exist
-               if (len(newlins) > 1) :
-                  tnum = int(newlins[1])
-               else :
-                  tnum = 0
-               if (len(oldlins) > 1) :
-                  rnum= int(oldlins[1])
-               else :
-                  rnum = 0
-
-               if (tnum == rnum ) : 
-                  chdr="\n"+"Test has "+repr(tnum)+" diffs at line "+repr(tlineno)+" >>"
-               elif (tnum > rnum) :
-                  ifail=ifail+(tnum-rnum)
-                  chdr="\n"+"Test has "+repr(tnum)+" diffs at line "+repr(tlineno)+" >>"
-                  chdr=chdr+"\n"+"Test has "+repr(tnum-rnum)+" extra lines in this chunk."
-               elif (rnum > tnum) :
-                  ifail=ifail+(rnum-tnum)
-                  chdr="\n"+"Test has "+repr(tnum)+" diffs at line "+repr(tlineno)+" >>"
-                  chdr=chdr+"\n"+"Test has "+repr(rnum-tnum)+" missing lines in this chunk."
-               chunk = 1
-               nread = tnum+rnum
-               iread = 0
-               rcnt = 0
-               tcnt = 0
-
-            if (chunk == 1) :
-#              compare a chunk of line pairs output from diff
-#              tlines are from test, rlines are from reference
-               if line[0] =="-" :
-                  rlines.append(line[1:])
-                  rcnt= rcnt+1
-                  iread=iread+1 
-               elif line[0] =="+" :
-                  tlines.append(line[1:])
-                  tcnt=tcnt+1
-                  iread=iread+1 
-               else :
-                  if (iread > 0) :
-                     tmp=line.rstrip()
-                     print(tmp)
-                     wfile.write(tmp+"\n")
-
-#              chunk has been read  
-               if (chunk ==  1 and iread == nread ) : 
-                  if debug : print("Compare chunk ===============================================")
-                  print(chdr) 
-                  wfile.write(chdr+"\n")
-                  ifa, ico, iju = diff_chunk(rlines,tlines,rcnt,tcnt, wfile)
-                  ifail = ifail + ifa
-                  icomment = icomment + ico
-                  ijunk = ijunk + iju
-                  rlines=[]
-                  tlines=[]
-                  chunk = 0
-
-                  count_1 = abs(int(repr(tcnt - ifa)))
-                  count_2 = abs(int(repr(tnum)))
-
-                  buff= "Lines Essentially the Same: {0} out of {1}".\
-                         format(min(count_1,count_2),max(count_1,count_2))
-                  print(buff)
-
-                  wfile.write(buff+"\n")
-
-#--------       
-#         Done with loop through lines in diff result
-          print("")
-          if icomment : 
-             buff= repr(icomment)+" comment lines."
-             wfile.write(buff+"\n")
-             print("Removed "+buff)
-          if ijunk : 
-             buff = repr(ijunk)+" junk lines."
-             wfile.write(buff+"\n")
-             print("Removed "+buff)
-          if ifail : 
-            buff = repr(ifail)+" lines failed."
-            wfile.write(buff+"\n")
-            print(buff)
-            errList.append(dwork)
-            errmess.append(repr(ifail)+" lines failed.")
-            ierr += 1
-          else :
-            buff = "No lines differ."
-            wfile.write(buff+"\n")
-            print(buff)
-          buff= repr(ndirs)+" Done with Directory "+dwork+" -----------------------"
-          print(buff)
-          wfile.write(buff+"\n")
-          print(" ")
+    if ifail < 0:
+      print("File missing: outx3dgen" )
+      errList.append(dwork)
+      errmess.append("Missing LaGriT outx3dgen file.")
+      ierr  += 1
+      nfail += 1
+    else:
+      print(report)
+      wfile.write(report+"\n")
+      if ifail : 
+        buff = repr(ifail)+" lines failed."
+        errList.append(dwork)
+        errmess.append(repr(ifail)+" lines failed.")
+        ierr += 1
+        nfail += 1
+      else :
+        buff = "No lines differ."
+      wfile.write(buff+"\n")
+      print(buff)
+      buff= repr(ndirs)+" Done with Directory "+dwork+" -----------------------"
+      print(buff)
+      wfile.write(buff+"\n")
+      print(" ")
+    wfile.write("Check done."+"\n\n")
 
-        else :
-          print("File missing: outx3dgen" )
-          errList.append(dwork)
-          errmess.append("Missing LaGriT outx3dgen file.")
-          ierr  += 1
-          nfail += 1
-
-#-------done with compare 
-        if ifail > 0: nfail += 1
-        wfile.write("Check done."+"\n\n")
-        wfile.write("Full Report from diff ========================================================="+"\n\n")
-        wfile.writelines(diffcopy)
-        wfile.write("\n"+"End Report from diff ========================================================="+"\n")
-        wfile.close()
-
-#---done with work in lower directory
-           
 # end main loop
-  wfile = open(fout,'a')
   if nfail : 
     buff = "All checks complete, "+repr(nfail)+" directories failed out of "+repr(ndirs)
     wfile.write(buff+"\n")
     print(buff)
-    sys.exit(1)
-  else :
-    buff =  "All "+repr(ndirs)+" successful!"
-    wfile.write(buff+"\n")
-    print(buff)
-  if (ierr > 0) :
     i = 0
     print("--------------------------------------")
     for d in errList :
@@ -493,18 +610,29 @@ def Check(target=None,test_dir:str=None):
       print(buff)
       print("--------------------------------------")
       i=i+1
+    wfile.close()
+    if result_dir :
+      shutil.copy2(fout, "./test_results")
+    if exit_on_fail:
+      sys.exit(1)
+    return dict((os.path.basename(d), r[0]) for d, r in zip(dworks, results))
+  else :
+    buff =  "All "+repr(ndirs)+" successful!"
+    wfile.write(buff+"\n")
+    print(buff)
 
   wfile.write("\n")
   wfile.close()
   if result_dir :
-    b = os.system('cp -p '+fout+' ./test_results')
+    shutil.copy2(fout, "./test_results")
     print("Check done."+"\n"+"Full result written to: "+"\n")
     print(fout+"\n")
     print("and copied to ./test_results "+"\n")
 
   else :
     print("Check done."+"\n"+"Full result written to "+fout+"\n")
+
+  return dict((os.path.basename(d), r[0]) for d, r in zip(dworks, results))
       
 # end Main 
 #------------------------------------------------------------------------------
-
@@ -45,6 +45,9 @@ def Clean(tag:str=None):
                     os.rename(directory, directory[:-4] + ".old" + directory[-4:])
                 elif directory.startswith("diffout_" + tag):
                     os.rename(directory, directory[:-4] + ".old" + directory[-4:])
+                elif directory.startswith("report_" + tag) and ".old." not in directory:
+                    root, ext = os.path.splitext(directory)
+                    os.rename(directory, root + ".old" + ext)
         except Exception as e:
             print(e)
     print("Done. All output files removed from directories.\n")
\ No newline at end of file
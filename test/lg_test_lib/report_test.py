@@ -0,0 +1,107 @@
+#------------------------------------------------------------------------------
+#  Name: report_test.py
+#
+#  Runs a LaGriT process while recording its wall time, user/sys CPU time
+#  and maximum resident set size, and writes the per-test numbers of a
+#  RunTest pass to report_<tag>.json and report_<tag>.xml (JUnit format)
+#  next to stdout_<tag>.txt.
+#------------------------------------------------------------------------------
+
+import os, sys, time, json, subprocess
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+__all__ = ["RunTimed", "WriteReport"]
+
+#------------------------------------------------------------------------------
+def RunTimed(cmd, **kwargs):
+    '''
+    Runs cmd with subprocess.Popen and reaps it with os.wait4, so the
+    resource usage belongs to this process (and the children it waited for)
+    even when several tests run at once from threads.
+
+    Arguments
+    ---------
+       cmd (str or list): command, a str is run through the shell
+       kwargs: passed on to subprocess.Popen (cwd, stdin, stdout, ...)
+
+    Returns (exit code, usage) where usage is an OrderedDict with wall,
+    user and sys in seconds and maxrss in kilobytes.
+    '''
+    kwargs.setdefault('shell', isinstance(cmd, str))
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, **kwargs)
+    pid, status, ru = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    maxrss = ru.ru_maxrss // 1024 if sys.platform == 'darwin' else ru.ru_maxrss
+    usage = OrderedDict([('wall', round(wall, 6)),
+                         ('user', round(ru.ru_utime, 6)),
+                         ('sys', round(ru.ru_stime, 6)),
+                         ('maxrss', maxrss)])
+    return proc.returncode, usage
+
+#------------------------------------------------------------------------------
+def WriteReport(tests, tag, executable, suite=None, dtop_path=None):
+    '''
+    Writes report_<tag>.json and report_<tag>.xml for one RunTest pass.
+
+    Arguments
+    ---------
+       tests (list): one OrderedDict per test with name, exit_code,
+           completed and the usage keys returned by RunTimed
+       tag (str): output file name tag, as in stdout_<tag>.txt
+       executable (str): LaGriT binary that was tested
+       suite (str): suite name, default is the directory name
+       dtop_path (str): directory to write to, default current directory
+
+    Returns the names of the two files written.
+    '''
+    if dtop_path is None:
+        dtop_path = os.getcwd()
+    if suite is None:
+        suite = os.path.basename(os.path.abspath(dtop_path))
+
+    failed = [t for t in tests if t['exit_code'] != 0 or not t['completed']]
+    total = OrderedDict()
+    for key in ('wall', 'user', 'sys'):
+        total[key] = round(sum(t.get(key, 0.0) for t in tests), 6)
+    total['maxrss'] = max([t.get('maxrss', 0) for t in tests] or [0])
+
+    report = OrderedDict([('suite', suite),
+                          ('tag', tag),
+                          ('executable', os.path.abspath(executable)),
+                          ('platform', sys.platform),
+                          ('date', time.ctime()),
+                          ('tests', len(tests)),
+                          ('failures', len(failed)),
+                          ('total', total),
+                          ('results', tests)])
+    fjson = os.path.join(dtop_path, "report_" + tag + ".json")
+    with open(fjson, 'w') as fh:
+        json.dump(report, fh, indent=2)
+        fh.write("\n")
+
+    # JUnit XML, resource numbers are kept as testcase properties
+    root = ET.Element('testsuite', name=suite, tests=str(len(tests)),
+                      failures=str(len(failed)), errors='0',
+                      time='%.3f' % total['wall'])
+    for t in tests:
+        case = ET.SubElement(root, 'testcase', classname=suite,
+                             name=t['name'], time='%.3f' % t.get('wall', 0.0))
+        props = ET.SubElement(case, 'properties')
+        for key in ('user', 'sys', 'maxrss'):
+            if key in t:
+                ET.SubElement(props, 'property', name=key, value=str(t[key]))
+        if t['exit_code'] != 0:
+            ET.SubElement(case, 'failure', type='exit',
+                          message='Exit code: %d' % t['exit_code'])
+        elif not t['completed']:
+            ET.SubElement(case, 'failure', type='incomplete',
+                          message='LaGriT did not complete successfully')
+    fxml = os.path.join(dtop_path, "report_" + tag + ".xml")
+    ET.ElementTree(root).write(fxml, encoding='utf-8', xml_declaration=True)
+
+    return fjson, fxml
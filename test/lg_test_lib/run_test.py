@@ -16,8 +16,11 @@
 #
 #------------------------------------------------------------------------------
 
-import fileinput, string, os, sys, datetime, time, shutil
-__all__ = ["directoryList", "RunTest"]
+import fileinput, string, os, sys, datetime, time, shutil, shlex, subprocess, tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .report_test import RunTimed, WriteReport
+__all__ = ["directoryList", "RunIsolated", "RunTest"]
 
 ##############################################################################
 # Routines listed here, main at bottom
@@ -34,6 +37,61 @@ def directoryList( unused, dirName, fileList ):
         
     print(dirName+" has "+repr(icount)+" files.")
 
+#------------------------------------------------------------------------------
+# Routine: _walkFiles()
+# regular files below a directory as paths relative to it
+#------------------------------------------------------------------------------
+def _walkFiles(top):
+    files = []
+    for dirName, subdirs, fileList in os.walk(top):
+        rel = os.path.relpath(dirName, top)
+        for f in fileList:
+            if os.path.isfile(os.path.join(dirName, f)):
+                files.append(os.path.normpath(os.path.join(rel, f)))
+    return files
+
+#------------------------------------------------------------------------------
+# Routine: RunIsolated()
+# runs one test in a temporary copy of its directory
+#------------------------------------------------------------------------------
+def RunIsolated(path, xlagrit, flags, tmpdir=None, copy_back=True):
+    '''
+    Runs input.lgi of test directory path inside a temporary copy of the
+    directory, so that concurrent tests cannot clobber each other's
+    outx3dgen, logx3dgen or scratch files.  The reference directory is not
+    copied.  Files created or modified by the run, also in subdirectories,
+    are copied back into the test directory so Check sees the same layout
+    as a serial run, unless copy_back is False (benchmark repeats).
+
+    Returns (exit code, screen output, usage) with usage as from RunTimed.
+    '''
+    path = os.path.abspath(path)
+    name = os.path.basename(path)
+    work = tempfile.mkdtemp(prefix="lgtest_" + name + "_", dir=tmpdir)
+    try:
+        wdir = os.path.join(work, name)
+        shutil.copytree(path, wdir, ignore=shutil.ignore_patterns("reference"))
+        before = dict((f, os.stat(os.path.join(wdir, f)).st_mtime)
+                      for f in _walkFiles(wdir))
+        flog = os.path.join(work, "screen.txt")
+        with open(os.path.join(wdir, "input.lgi"), "r") as fin, \
+             open(flog, "w") as fscr:
+            code, usage = RunTimed([xlagrit] + shlex.split(flags), cwd=wdir,
+                                   stdin=fin, stdout=fscr,
+                                   stderr=subprocess.STDOUT)
+        for f in _walkFiles(wdir) if copy_back else []:
+            src = os.path.join(wdir, f)
+            if f not in before or os.stat(src).st_mtime != before[f]:
+                dst = os.path.join(path, f)
+                if not os.path.isdir(os.path.dirname(dst)):
+                    os.makedirs(os.path.dirname(dst))
+                shutil.copy2(src, dst)
+        with open(flog, "r", errors="replace") as fscr:
+            screen = fscr.read()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return code, screen, usage
+
 ##############################################################################
 # MAIN begin
 #
@@ -44,12 +102,15 @@ def directoryList( unused, dirName, fileList ):
 #------------------------------------------------------------------------------
 
 # executes the tests in directories
+# returns a list with the exit code, completion and resource usage per test,
+# also written to report_<tag>.json and report_<tag>.xml
 def RunTest(**args):
 
   # dirList = []
   errList = []
   errmess = []
   errors = {'general': []} # USE THIS EVENTUALLY
+  results = []
   ierr = 0
   itest = 0
   osname="unknown"
@@ -65,6 +126,8 @@ def RunTest(**args):
   except KeyError:
     test_dir = None
 
+  # optional list of test directory names to run, the others are skipped
+  tests = args.get("tests")
 
   dtop = os.curdir # getting top level directory
   dtop_path = os.getcwd() # getting filepath to top directory
@@ -79,6 +142,11 @@ def RunTest(**args):
   except KeyError:
     fail_threshold = 0
 
+  # number of tests run at once; each parallel test runs in a temporary
+  # copy of its directory and its screen output is merged in order
+  jobs = args.get("jobs") or 1
+  directories = sorted(directories)
+
   print("=======")
 
   for name in directories:
@@ -102,6 +170,26 @@ def RunTest(**args):
   wfile.write(line + "\n")
   wfile.close()
 
+# start parallel runs, results are collected in directory order below
+  running = {}
+  if jobs > 1:
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    for name in directories:
+      if name == "test_results" or not os.path.isdir(name):
+        continue
+      if test_dir is not None and name != test_dir:
+        continue
+      if tests is not None and name not in tests:
+        continue
+      if os.path.exists(os.path.join(name, "outx3dgen")):
+        shutil.copyfile(os.path.join(name, "outx3dgen"),
+                        os.path.join(name, "prev_outx3dgen"))
+        os.remove(os.path.join(name, "outx3dgen"))
+      if os.path.exists(os.path.join(name, "input.lgi")):
+        running[name] = pool.submit(RunIsolated, os.path.join(dtop_path, name),
+                                    xlagrit, flags)
+    pool.shutdown(wait=False)
+
 # for each test directory
 # main loop
   # for index, name in enumerate(os.listdir(dtop)):
@@ -121,6 +209,8 @@ def RunTest(**args):
         if test_dir is not None:
           if name != test_dir:
             continue
+        if tests is not None and name not in tests:
+          continue
 
         errmess.append("empty")
         os.chdir(name)
@@ -133,16 +223,33 @@ def RunTest(**args):
         wfile.write(line + "\n")
         wfile.close()
 
-        if os.path.exists("outx3dgen"):
+        if name not in running and os.path.exists("outx3dgen"):
             shutil.copyfile("outx3dgen", "prev_outx3dgen")
             # for f in [ f for f in os.listdir('.') if f.startswith("out")]:
             #     os.remove(f)
             os.remove("outx3dgen")
 
         if (os.path.exists("input.lgi")) : 
-          cmd = xlagrit + " " + flags + " < input.lgi >> " + fscreen
-          print(cmd)
-          fo1 = os.system(cmd)
+          if name in running:
+            print("%s %s < input.lgi  (isolated, %d jobs)" % (xlagrit, flags, jobs))
+            fo1, screen, usage = running.pop(name).result()
+            wfile = open(fscreen, 'a')
+            wfile.write(screen)
+            wfile.close()
+          else:
+            cmd = xlagrit + " " + flags + " < input.lgi >> " + fscreen
+            print(cmd)
+            offset = os.path.getsize(fscreen)
+            fo1, usage = RunTimed(cmd)
+            rfile = open(fscreen, 'r', errors='replace')
+            rfile.seek(offset)
+            screen = rfile.read()
+            rfile.close()
+          results.append(OrderedDict([('name', name), ('exit_code', fo1),
+                                      ('completed', "successfully" in screen)]))
+          results[-1].update(usage)
+          print("  wall %.2fs  user %.2fs  sys %.2fs  maxrss %d kB" %
+                tuple(usage.values()))
           if fo1 != 0:
             print("System exit: %s" % fo1)
             errList.append(repr(itest) + " " + dwork)
@@ -155,6 +262,8 @@ def RunTest(**args):
           errmess[ierr] = "Missing LaGriT input file."
           ierr = ierr + 1
           errors[name].append(str(itest) + " ERROR: input.lgi file does not exist.")
+          results.append(OrderedDict([('name', name), ('exit_code', -1),
+                                      ('completed', False)]))
         
         os.chdir(dtop_path)
 #---done with work in lower directory
@@ -186,6 +295,8 @@ def RunTest(**args):
 
   rfile.close()
 
+  freport = WriteReport(results, tag, xlagrit, dtop_path=dtop_path)
+
 # attempt to pass error conditions if found
   if (ierr > 0) :
     i = 0
@@ -204,14 +315,25 @@ def RunTest(**args):
   if fail_threshold and ierr >= fail_threshold:
     sys.exit(1)
 
+  nslow = sorted(results, key=lambda t: -t.get('wall', 0.0))[:5]
+  print("\nSlowest tests:")
+  for t in nslow:
+    if 'wall' in t:
+      print("  %-40s %8.2fs %10d kB" % (t['name'], t['wall'], t['maxrss']))
+
   print("\nSummary:\t\t%s completed outx3dgen files out of %s test directories" % (repr(nfind), repr(itest)))
   
   if result_dir:
     shutil.copyfile(outfile, "./test_results/" + outfile)
+    for f in freport:
+      shutil.copyfile(f, "./test_results/" + os.path.basename(f))
     print("Output written to:\t%s\nAnd moved to:\t\t./test_results\n" % outfile)
   else:
     errors['general'].append("Warning: No test_results directory.")
     print("LaGriT outx3dgen and screen output written to: %s\n" % outfile)
+  print("Timing report written to:\t%s\n" % ", ".join(os.path.basename(f) for f in freport))
+
+  return results
       
 # end Main 
 #------------------------------------------------------------------------------
@@ -0,0 +1,260 @@
+#------------------------------------------------------------------------------
+#  Name: scaling_test.py
+#
+#  Synthetic scaling benchmarks for hot LaGriT commands.  Writes one test
+#  directory per command and mesh size (command_nodes/input.lgi), runs them
+#  through RunTest, and fits time ~ nodes**p and memory ~ nodes**q to the
+#  per-test reports.  Results go to scaling_<tag>.json and, when matplotlib
+#  is available, scaling_<tag>.png.
+#------------------------------------------------------------------------------
+
+import os, sys, json, re
+from collections import OrderedDict
+import numpy as np
+from .run_test import RunTest
+
+__all__ = ["COMMANDS", "SIZES", "WriteInputs", "Fit", "Plot", "Scaling"]
+
+SIZES = [10**4, 10**5, 10**6, 10**7]
+
+#------------------------------------------------------------------------------
+# input generators, each returns the lines of input.lgi for about n nodes
+
+def _edge(n, dim=3):
+    return max(2, int(round(n**(1.0/dim))))
+
+def _connect(n):
+    k = _edge(n)
+    return ["cmo / create / cmo / / / tet",
+            "createpts / xyz / %d %d %d / 0. 0. 0. / 1. 1. 1. / 1 1 1" % (k, k, k),
+            "# break the lattice symmetry so the Delaunay tets are unique",
+            "perturb / 1 0 0 / %g %g %g" % ((0.1/k,)*3),
+            "cmo / setatt / cmo / imt / 1 0 0 / 1",
+            "connect / noadd",
+            "resetpts / itp",
+            "quality"]
+
+def _refine(n):
+    # one uniform refinement of every hex multiplies the nodes by about 8
+    k = _edge(n/8.0)
+    return ["cmo / create / cmo_hex / / / hex",
+            "createpts / brick / xyz / %d %d %d / 0. 0. 0. / 1. 1. 1. / 1 1 1" % (k, k, k),
+            "cmo / setatt / cmo_hex / imt / 1 0 0 / 1",
+            "cmo / setatt / cmo_hex / itetclr / 1 0 0 / 1",
+            "refine / constant / imt1 / linear / element / 1 0 0 / -1. 0. 0. / inclusive",
+            "resetpts / itp",
+            "cmo / status / cmo_hex / brief",
+            "quality"]
+
+def _massage(n):
+    k = _edge(n)
+    h = 1.0/(k - 1)
+    return ["cmo / create / cmo_hex / / / hex",
+            "createpts / brick / xyz / %d %d %d / 0. 0. 0. / 1. 1. 1. / 1 1 1" % (k, k, k),
+            "cmo / setatt / cmo_hex / imt / 1 0 0 / 1",
+            "hextotet / 6 / cmo / cmo_hex",
+            "cmo / delete / cmo_hex",
+            "cmo / select / cmo",
+            "resetpts / itp",
+            "massage / %g %g %g / 1 0 0 /" % (1.2*h, 0.6*h, 0.05*h),
+            "quality"]
+
+def _interpolate(n):
+    # source and sink have about n nodes each
+    k = _edge(n)
+    return ["cmo / create / cmo_hex / / / hex",
+            "createpts / brick / xyz / %d %d %d / 0. 0. 0. / 1. 1. 1. / 1 1 1" % (k, k, k),
+            "hextotet / 6 / cmo_src / cmo_hex",
+            "cmo / delete / cmo_hex",
+            "cmo / addatt / cmo_src / xval / VDOUBLE / scalar / nnodes",
+            "cmo / copyatt / cmo_src cmo_src / xval xic",
+            "cmo / create / cmo_sink / / / tet",
+            "createpts / xyz / %d %d %d / 0. 0. 0. / 1. 1. 1. / 1 1 1" % (k, k, k),
+            "perturb / 1 0 0 / %g %g %g" % ((0.25/k,)*3),
+            "cmo / addatt / cmo_sink / xval / VDOUBLE / scalar / nnodes",
+            "intrp / continuous / cmo_sink xval / 1 0 0 / cmo_src xval",
+            "cmo / printatt / cmo_sink / xval / minmax"]
+
+def _stack(n, nlayers=10):
+    # nlayers + 1 triangulated surfaces of n/(nlayers + 1) nodes each
+    k = _edge(n/float(nlayers + 1), 2)
+    lines = ["cmo / create / mosurf / / / triplane",
+             "createpts / xyz / %d %d 1 / 0. 0. 0. / 1. 1. 0. / 1 1 1" % (k, k),
+             "perturb / 1 0 0 / %g %g 0." % ((0.1/k,)*2),
+             "cmo / setatt / mosurf / imt / 1 0 0 / 1",
+             "connect",
+             "cmo / setatt / mosurf / itetclr / 1 0 0 / 1"]
+    files = []
+    for i in range(nlayers + 1):
+        lines += ["cmo / setatt / mosurf / zic / 1 0 0 / %g" % (0.1*i),
+                  "dump / avs / tmp_surf_%02d.inp / mosurf / 1 1 0 0" % i]
+        files.append("tmp_surf_%02d.inp" % i)
+    layers = " / ".join("%s %d" % (f, i + 1) for i, f in enumerate(files))
+    lines += ["cmo / create / mostack / / / tri",
+              "stack / layers / avs / " + layers,
+              "stack / fill / moprism / mostack",
+              "resetpts / itp",
+              "quality"]
+    return lines
+
+def _brick(k):
+    return ["cmo / create / mohex / / / hex",
+            "createpts / brick / xyz / %d %d %d / 0. 0. 0. / 1. 1. 1. / 1 1 1" % (k, k, k),
+            "cmo / setatt / mohex / imt / 1 0 0 / 1",
+            "cmo / setatt / mohex / itetclr / 1 0 0 / 1",
+            "resetpts / itp"]
+
+def _dump_fehm(n):
+    # tet mesh, the sparse matrix (stor) computation is the expensive part
+    return _brick(_edge(n)) + ["hextotet / 6 / motet / mohex",
+                               "cmo / delete / mohex",
+                               "cmo / select / motet",
+                               "resetpts / itp",
+                               "dump / fehm / out_fehm / motet"]
+
+def _dump_exo(n):
+    return _brick(_edge(n)) + ["dump / exo / out_mesh.exo / mohex"]
+
+COMMANDS = OrderedDict([('connect', _connect),
+                        ('refine', _refine),
+                        ('massage', _massage),
+                        ('interpolate', _interpolate),
+                        ('stack', _stack),
+                        ('dump_fehm', _dump_fehm),
+                        ('dump_exo', _dump_exo)])
+
+#------------------------------------------------------------------------------
+def WriteInputs(outdir, commands=None, sizes=None):
+    '''
+    Writes outdir/<command>_<nodes>/input.lgi for each command and size.
+
+    Arguments
+    ---------
+       outdir (str): directory to write to, created if missing
+       commands (list): names from COMMANDS, default all
+       sizes (list): approximate node counts, default SIZES
+
+    Returns the test directory names written.
+    '''
+    commands = list(COMMANDS) if commands is None else commands
+    sizes = SIZES if sizes is None else sizes
+    unknown = [c for c in commands if c not in COMMANDS]
+    if unknown:
+        raise KeyError("Unknown scaling command(s): %s, choose from %s" %
+                       (", ".join(unknown), ", ".join(COMMANDS)))
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    names = []
+    for c in commands:
+        for n in sizes:
+            name = "%s_%d" % (c, n)
+            if not os.path.isdir(os.path.join(outdir, name)):
+                os.mkdir(os.path.join(outdir, name))
+            lines = ["# scaling benchmark %s, about %d nodes" % (c, n)]
+            lines += COMMANDS[c](n) + ["finish", ""]
+            with open(os.path.join(outdir, name, "input.lgi"), 'w') as fh:
+                fh.write("\n".join(lines))
+            names.append(name)
+    return names
+
+#------------------------------------------------------------------------------
+def Fit(results):
+    '''
+    Groups RunTest records named <command>_<nodes> by command and fits
+    log(wall) and log(maxrss) against log(nodes) by least squares.
+
+    Returns an OrderedDict per command with nodes, wall, maxrss and the
+    exponents time_exponent and memory_exponent (None with fewer than two
+    completed sizes).
+    '''
+    table = OrderedDict()
+    for t in results:
+        m = re.match(r"(.+)_(\d+)$", t['name'])
+        if m is None or t['exit_code'] != 0 or 'wall' not in t:
+            continue
+        row = table.setdefault(m.group(1), OrderedDict([('nodes', []), ('wall', []), ('maxrss', [])]))
+        row['nodes'].append(int(m.group(2)))
+        row['wall'].append(t['wall'])
+        row['maxrss'].append(t['maxrss'])
+
+    for c, row in table.items():
+        order = np.argsort(row['nodes'])
+        for key in ('nodes', 'wall', 'maxrss'):
+            row[key] = [row[key][i] for i in order]
+        n = np.log(np.asarray(row['nodes'], dtype=float))
+        row['time_exponent'] = None
+        row['memory_exponent'] = None
+        if len(n) >= 2:
+            wall = np.maximum(np.asarray(row['wall'], dtype=float), 1e-6)
+            mem = np.maximum(np.asarray(row['maxrss'], dtype=float), 1.0)
+            row['time_exponent'] = round(float(np.polyfit(n, np.log(wall), 1)[0]), 3)
+            row['memory_exponent'] = round(float(np.polyfit(n, np.log(mem), 1)[0]), 3)
+    return table
+
+#------------------------------------------------------------------------------
+def Plot(table, filename):
+    '''
+    Log-log plot of wall time and max RSS against nodes per command.
+    Returns False when matplotlib is not available.
+    '''
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        return False
+
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
+    for c, row in table.items():
+        ax1.loglog(row['nodes'], row['wall'], 'o-',
+                   label="%s (p=%s)" % (c, row['time_exponent']))
+        ax2.loglog(row['nodes'], np.asarray(row['maxrss'])/1024., 'o-',
+                   label="%s (q=%s)" % (c, row['memory_exponent']))
+    ax1.set_xlabel('nodes')
+    ax1.set_ylabel('wall time (s)')
+    ax2.set_xlabel('nodes')
+    ax2.set_ylabel('max RSS (MB)')
+    for ax in (ax1, ax2):
+        ax.grid(True, which='both', alpha=0.3)
+        ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(filename, dpi=100)
+    plt.close(fig)
+    return True
+
+#------------------------------------------------------------------------------
+def Scaling(outdir, executable, flags, tag, commands=None, sizes=None, jobs=1):
+    '''
+    Writes the scaling inputs to outdir, runs them with RunTest and writes
+    scaling_<tag>.json (and scaling_<tag>.png) in outdir.  Run with jobs=1
+    for clean numbers, concurrent tests share memory bandwidth.
+
+    Returns the table from Fit.
+    '''
+    names = WriteInputs(outdir, commands, sizes)
+    cwd = os.getcwd()
+    os.chdir(outdir)
+    try:
+        results = RunTest(tag=tag, executable=executable, flags=flags, jobs=jobs,
+                          tests=names)
+    finally:
+        os.chdir(cwd)
+    table = Fit(results)
+
+    print("\nScaling exponents, time ~ nodes**p, memory ~ nodes**q")
+    for c, row in table.items():
+        print("  %-12s p = %-6s q = %-6s (%s)" % (c, row['time_exponent'], row['memory_exponent'],
+              ", ".join("%d:%.2fs" % (n, w) for n, w in zip(row['nodes'], row['wall']))))
+
+    fjson = os.path.join(outdir, "scaling_" + tag + ".json")
+    with open(fjson, 'w') as fh:
+        json.dump(table, fh, indent=2)
+        fh.write("\n")
+    print("Scaling results written to: %s" % fjson)
+    fpng = os.path.join(outdir, "scaling_" + tag + ".png")
+    if Plot(table, fpng):
+        print("Scaling plot written to: %s" % fpng)
+    else:
+        print("matplotlib not available, no plot written")
+    return table
@@ -44,10 +44,27 @@ def main(argv=None):
     parser.add_argument("-exe", "--executable", help = "Path to executable for testing", action = "store", type = str, default = xlagrit)
     parser.add_argument("-fl", "--flags", help = "Command line flags to pass to LaGriT on run", action = "store", type = str, default = "-log logx3dgen -out outx3dgen")
     parser.add_argument("-hf", "--hard_fail", help = "Quits and returns non-zero exit code on failed test", action = "store", type = int, nargs = 1, default = 0)
+    parser.add_argument("-j", "--jobs", help = "Number of tests to run at once, each in a temporary copy of its directory", action = "store", type = int, default = 1)
+    parser.add_argument("--rtol", help = "Relative tolerance for numbers in the check; a test's tolerance.json overrides it", action = "store", type = float, default = lg_test.chk.RTOL)
+    parser.add_argument("--atol", help = "Absolute tolerance for numbers in the check; a test's tolerance.json overrides it", action = "store", type = float, default = lg_test.chk.ATOL)
+    parser.add_argument("-b", "--bench", help = "Time the selected tests (-l/-s, default all) against the performance baseline; fails on slow down", action = "store_true")
+    parser.add_argument("--repeat", help = "Runs per test in --bench mode, the median is used", action = "store", type = int, default = 5)
+    parser.add_argument("--threshold", help = "Allowed relative slow down in --bench mode (0.1 = 10%%)", action = "store", type = float, default = 0.1)
+    parser.add_argument("--min_time", help = "Baseline time (s) below which --bench ignores slow downs", action = "store", type = float, default = 0.1)
+    parser.add_argument("--baseline", help = "Baseline JSON file for --bench; default bench_baseline.json", action = "store", type = str, default = None)
+    parser.add_argument("--ref", help = "Executable hash (prefix) of the baseline entry to compare to; default the latest other executable", action = "store", type = str, default = None)
+    parser.add_argument("--no_save", help = "Do not record the --bench medians in the baseline", action = "store_true")
+    parser.add_argument("--scaling", help = "Generate and run synthetic scaling benchmarks in directory SCALING, fit time/memory exponents", action = "store", type = str, nargs = "?", const = "scaling", default = None)
+    parser.add_argument("--sizes", help = "Node counts for --scaling; default 1e4 1e5 1e6 1e7", action = "store", type = float, nargs = "+", default = None)
+    parser.add_argument("--commands", help = "Benchmarks for --scaling; default %s" % " ".join(lg_test.scaling.COMMANDS), action = "store", type = str, nargs = "+", default = None)
+    parser.add_argument("--changed", help = "Run and check only tests (-l/-s, default all) whose inputs, relevant sources or executable changed", action = "store_true")
+    parser.add_argument("--cache", help = "Cache file for --changed; default changed_cache.json", action = "store", type = str, default = None)
+    parser.add_argument("--src", help = "LaGriT source directory hashed by --changed; default ../src", action = "store", type = str, default = None)
+    parser.add_argument("--trust_keywords", help = "With --changed, skip tests whose executable changed with sources that match none of their commands", action = "store_true")
     args = parser.parse_args()
 
     # If no valid options, raise help screen
-    if not (args.level or args.full or args.clean or args.test or args.check or args.single):
+    if not (args.level or args.full or args.clean or args.test or args.check or args.single or args.bench or args.scaling or args.changed):
         args = parser.parse_args("--help".split())
         sys.exit(2)
 
@@ -56,6 +73,38 @@ def main(argv=None):
     lg_test.lagrit_exe = args.executable
     lg_test.flags = args.flags
     lg_test.checkdir = args.checkdir
+    lg_test.jobs = max(1, args.jobs)
+    lg_test.baseline = args.baseline
+    lg_test.rtol = args.rtol
+    lg_test.atol = args.atol
+
+    # Tests selected by -s or -l, default all, for --bench and --changed
+    if args.bench or args.changed:
+        if args.single:
+            tests = [os.path.normpath(args.single)]
+        else:
+            levels = [test_dir_root+str(args.level[0])] if args.level else sorted(lg_test.all_levels)
+            tests = [t for level in levels for t in lg_test.ListTests(level)]
+
+    if args.changed:
+        nfail = lg_test.TestChanged(tests, cache=args.cache, src_dir=args.src,
+                                    trust_keywords=args.trust_keywords)
+        return 1 if nfail else 0
+
+    if args.bench:
+        # Benchmark selected tests against the baseline
+        nfail = lg_test.TestBench(tests,
+                                  repeat=args.repeat,
+                                  threshold=args.threshold,
+                                  min_time=args.min_time,
+                                  ref=args.ref,
+                                  save=not args.no_save)
+        return 1 if nfail else 0
+
+    if args.scaling:
+        sizes = [int(n) for n in args.sizes] if args.sizes else None
+        lg_test.TestScaling(args.scaling, commands=args.commands, sizes=sizes)
+        return 0
 
     if args.full:
 
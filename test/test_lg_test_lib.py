@@ -0,0 +1,363 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+import numpy
+from lg_test_lib import report_test, scaling_test, check_test, changed_test
+
+def record(name,exit_code=0,completed=True,**usage):
+    #Utility to build a RunTest record of one test.
+    rec = OrderedDict([('name',name),('exit_code',exit_code),('completed',completed)])
+    rec.update(usage)
+    return rec
+
+class TestReport(unittest.TestCase):
+    '''
+    Test Harness Report Test
+
+    Represents a test of the JSON and JUnit XML reports of a RunTest pass.
+    '''
+
+    def setUp(self):
+        #Sets up a scratch directory to write reports to.
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_write_report(self):
+        '''
+        Test the Report Files
+
+        Tests that totals, failures and per-test usage are written to both
+        reports, with failing exit codes and incomplete runs as failures.
+        '''
+
+        tests = [record('connect_cube',wall=1.5,user=1.25,sys=0.25,maxrss=2000),
+                 record('refine',exit_code=3,wall=0.5,user=0.25,sys=0.125,maxrss=5000),
+                 record('stack',completed=False,wall=2.,user=1.,sys=0.5,maxrss=1000),
+                 record('missing',exit_code=-1,completed=False)]
+        fjson,fxml = report_test.WriteReport(tests,'linux','/usr/bin/lagrit',dtop_path=self.tmp)
+        self.assertEqual(fjson,os.path.join(self.tmp,'report_linux.json'))
+        self.assertEqual(fxml,os.path.join(self.tmp,'report_linux.xml'))
+
+        with open(fjson) as fh:
+            rep = json.load(fh)
+        self.assertEqual(rep['suite'],os.path.basename(self.tmp))
+        self.assertEqual(rep['tag'],'linux')
+        self.assertEqual(rep['tests'],4)
+        self.assertEqual(rep['failures'],3)
+        self.assertEqual(rep['total'],{'wall':4.,'user':2.5,'sys':0.875,'maxrss':5000})
+        self.assertEqual([t['name'] for t in rep['results']],['connect_cube','refine','stack','missing'])
+
+        root = ET.parse(fxml).getroot()
+        self.assertEqual(root.tag,'testsuite')
+        self.assertEqual((root.get('tests'),root.get('failures'),root.get('time')),('4','3','4.000'))
+        cases = dict((c.get('name'),c) for c in root.findall('testcase'))
+        self.assertIsNone(cases['connect_cube'].find('failure'))
+        self.assertEqual(cases['refine'].find('failure').get('type'),'exit')
+        self.assertEqual(cases['refine'].find('failure').get('message'),'Exit code: 3')
+        self.assertEqual(cases['stack'].find('failure').get('type'),'incomplete')
+        props = dict((p.get('name'),p.get('value')) for p in cases['connect_cube'].iter('property'))
+        self.assertEqual(props,{'user':'1.25','sys':'0.25','maxrss':'2000'})
+        self.assertEqual(list(cases['missing'].iter('property')),[])
+
+    def test_write_report_empty(self):
+        '''
+        Test the Empty Report
+
+        Tests that a pass without tests writes zero totals and a suite name.
+        '''
+
+        fjson,fxml = report_test.WriteReport([],'mac','lagrit',suite='level01',dtop_path=self.tmp)
+        with open(fjson) as fh:
+            rep = json.load(fh)
+        self.assertEqual(rep['suite'],'level01')
+        self.assertEqual((rep['tests'],rep['failures']),(0,0))
+        self.assertEqual(rep['total']['maxrss'],0)
+        self.assertEqual(ET.parse(fxml).getroot().get('tests'),'0')
+
+class TestScaling(unittest.TestCase):
+    '''
+    Test Harness Scaling Test
+
+    Represents a test of the scaling benchmark inputs and exponent fit.
+    '''
+
+    def test_fit(self):
+        '''
+        Test the Scaling Fit
+
+        Tests that exact power laws give their exponents, that records are
+        grouped by command and sorted by nodes, and that failed or
+        unmatched runs are left out.
+        '''
+
+        tests = []
+        for n in [10**6,10**4,10**5]:
+            tests.append(record('connect_%d'%n,wall=2.e-6*n**1.5,maxrss=int(n)))
+            tests.append(record('dump_fehm_%d'%n,wall=1.e-3*n,maxrss=int(4*n**0.5)))
+        tests.append(record('refine_10000',wall=1.,maxrss=100))
+        tests.append(record('refine_100000',exit_code=1,wall=5.,maxrss=200))
+        tests.append(record('massage_10000',exit_code=0,completed=False))
+        tests.append(record('level01',wall=1.,maxrss=1))
+        table = scaling_test.Fit(tests)
+        self.assertEqual(list(table),['connect','dump_fehm','refine'])
+        self.assertEqual(table['connect']['nodes'],[10**4,10**5,10**6])
+        self.assertEqual(table['connect']['maxrss'],[10**4,10**5,10**6])
+        self.assertAlmostEqual(table['connect']['time_exponent'],1.5)
+        self.assertAlmostEqual(table['connect']['memory_exponent'],1.)
+        self.assertAlmostEqual(table['dump_fehm']['time_exponent'],1.)
+        self.assertAlmostEqual(table['dump_fehm']['memory_exponent'],0.5,places=2)
+        self.assertEqual(table['refine']['nodes'],[10**4])
+        self.assertIsNone(table['refine']['time_exponent'])
+        self.assertIsNone(table['refine']['memory_exponent'])
+        json.dumps(table)
+
+    def test_write_inputs(self):
+        '''
+        Test the Scaling Inputs
+
+        Tests that one input.lgi is written per command and size and that
+        unknown commands are rejected.
+        '''
+
+        tmp = tempfile.mkdtemp()
+        try:
+            names = scaling_test.WriteInputs(tmp,['connect','stack'],[1000,8000])
+            self.assertEqual(names,['connect_1000','connect_8000','stack_1000','stack_8000'])
+            for name in names:
+                with open(os.path.join(tmp,name,'input.lgi')) as fh:
+                    self.assertEqual(fh.read().splitlines()[-1],'finish')
+            self.assertRaises(KeyError,scaling_test.WriteInputs,tmp,['connect','nope'])
+        finally:
+            shutil.rmtree(tmp)
+
+class TestCheck(unittest.TestCase):
+    '''
+    Test Harness Check Test
+
+    Represents a test of the tolerance-aware compare of outx3dgen files.
+    '''
+
+    def setUp(self):
+        #Sets up reference lines and a scratch test directory.
+        self.ref = ['Program: LaGriT V3.3',
+                    'nnodes: 1000 nelements: 4000',
+                    'volume 1.234567E+02 area 5.000000D+01',
+                    'min 1.0-100 max 2.5+003',
+                    'finish']
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_tokenize(self):
+        '''
+        Test the Tokenizer
+
+        Tests the signatures, values and offsets of lines, including the
+        Fortran exponent forms and integer ranges that stay text.
+        '''
+
+        sigs,values,numline,noff = check_test.tokenize(self.ref+['range 1-100 1D5 .5 -3'])
+        self.assertEqual(sigs[1],'nnodes: \x00 nelements: \x00')
+        self.assertEqual(sigs[5],'range 1-100 \x00 \x00 \x00')
+        self.assertEqual(list(noff),[0,0,2,4,6,6,9])
+        self.assertEqual(list(numline),[1,1,2,2,3,3,5,5,5])
+        self.assertTrue(numpy.allclose(values,[1000,4000,123.4567,50.,1.e-100,2500.,1.e5,0.5,-3.],rtol=1.e-12,atol=0.))
+        self.assertEqual(check_test._to_float('1D5'),'1E5')
+        self.assertEqual(check_test._to_float('1.-100'),'1.E-100')
+
+    def test_compare_lines(self):
+        '''
+        Test the Line Compare
+
+        Tests that numbers within the tolerance match, that changed numbers,
+        integer ranges and short Fortran numbers are reported, and that
+        one token lines are only skipped when paired.
+        '''
+
+        self.assertEqual(check_test.compare_lines(self.ref,list(self.ref)),([],0))
+        test = list(self.ref)
+        test[2] = 'volume 1.234567999E+02 area 5.0000001D+01'
+        self.assertEqual(check_test.compare_lines(self.ref,test),([],0))
+        test[3] = 'min 1.0-100 max 2.6+003'
+        self.assertEqual(check_test.compare_lines(self.ref,test),([(3,[3],3,[3])],1))
+        self.assertEqual(check_test.compare_lines(test,self.ref,rtol=0.1),([],0))
+        self.assertEqual(check_test.compare_lines(['a b 1D5'],['a b 1D6']),([(0,[0],0,[0])],1))
+        self.assertEqual(check_test.compare_lines(['a b 1D5'],['a b 1.000001D5']),([],0))
+        self.assertEqual(check_test.compare_lines(['elements 1-100'],['elements 1-200'])[1],1)
+        # a pair of one token lines is junk, a one token line without partner is not
+        self.assertEqual(check_test.compare_lines(['a 1','xyz','b 2'],['a 1','abc','b 2']),([],0))
+        blocks,nfail = check_test.compare_lines(['a 1','b 2'],['a 1','abc','b 2'])
+        self.assertEqual((blocks,nfail),([(1,[],1,[1])],1))
+
+    def test_compare_shifted(self):
+        '''
+        Test the Shifted Line Compare
+
+        Tests that an inserted and a removed line are reported alone, and
+        that the lines after them are paired despite changed numbers.
+        '''
+
+        ref = ['step %d value %.6f'%(i,0.1*i) for i in range(200)]
+        test = list(ref)
+        test.insert(50,'warning: extra output 7')
+        del test[151]
+        test[100] = 'step 99 value 9.900000001'
+        blocks,nfail = check_test.compare_lines(ref,test)
+        self.assertEqual(nfail,2)
+        self.assertEqual(blocks,[(50,[],50,[50]),(150,[150],151,[])])
+        test[120] = 'step 119 value 12.5'
+        blocks,nfail = check_test.compare_lines(ref,test)
+        self.assertEqual(nfail,3)
+        self.assertIn((119,[119],120,[120]),blocks)
+
+    def test_read_tolerance(self):
+        '''
+        Test the Tolerance Overrides
+
+        Tests the defaults and the overrides of tolerance.json.
+        '''
+
+        self.assertEqual(check_test.read_tolerance(self.tmp),
+                         {'rtol':check_test.RTOL,'atol':check_test.ATOL,'ignore':[]})
+        self.assertEqual(check_test.read_tolerance(self.tmp,rtol=1.e-3)['rtol'],1.e-3)
+        with open(os.path.join(self.tmp,'tolerance.json'),'w') as fh:
+            json.dump({'rtol':1.e-4,'ignore':['elapsed time']},fh)
+        opts = check_test.read_tolerance(self.tmp,atol=1.e-9)
+        self.assertEqual(opts,{'rtol':1.e-4,'atol':1.e-9,'ignore':['elapsed time']})
+
+    def test_check_dir(self):
+        '''
+        Test the Directory Check
+
+        Tests a missing outx3dgen, a passing and a failing directory, and
+        the tolerance and ignore overrides of tolerance.json.
+        '''
+
+        self.assertEqual(check_test.CheckDir(self.tmp),(-1,''))
+        os.mkdir(os.path.join(self.tmp,'reference'))
+        def write(name,lines):
+            with open(os.path.join(self.tmp,name),'w') as fh:
+                fh.write('\n'.join(['header','# comment','']+lines)+'\n')
+        write('reference/outx3dgen',self.ref+['elapsed time 1.5'])
+        test = list(self.ref)
+        test[2] = 'volume 1.2346E+02 area 5.000000D+01'
+        write('outx3dgen',test+['elapsed time 9.5'])
+        nfail,report = check_test.CheckDir(self.tmp)
+        self.assertEqual(nfail,2)
+        self.assertIn('-volume 1.234567E+02 area 5.000000D+01',report)
+        self.assertIn('+volume 1.2346E+02 area 5.000000D+01',report)
+        self.assertIn('Lines Essentially the Same: 4 out of 6',report)
+        with open(os.path.join(self.tmp,'tolerance.json'),'w') as fh:
+            json.dump({'rtol':1.e-4,'ignore':['^elapsed']},fh)
+        nfail,report = check_test.CheckDir(self.tmp)
+        self.assertEqual(nfail,0)
+        self.assertIn('Tolerance: rtol 0.0001 atol 0.001',report)
+
+class TestChanged(unittest.TestCase):
+    '''
+    Test Harness Changed Test
+
+    Represents a test of the change-aware test selection.
+    '''
+
+    def setUp(self):
+        #Sets up a test directory reading files, sources and an executable.
+        self.tmp = tempfile.mkdtemp()
+        self.test = os.path.join(self.tmp,'level01','connect_cube')
+        os.makedirs(os.path.join(self.test,'sub'))
+        os.makedirs(os.path.join(self.tmp,'src'))
+        for f in ['sub/in.inp','a.inp','out_old.inp','mesh.gmv']:
+            with open(os.path.join(self.test,f),'w') as fh: fh.write(f)
+        with open(os.path.join(self.test,'input.lgi'),'w') as fh:
+            fh.write('read/avs/sub/in.inp/mo\n'
+                     'read / avs / a.inp / mo2\n'
+                     'read / avs / out_old.inp / mo3\n'
+                     '# read / avs / mesh.gmv / mo4\n'
+                     'connect\n'
+                     'dump / gmv / mesh.gmv / mo\n'
+                     'finish\n')
+        for f in ['connect.f','dumpgmv.f','refine.f']:
+            self.source(f,'v1')
+        self.other = os.path.join(self.tmp,'level01','refine_cube')
+        os.makedirs(self.other)
+        with open(os.path.join(self.other,'input.lgi'),'w') as fh:
+            fh.write('refine\nfinish\n')
+        self.exe = os.path.join(self.tmp,'lagrit')
+        with open(self.exe,'w') as fh: fh.write('v1')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def source(self,name,text):
+        with open(os.path.join(self.tmp,'src',name),'w') as fh: fh.write(text)
+
+    def test_input_files(self):
+        '''
+        Test the Input Files
+
+        Tests that files read from subdirectories are found, and that
+        written and output files are left out.
+        '''
+
+        self.assertEqual(changed_test.InputFiles(self.test),['a.inp','input.lgi','sub/in.inp'])
+        self.assertEqual(changed_test.Keywords(self.test),['connect','dumpgmv','read'])
+
+    def test_stale(self):
+        '''
+        Test the Stale Tests
+
+        Tests that a test checked with another executable runs again unless
+        the keywords are trusted, and that changed inputs and relevant
+        sources are detected.
+        '''
+
+        name = os.path.join('level01','connect_cube')
+        tests = [name,os.path.join('level01','refine_cube')]
+        src = os.path.join(self.tmp,'src')
+        stale,state,sources = changed_test.Stale(self.tmp,tests,self.exe,{},src)
+        self.assertEqual(list(stale.values()),['never checked']*2)
+        cache = {'tests':dict((t,dict(state[t],passed=True)) for t in tests),
+                 'trees':{state[name]['tree']:sources}}
+        self.assertEqual(changed_test.Stale(self.tmp,tests,self.exe,cache,src)[0],{})
+
+        # a source of another test's command changed with the executable
+        self.source('refine.f','v2')
+        with open(self.exe,'w') as fh: fh.write('v2')
+        stale = changed_test.Stale(self.tmp,tests,self.exe,cache,src)[0]
+        self.assertEqual(list(stale),tests)
+        self.assertEqual(stale[name],'executable changed, no source of its commands changed')
+        stale = changed_test.Stale(self.tmp,tests,self.exe,cache,src,trust_keywords=True)[0]
+        self.assertEqual(list(stale),tests[1:])
+        self.source('refine.f','v1')
+        stale = changed_test.Stale(self.tmp,tests,self.exe,cache,src,trust_keywords=True)[0]
+        self.assertEqual(stale[name],'executable changed without source changes')
+
+        self.source('connect.f','v2')
+        stale = changed_test.Stale(self.tmp,tests,self.exe,cache,src,trust_keywords=True)[0]
+        self.assertEqual(stale[name],'sources changed: connect.f')
+        with open(os.path.join(self.test,'sub','in.inp'),'w') as fh: fh.write('changed')
+        stale = changed_test.Stale(self.tmp,tests,self.exe,cache,src)[0]
+        self.assertEqual(stale[name],'inputs changed')
+
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner(verbosity=2)
+    suite = unittest.TestSuite()
+    suite.addTest(TestReport('test_write_report'))
+    suite.addTest(TestReport('test_write_report_empty'))
+    suite.addTest(TestScaling('test_fit'))
+    suite.addTest(TestScaling('test_write_inputs'))
+    suite.addTest(TestCheck('test_tokenize'))
+    suite.addTest(TestCheck('test_compare_lines'))
+    suite.addTest(TestCheck('test_compare_shifted'))
+    suite.addTest(TestCheck('test_read_tolerance'))
+    suite.addTest(TestCheck('test_check_dir'))
+    suite.addTest(TestChanged('test_input_files'))
+    suite.addTest(TestChanged('test_stale'))
+    runner.run(suite)